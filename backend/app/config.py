@@ -1,4 +1,5 @@
 import os
+import tempfile
 from typing import Literal
 
 from dotenv import load_dotenv
@@ -101,6 +102,86 @@ class Settings(BaseSettings):
             self.DATABASE_URL = f"postgresql://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_HOST}:{self.POSTGRES_PORT}/{self.POSTGRES_DB}"
         return self
 
+    # Embeddings
+    # "voyage" uses Voyage AI (falls back to "local" when VOYAGE_API_KEY is unset).
+    # "local" is the deterministic offline hashing embedder (dev, tests, benchmarks).
+    EMBEDDING_BACKEND: Literal["voyage", "local"] = "voyage"
+    # Voyage accepts up to 128 texts per embed request for voyage-2.
+    EMBEDDING_BATCH_SIZE: int = 128
+    EMBEDDING_MAX_CONCURRENCY: int = 4
+    # A failed embed request is retried this many times (exponential backoff) before the upload fails
+    EMBEDDING_RETRIES: int = 2
+    QUERY_EMBEDDING_CACHE_SIZE: int = 2048
+    QUERY_EMBEDDING_CACHE_TTL: int = 3600  # seconds
+    # Invalidation is per process, so the TTL bounds staleness on other workers
+    KB_MEMBERSHIP_CACHE_TTL: int = 300  # seconds
+
+    # Chunking (app/services/chunker.py): target chunk size and overlap, in estimated tokens
+    CHUNK_TARGET_TOKENS: int = 300
+    CHUNK_OVERLAP_TOKENS: int = 40
+    # Retrieved context packed into the system prompt (app/services/context_packer.py), in estimated tokens
+    CONTEXT_TOKEN_BUDGET: int = 3000
+    # Ingestion: uploads are spooled here and chunks embedded/inserted this many at a time.
+    # Queued jobs need their spooled file until they finish, so this must survive restarts
+    # (it is a volume in docker-compose) and be shared with any separate worker.
+    INGEST_SPOOL_DIR: str = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "spool")
+    INGEST_BATCH_CHUNKS: int = 256
+    # PDFs of at least PDF_PARALLEL_MIN_BYTES are extracted in a process pool, PDF_PAGES_PER_TASK
+    # pages per task (PDF_EXTRACT_PROCESSES = 0 means one process per CPU core)
+    PDF_EXTRACT_PROCESSES: int = 0
+    PDF_PARALLEL_MIN_BYTES: int = 2 * 1024 * 1024
+    PDF_PAGES_PER_TASK: int = 16
+    # Background ingestion workers in the API process (0 = run `python -m app.services.ingestion_jobs` instead)
+    INGEST_WORKERS: int = 1
+    INGEST_POLL_INTERVAL: float = 5.0  # seconds between queue polls when idle
+    INGEST_JOB_STALE_SECONDS: int = 300  # a running job without heartbeat for this long is re-claimed
+    INGEST_HEARTBEAT_SECONDS: float = 30.0  # heartbeat interval of running jobs (well below the stale limit)
+    # Bulk deletes (app/services/purge.py) remove at most this many chunks per transaction
+    PURGE_BATCH_CHUNKS: int = 5000
+    # KB export/import archives (app/services/kb_archive.py): chunks per block
+    KB_ARCHIVE_BLOCK_CHUNKS: int = 4096
+    # maintenance_work_mem for HNSW builds; builds that spill out of it are many times slower
+    INDEX_BUILD_MAINTENANCE_WORK_MEM: str = "1GB"
+
+    # Hybrid retrieval: fuse Postgres full-text search with the vector search (RRF)
+    HYBRID_SEARCH: bool = False
+    # Retrieval planner: users whose KBs hold at most this many chunks get an exact scan,
+    # larger candidate sets use HNSW with ef_search >= HNSW_EF_SEARCH
+    EXACT_SEARCH_MAX_CHUNKS: int = 5000
+    HNSW_EF_SEARCH: int = 100
+    # KBs with at least this many chunks get their own partial HNSW index
+    KB_HNSW_INDEX_MIN_CHUNKS: int = 10000
+    # ANN search over a quantized copy of the embeddings ("halfvec": 2x smaller index,
+    # "binary": 32x), re-scored with full-precision vectors. Needs pgvector >= 0.7 and
+    # scripts/migrate_quantized_embeddings.py run for the chosen mode.
+    EMBEDDING_QUANTIZATION: Literal["none", "halfvec", "binary"] = "none"
+    # ANN shortlist = limit * oversample, re-ranked exactly (binary usually needs 8+)
+    QUANTIZED_SEARCH_OVERSAMPLE: int = 4
+    # In-process vector index: memory-mapped float16 snapshots of small KBs,
+    # searched with exact NumPy matmul; only the top-k hits are read from the database
+    VECTOR_INDEX_ENABLED: bool = False
+    VECTOR_INDEX_DIR: str = os.path.join(tempfile.gettempdir(), "vaultmind_vector_index")
+    VECTOR_INDEX_MAX_CHUNKS: int = 20000
+    # float16 halves page-cache use; float32 skips the per-query up-conversion (faster on CPUs without F16C)
+    VECTOR_INDEX_DTYPE: Literal["float16", "float32"] = "float16"
+    # Semantic answer cache: reuse the final answer of a near-duplicate question
+    # (cosine >= threshold) asked by a user with the same KB set
+    ANSWER_CACHE_ENABLED: bool = False
+    ANSWER_CACHE_THRESHOLD: float = 0.95
+    ANSWER_CACHE_SIZE: int = 256  # entries per KB set
+    ANSWER_CACHE_TTL: int = 3600  # seconds
+    # Reranking: weight of the BM25 score vs. vector similarity (0 = vector order only)
+    RERANK_LEXICAL_WEIGHT: float = 0.3
+    # Context selection (rag.select_context): candidates farther than RETRIEVAL_MAX_DISTANCE (cosine
+    # distance; None = the embedding model's default, see rag.DEFAULT_MAX_DISTANCE) or more than
+    # RETRIEVAL_RELATIVE_GAP beyond the best hit are dropped before reranking
+    RETRIEVAL_MAX_DISTANCE: float | None = None
+    RETRIEVAL_RELATIVE_GAP: float = 0.15
+    # MMR: relevance vs. diversity trade-off (1 = relevance only), and the cosine similarity
+    # above which a candidate counts as a near-copy of an already selected chunk
+    MMR_LAMBDA: float = 0.7
+    MMR_DUPLICATE_SIMILARITY: float = 0.95
+
     # Flags
     USE_MOCK_LLM: bool = False
 
@@ -73,8 +73,10 @@ CREATE TABLE IF NOT EXISTS knowledge_bases (
     name TEXT UNIQUE NOT NULL,
     description TEXT,
     is_default BOOLEAN DEFAULT FALSE,
+    content_version BIGINT NOT NULL DEFAULT 0, -- bumped when documents change; older cached answers are stale
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
+ALTER TABLE knowledge_bases ADD COLUMN IF NOT EXISTS content_version BIGINT NOT NULL DEFAULT 0;
 
 -- Table: user_knowledge_base_links (Many-to-Many)
 CREATE TABLE IF NOT EXISTS user_knowledge_base_links (
@@ -143,12 +145,17 @@ END $$;
 CREATE TABLE IF NOT EXISTS document_chunks (
     id SERIAL PRIMARY KEY,
     document_id INTEGER NOT NULL,
+    knowledge_base_id INTEGER, -- Denormalized from documents for join-free filtered vector search
     content TEXT,
     embedding vector(1024),
     chunk_index INTEGER,
     metadata JSONB DEFAULT '{}',
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    CONSTRAINT fk_chunks_document FOREIGN KEY (document_id) REFERENCES documents(id) ON DELETE CASCADE
+    -- Full-text search vector for hybrid (lexical + vector) retrieval.
+    -- 'simple' config: no stemming/stopwords, works for Spanish and English and keeps codes intact.
+    content_tsv tsvector GENERATED ALWAYS AS (to_tsvector('simple', coalesce(content, ''))) STORED,
+    CONSTRAINT fk_chunks_document FOREIGN KEY (document_id) REFERENCES documents(id) ON DELETE CASCADE,
+    CONSTRAINT fk_chunks_kb FOREIGN KEY (knowledge_base_id) REFERENCES knowledge_bases(id) ON DELETE SET NULL
 );
 
 -- Idempotency for document_chunks
@@ -160,8 +167,89 @@ BEGIN
     IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='document_chunks' AND column_name='metadata') THEN
         ALTER TABLE document_chunks ADD COLUMN metadata JSONB DEFAULT '{}';
     END IF;
+    -- Note: adding a stored generated column rewrites the table once on existing databases.
+    IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='document_chunks' AND column_name='content_tsv') THEN
+        ALTER TABLE document_chunks ADD COLUMN content_tsv tsvector
+            GENERATED ALWAYS AS (to_tsvector('simple', coalesce(content, ''))) STORED;
+    END IF;
+    IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='document_chunks' AND column_name='knowledge_base_id') THEN
+        ALTER TABLE document_chunks ADD COLUMN knowledge_base_id INTEGER REFERENCES knowledge_bases(id) ON DELETE SET NULL;
+        -- One-time backfill from the parent documents
+        UPDATE document_chunks c SET knowledge_base_id = d.knowledge_base_id
+        FROM documents d WHERE c.document_id = d.id;
+    END IF;
 END $$;
 
+-- Keep document_chunks.knowledge_base_id in sync when a document moves between KBs
+CREATE OR REPLACE FUNCTION sync_chunk_knowledge_base() RETURNS trigger AS $$
+BEGIN
+    UPDATE document_chunks SET knowledge_base_id = NEW.knowledge_base_id WHERE document_id = NEW.id;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_documents_kb_sync ON documents;
+CREATE TRIGGER trg_documents_kb_sync
+AFTER UPDATE OF knowledge_base_id ON documents
+FOR EACH ROW WHEN (OLD.knowledge_base_id IS DISTINCT FROM NEW.knowledge_base_id)
+EXECUTE FUNCTION sync_chunk_knowledge_base();
+
+-- Quantized copies of the embedding (EMBEDDING_QUANTIZATION): halfvec (2x smaller) and
+-- binary (32x smaller) for the ANN index, re-scored with the full vector at query time.
+-- Needs pgvector >= 0.7. The columns stay NULL (and cost nothing) until a quantized mode is
+-- enabled: backend/scripts/migrate_quantized_embeddings.py backfills them and builds their
+-- HNSW index, and the trigger that fills them on insert is only installed in quantized modes
+-- (app/services/kb_indexes.py, sync_quantization_mode).
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_type WHERE typname = 'halfvec') THEN
+        ALTER TABLE document_chunks ADD COLUMN IF NOT EXISTS embedding_half halfvec(1024);
+        ALTER TABLE document_chunks ADD COLUMN IF NOT EXISTS embedding_bin bit(1024);
+    END IF;
+END $$;
+
+-- Table: chunk_embeddings (Content-addressed embedding store)
+-- Keyed by sha256 of the embedded text + model, so re-uploaded or revised
+-- documents only pay for embedding chunks whose text actually changed.
+CREATE TABLE IF NOT EXISTS chunk_embeddings (
+    content_hash CHAR(64) NOT NULL,
+    model TEXT NOT NULL,
+    embedding vector(1024) NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (content_hash, model)
+);
+
+-- Table: ingestion_jobs (Background document ingestion)
+-- Uploads are spooled to disk and ingested by a worker; chunks_done is committed together
+-- with each batch of chunks, so an interrupted job resumes after the last committed chunk.
+CREATE TABLE IF NOT EXISTS ingestion_jobs (
+    id SERIAL PRIMARY KEY,
+    document_id INTEGER NOT NULL,
+    user_id INTEGER,
+    filename TEXT NOT NULL,
+    file_path TEXT NOT NULL,
+    is_pdf BOOLEAN DEFAULT FALSE,
+    replace BOOLEAN DEFAULT FALSE, -- new version of an existing document, re-ingested by chunk diff
+    status VARCHAR(20) NOT NULL DEFAULT 'queued', -- queued, running, done, failed
+    attempts INTEGER NOT NULL DEFAULT 0, -- incremented per claim; progress writes require the current attempt
+    chunks_done INTEGER NOT NULL DEFAULT 0,
+    pages_done INTEGER NOT NULL DEFAULT 0,
+    pages_total INTEGER,
+    error TEXT,
+    diff JSONB, -- replace jobs: kept/moved/inserted/deleted chunk counts
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP,
+    heartbeat_at TIMESTAMP,
+    finished_at TIMESTAMP,
+    CONSTRAINT fk_ingestion_jobs_document FOREIGN KEY (document_id) REFERENCES documents(id) ON DELETE CASCADE,
+    CONSTRAINT fk_ingestion_jobs_user FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE SET NULL
+);
+
+CREATE INDEX IF NOT EXISTS ix_ingestion_jobs_status ON ingestion_jobs(status);
+ALTER TABLE ingestion_jobs ADD COLUMN IF NOT EXISTS replace BOOLEAN DEFAULT FALSE;
+ALTER TABLE ingestion_jobs ADD COLUMN IF NOT EXISTS diff JSONB;
+ALTER TABLE ingestion_jobs ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0;
+
 -- =============================================================================
 -- 3. CHAT MODULE (HISTORY)
 -- =============================================================================
@@ -221,15 +309,22 @@ CREATE INDEX IF NOT EXISTS idx_documents_folder_id ON documents(folder_id);
 CREATE INDEX IF NOT EXISTS idx_documents_user_id ON documents(user_id);
 CREATE INDEX IF NOT EXISTS idx_documents_kb_id ON documents(knowledge_base_id);
 CREATE INDEX IF NOT EXISTS idx_chunks_document_id ON document_chunks(document_id);
+CREATE INDEX IF NOT EXISTS idx_chunks_kb_id ON document_chunks(knowledge_base_id);
 CREATE INDEX IF NOT EXISTS idx_sessions_user_id ON chat_sessions(user_id);
 CREATE INDEX IF NOT EXISTS idx_messages_session_id ON chat_messages(session_id);
 CREATE INDEX IF NOT EXISTS idx_knowledge_bases_name ON knowledge_bases(name);
 
--- HNSW Index for Vector Similarity Search (using Cosine Distance)
--- Note: existing data might delay this index creation, but it works on empty or populated tables.
-CREATE INDEX IF NOT EXISTS idx_chunks_embedding_hnsw 
-ON document_chunks 
-USING hnsw (embedding vector_cosine_ops);
+-- HNSW Index for Vector Similarity Search: not created here (this script runs on every startup,
+-- and a non-concurrent build locks document_chunks). The index of the configured
+-- EMBEDDING_QUANTIZATION mode is built CONCURRENTLY by app/services/kb_indexes.py (full precision)
+-- or scripts/migrate_quantized_embeddings.py (halfvec/binary, which can drop the full-precision one).
+-- Large KBs additionally get a partial HNSW index (WHERE knowledge_base_id = <id>), also managed by
+-- kb_indexes.py; small KBs are served exactly via idx_chunks_kb_id.
+
+-- GIN Index for Full-Text Search (hybrid retrieval)
+CREATE INDEX IF NOT EXISTS idx_chunks_content_tsv
+ON document_chunks
+USING gin (content_tsv);
 
 -- =============================================================================
 -- 5. ANALYTICS & LOGGING MODULE
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 from datetime import datetime
 
@@ -17,12 +18,16 @@ from app.auth import get_current_user, get_password_hash
 from app.config import settings
 from app.database import engine, get_session, init_db
 from app.limiter import limiter
-from app.models import ChatMessage, ChatSession, Document, DocumentChunk, ErrorLog, User
+from app.models import ChatMessage, ChatSession, Document, ErrorLog, User
 from app.routers.admin import router as admin_router
 from app.routers.auth import router as auth_router
 from app.routers.chat import router as chat_router
 from app.routers.stats import router as stats_router
-from app.services.rag import get_embedding, rag_pipeline
+from app.services import ingestion_jobs, kb_indexes, vector_index
+from app.services.answer_cache import answer_cache, is_cacheable, kb_versions
+from app.services.chunk_writer import copy_chunks
+from app.services.chunker import chunk_text
+from app.services.rag import EmbeddingError, aget_query_embedding, aget_user_kb_ids, arag_pipeline, embed_chunks
 
 
 # --- Pydantic Schemas for Request/Response ---
@@ -62,8 +67,19 @@ async def lifespan(app: FastAPI):
             session.add(user)
             session.commit()
 
+    # Quantization trigger and global HNSW index of the configured EMBEDDING_QUANTIZATION mode
+    kb_indexes.sync_quantization_mode()
+
+    # Snapshot small KBs for the in-process vector index (no-op unless enabled)
+    vector_index.refresh_all()
+
+    # Background ingestion workers (uploads are queued as jobs)
+    ingestion_workers = ingestion_jobs.WorkerPool(settings.INGEST_WORKERS)
+    ingestion_workers.start()
+
     yield
     # Shutdown
+    await ingestion_workers.stop()
 
 
 app = FastAPI(title="Banking RAG API", lifespan=lifespan)
@@ -173,7 +189,26 @@ async def chat_endpoint(
         try:
             # 1. RAG Retrieve
             yield json.dumps({"type": "status", "content": "Retrieving context..."}) + "\n"
-            context_chunks = rag_pipeline(session, chat_request.query, user.id)
+
+            # Semantic answer cache: only for standalone questions (a follow-up depends on its session history)
+            cached = None
+            use_answer_cache = settings.ANSWER_CACHE_ENABLED and not chat_request.session_id
+            if use_answer_cache:
+                kb_ids = await aget_user_kb_ids(user.id)
+                # Read before retrieval, so an answer built from since-changed documents is not stored
+                versions = await asyncio.to_thread(kb_versions, kb_ids)
+                try:
+                    query_embedding = await aget_query_embedding(chat_request.query)
+                    cached = answer_cache.lookup(query_embedding, kb_ids, versions)
+                except EmbeddingError:
+                    use_answer_cache = False
+
+            if cached:
+                retrieval_stats = {"plan": "answer_cache", "similarity": cached["similarity"]}
+                context_chunks = []
+            else:
+                retrieval_stats = {}
+                context_chunks = await arag_pipeline(chat_request.query, user.id, stats=retrieval_stats)
 
             # 2. Get/Create ChatSession
             chat_session = None
@@ -209,14 +244,24 @@ async def chat_endpoint(
 
             final_result_payload = None
 
-            async for event in generate_response_stream(chat_request.query, context_chunks, history, user_id=user.id):
-                if event["type"] == "status":
-                    yield json.dumps(event) + "\n"
-                elif event["type"] == "answer" or event["type"] == "result":
-                    final_result_payload = event
-                elif event["type"] == "error":
-                    yield json.dumps(event) + "\n"
-                    return
+            if cached:
+                yield json.dumps({"type": "status", "content": "Answered from cache"}) + "\n"
+                final_result_payload = {
+                    "response": cached["response"],
+                    "sources": cached["sources"],
+                    "reasoning_data": {"steps": [], "cached": True},
+                }
+            else:
+                async for event in generate_response_stream(
+                    chat_request.query, context_chunks, history, user_id=user.id
+                ):
+                    if event["type"] in ("status", "delta", "delta_reset"):
+                        yield json.dumps(event) + "\n"
+                    elif event["type"] == "answer" or event["type"] == "result":
+                        final_result_payload = event
+                    elif event["type"] == "error":
+                        yield json.dumps(event) + "\n"
+                        return
 
             if not final_result_payload:
                 yield json.dumps({"type": "error", "content": "No response generated"}) + "\n"
@@ -224,19 +269,33 @@ async def chat_endpoint(
 
             response_text = final_result_payload["response"]
             reasoning_data = final_result_payload["reasoning_data"]
+            # Retrieval plan (exact / hnsw / in_process) and latency, for debugging slow turns
+            reasoning_data["retrieval"] = retrieval_stats
             sources = final_result_payload["sources"]
 
             # Extract sources for storage
-            used_sources_meta = []
+            used_sources_meta = cached["used_sources"] if cached else []
+            packed = reasoning_data.get("context")
             if context_chunks:
-                for chunk in context_chunks:
+                # Only the chunks that made it into the token-budgeted prompt
+                packed_ids = set(packed["chunk_ids"]) if packed else {c.chunk_id for c in context_chunks}
+                for chunk in (c for c in context_chunks if c.chunk_id in packed_ids):
                     meta = {
                         "doc_id": chunk.document_id,
-                        "filename": chunk.document.title if chunk.document else "unknown",
-                        "chunk_id": chunk.id,
+                        "filename": chunk.title,
+                        "chunk_id": chunk.chunk_id,
                     }
                     used_sources_meta.append(meta)
 
+            # Answers that relied on web search (or failed) are never reused
+            if use_answer_cache and not cached and is_cacheable(final_result_payload):
+                answer_cache.store(
+                    query_embedding,
+                    kb_ids,
+                    {"response": response_text, "sources": sources, "used_sources": used_sources_meta},
+                    versions,
+                )
+
             # 4. Save History
             # User message
             user_msg = ChatMessage(session_id=chat_session.id, role="user", content=chat_request.query)
@@ -262,6 +321,7 @@ async def chat_endpoint(
                         "sources": sources,
                         "session_id": chat_session.id,
                         "reasoning_data": reasoning_data,
+                        "cached": bool(cached),
                     }
                 )
                 + "\n"
@@ -293,7 +353,8 @@ async def chat_endpoint(
 
             yield json.dumps({"type": "error", "content": error_msg}) + "\n"
 
-    return StreamingResponse(event_generator(), media_type="application/x-ndjson")
+    # No proxy buffering, so answer deltas reach the client as they are generated
+    return StreamingResponse(event_generator(), media_type="application/x-ndjson", headers={"X-Accel-Buffering": "no"})
 
 
 @app.post("/upload")
@@ -307,27 +368,31 @@ def upload_document(
     """
     Upload and vectorize a document.
     """
-    # 1. Create Document
+    # 1. Chunk & Embed (same token-aware chunking as KB ingestion); nothing is stored if embedding fails
+    chunks = chunk_text(content)
+    try:
+        embeddings = embed_chunks(session, [chunk.text for chunk in chunks])
+    except EmbeddingError as e:
+        raise HTTPException(status_code=503, detail="Embedding service unavailable, please retry") from e
+
+    # 2. Create Document and its chunks (COPY writer), in one transaction
     doc = Document(title=title, user_id=user.id, folder_id=folder_id, type="text", path_url="uploaded_content")
     session.add(doc)
-    session.commit()
-    session.refresh(doc)
-
-    # 2. Chunk & Embed (Mock chunking for MVP)
-    # In real app: split text by tokens/paragraphs
-
-    # Mock embedding generator (must match 1536 dim)
-    # Using first 500 chars to represent chunk
-    embedding = get_embedding(content[:500])
-
-    chunk = DocumentChunk(
-        document_id=doc.id,
-        content=content,
-        embedding=embedding,
-        chunk_index=0,
-        chunk_metadata={"author": "user_upload"},
+    session.flush()
+    copy_chunks(
+        session,
+        [
+            {
+                "document_id": doc.id,
+                "knowledge_base_id": doc.knowledge_base_id,
+                "content": chunk.text,
+                "embedding": embedding,
+                "chunk_index": i,
+                "chunk_metadata": {"author": "user_upload", "tokens": chunk.tokens},
+            }
+            for i, (chunk, embedding) in enumerate(zip(chunks, embeddings, strict=True))
+        ],
     )
-    session.add(chunk)
     session.commit()
 
-    return {"status": "success", "doc_id": doc.id}
+    return {"status": "success", "doc_id": doc.id, "chunks_created": len(chunks)}
@@ -20,6 +20,8 @@ class KnowledgeBase(SQLModel, table=True):
     name: str = Field(unique=True)
     description: str | None = None
     is_default: bool = Field(default=False)
+    # Bumped whenever its documents change; answer cache entries of an older version are stale
+    content_version: int = Field(default=0)
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
     users: list["User"] = Relationship(back_populates="knowledge_bases", link_model=UserKnowledgeBaseLink)
@@ -84,6 +86,8 @@ class DocumentChunk(SQLModel, table=True):
     __tablename__ = "document_chunks"
     id: int | None = Field(default=None, primary_key=True)
     document_id: int = Field(foreign_key="documents.id")
+    # Denormalized from Document so filtered vector search needs no join
+    knowledge_base_id: int | None = Field(default=None, foreign_key="knowledge_bases.id")
     content: str
     # Vector Column: Dimension 1024 for Voyage AI models (voyage-2, etc)
     embedding: list[float] = Field(sa_column=Column(Vector(1024)))
@@ -94,6 +98,42 @@ class DocumentChunk(SQLModel, table=True):
     document: Document = Relationship(back_populates="chunks")
 
 
+class ChunkEmbedding(SQLModel, table=True):
+    """Content-addressed embedding store: identical chunk text is only embedded once per model."""
+
+    __tablename__ = "chunk_embeddings"
+    content_hash: str = Field(primary_key=True)  # sha256 hex of the embedded text
+    model: str = Field(primary_key=True)
+    embedding: list[float] = Field(sa_column=Column(Vector(1024)))
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class IngestionJob(SQLModel, table=True):
+    """Background ingestion of one uploaded file into a Document (see app/services/ingestion_jobs.py)."""
+
+    __tablename__ = "ingestion_jobs"
+    id: int | None = Field(default=None, primary_key=True)
+    document_id: int = Field(foreign_key="documents.id")
+    user_id: int | None = Field(default=None, foreign_key="users.id")
+    filename: str
+    file_path: str  # spooled upload, deleted once the job is done
+    is_pdf: bool = Field(default=False)
+    replace: bool = Field(default=False)  # new version of an existing document, re-ingested by chunk diff
+    status: str = Field(default="queued", index=True)  # queued, running, done, failed
+    attempts: int = Field(default=0)  # incremented on every claim; progress is only written by the current one
+    chunks_done: int = Field(default=0)  # committed chunks; a resumed job skips these
+    pages_done: int = Field(default=0)
+    pages_total: int | None = None  # PDFs only
+    error: str | None = Field(default=None, sa_column=Column(Text))
+    diff: dict[str, int] | None = Field(
+        default=None, sa_column=Column(JSON)
+    )  # replace jobs: kept/moved/inserted/deleted
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    started_at: datetime | None = None
+    heartbeat_at: datetime | None = None  # a running job with a stale heartbeat is re-claimed
+    finished_at: datetime | None = None
+
+
 # --- Chat (History) ---
 class ChatSession(SQLModel, table=True):
     __tablename__ = "chat_sessions"
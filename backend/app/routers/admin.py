@@ -1,22 +1,34 @@
 import logging
+import os
+import tarfile
 
-from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile
+from fastapi import APIRouter, BackgroundTasks, Depends, File, Form, HTTPException, UploadFile
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from sqlalchemy import delete
 from sqlmodel import Session, select
 
 from app.auth import get_current_user
 from app.database import get_session
 from app.models import (
     Document,
-    DocumentChunk,
     ErrorLog,
+    IngestionJob,
     KnowledgeBase,
     TokenUsage,
     User,
     UserKnowledgeBaseLink,
     UserLog,
 )
-from app.services.rag import get_embedding
+from app.services import ingestion_jobs, kb_archive, kb_indexes, purge, vector_index
+from app.services.answer_cache import answer_cache, invalidate_kb_answers
+from app.services.ingestion import spool_upload
+from app.services.rag import (
+    invalidate_kb_chunk_counts,
+    invalidate_user_kbs,
+    kb_membership_cache,
+    query_embedding_cache,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -121,6 +133,7 @@ def update_user_kbs(
         session.add(link)
 
     session.commit()
+    invalidate_user_kbs(user_id)
     return {"status": "updated"}
 
 
@@ -178,83 +191,180 @@ def toggle_kb_default(kb_id: int, session: Session = Depends(get_session), admin
     session.add(kb)
     session.commit()
     session.refresh(kb)
+    invalidate_user_kbs()
     return {"id": kb.id, "name": kb.name, "is_default": kb.is_default}
 
 
+@router.get("/knowledge_bases/{kb_id}/export")
+def export_kb(
+    kb_id: int,
+    dtype: str = "float16",
+    session: Session = Depends(get_session),
+    admin: User = Depends(get_admin_user),
+):
+    """Download a KB (documents, chunks and embeddings) as a portable archive; see app/services/kb_archive.py."""
+    kb = session.get(KnowledgeBase, kb_id)
+    if not kb:
+        raise HTTPException(status_code=404, detail="Knowledge Base not found")
+    if dtype not in kb_archive.DTYPES:
+        raise HTTPException(status_code=400, detail=f"dtype must be one of {kb_archive.DTYPES}")
+    return StreamingResponse(
+        kb_archive.export_kb(kb_id, dtype),
+        media_type="application/x-tar",
+        headers={"Content-Disposition": f'attachment; filename="kb-{kb_id}.tar"'},
+    )
+
+
+def _import_kb_archive(path: str, kb_id: int, user_id: int, defer_global_index: bool) -> None:
+    try:
+        kb_archive.import_kb(path, kb_id, user_id, defer_global_index)
+    except Exception as e:
+        logger.error(f"KB import into {kb_id} failed: {e}")
+    finally:
+        os.remove(path)
+
+
+@router.post("/knowledge_bases/import", status_code=202)
+async def import_kb(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    name: str | None = Form(None),
+    defer_global_index: bool = Form(False),
+    session: Session = Depends(get_session),
+    admin: User = Depends(check_demo_mode_mutation),
+):
+    """
+    Create a KB from an exported archive without re-embedding. The archive is
+    loaded in the background; assign users once its documents are listed.
+    """
+    path = await spool_upload(file)
+    try:
+        manifest = kb_archive.read_manifest(path)
+        kb_name = name or manifest["knowledge_base"]["name"]
+        if session.exec(select(KnowledgeBase.id).where(KnowledgeBase.name == kb_name)).first() is not None:
+            raise HTTPException(status_code=409, detail=f"A Knowledge Base named '{kb_name}' already exists")
+        kb = KnowledgeBase(name=kb_name, description=manifest["knowledge_base"].get("description"))
+        session.add(kb)
+        session.commit()
+        session.refresh(kb)
+    except (kb_archive.ArchiveError, tarfile.TarError, KeyError) as e:
+        os.remove(path)
+        raise HTTPException(status_code=400, detail=f"Invalid archive: {e}") from e
+    except Exception:
+        os.remove(path)
+        raise
+    background_tasks.add_task(_import_kb_archive, path, kb.id, admin.id, defer_global_index)
+    return {"status": "importing", "kb_id": kb.id, "name": kb.name, "documents": manifest.get("documents")}
+
+
 # --- Document Management (Admin) ---
-@router.post("/documents/upload")
+@router.post("/documents/upload", status_code=202)
 async def upload_document_to_kb(
     file: UploadFile = File(...),
     knowledge_base_id: int = Form(...),
     session: Session = Depends(get_session),
     admin: User = Depends(check_demo_mode_mutation),
 ):
-    file_bytes = await file.read()
+    """
+    Spool the upload to disk and queue it for background ingestion.
+    Returns the job id immediately; poll /admin/ingestion/jobs/{job_id} for progress.
+    """
     filename = file.filename or "document"
+    is_pdf = filename.lower().endswith(".pdf")
 
-    # Extract text based on file type
-    if filename.lower().endswith(".pdf"):
-        # Handle PDF files
-        try:
-            import io
-
-            from PyPDF2 import PdfReader
-
-            pdf_reader = PdfReader(io.BytesIO(file_bytes))
-            content = ""
-            for page in pdf_reader.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    content += page_text + "\n"
-            if not content.strip():
-                raise HTTPException(
-                    status_code=400, detail="Could not extract text from PDF. The PDF might be scanned/image-based."
-                )
-        except ImportError:
-            raise HTTPException(status_code=500, detail="PDF processing library not installed")
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Error processing PDF: {str(e)}")
-    else:
-        # Handle text files (txt, md, etc.)
-        try:
-            content = file_bytes.decode("utf-8")
-        except UnicodeDecodeError:
-            try:
-                content = file_bytes.decode("latin-1")
-            except Exception:
-                raise HTTPException(status_code=400, detail="Could not decode file. Please upload a text or PDF file.")
-
-    # Create Doc
-    doc = Document(
-        title=filename,
-        user_id=admin.id,
-        knowledge_base_id=knowledge_base_id,
-        type="pdf" if filename.lower().endswith(".pdf") else "text",
-        path_url="uploaded_content",
-    )
-    session.add(doc)
-    session.commit()
-    session.refresh(doc)
-
-    # Chunk & Embed (500 char chunks)
-    chunk_size = 500
-    chunks = [content[i : i + chunk_size] for i in range(0, len(content), chunk_size)]
-
-    for i, chunk_text in enumerate(chunks):
-        if not chunk_text.strip():
-            continue
-        embedding = get_embedding(chunk_text[:1000])
-        chunk = DocumentChunk(
-            document_id=doc.id,
-            content=chunk_text,
-            embedding=embedding,
-            chunk_index=i,
-            chunk_metadata={"filename": filename},
+    path = await spool_upload(file)
+    try:
+        doc = Document(
+            title=filename,
+            user_id=admin.id,
+            knowledge_base_id=knowledge_base_id,
+            type="pdf" if is_pdf else "text",
+            path_url="uploaded_content",
+        )
+        session.add(doc)
+        session.flush()  # assigns doc.id; committed together with the job
+        job = ingestion_jobs.enqueue(session, doc, path, is_pdf, admin.id)
+    except Exception:
+        os.remove(path)
+        raise
+    return {"status": "queued", "doc_id": doc.id, "job_id": job.id}
+
+
+@router.put("/documents/{doc_id}", status_code=202)
+async def replace_document(
+    doc_id: int,
+    file: UploadFile = File(...),
+    session: Session = Depends(get_session),
+    admin: User = Depends(check_demo_mode_mutation),
+):
+    """
+    Queue a new version of a document. Only changed chunks are embedded and
+    inserted; unchanged chunks keep their ids (and references in chat history).
+    """
+    doc = session.get(Document, doc_id)
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+    active = session.exec(
+        select(IngestionJob.id).where(
+            IngestionJob.document_id == doc_id, IngestionJob.status.in_(["queued", "running"])
         )
-        session.add(chunk)
+    ).first()
+    if active is not None:
+        raise HTTPException(status_code=409, detail=f"Document is still being ingested (job {active})")
 
+    filename = file.filename or doc.title
+    is_pdf = filename.lower().endswith(".pdf")
+
+    path = await spool_upload(file)
+    try:
+        job = ingestion_jobs.enqueue(session, doc, path, is_pdf, admin.id, replace=True, filename=filename)
+    except Exception:
+        os.remove(path)
+        raise
+    return {"status": "queued", "doc_id": doc.id, "job_id": job.id}
+
+
+# --- Ingestion Jobs ---
+@router.get("/ingestion/jobs")
+def list_ingestion_jobs(
+    status: str | None = None,
+    limit: int = 50,
+    session: Session = Depends(get_session),
+    admin: User = Depends(get_admin_user),
+):
+    query = select(IngestionJob).order_by(IngestionJob.id.desc()).limit(min(limit, 500))
+    if status:
+        query = query.where(IngestionJob.status == status)
+    return [ingestion_jobs.job_status(job) for job in session.exec(query).all()]
+
+
+@router.get("/ingestion/jobs/{job_id}")
+def get_ingestion_job(job_id: int, session: Session = Depends(get_session), admin: User = Depends(get_admin_user)):
+    job = session.get(IngestionJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Ingestion job not found")
+    return ingestion_jobs.job_status(job)
+
+
+@router.post("/ingestion/jobs/{job_id}/retry")
+def retry_ingestion_job(
+    job_id: int, session: Session = Depends(get_session), admin: User = Depends(check_demo_mode_mutation)
+):
+    """Re-queue a failed job; it resumes after its last committed chunk."""
+    job = session.get(IngestionJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Ingestion job not found")
+    if job.status != "failed":
+        raise HTTPException(status_code=400, detail=f"Only failed jobs can be retried (job is {job.status})")
+    if not os.path.exists(job.file_path):
+        raise HTTPException(status_code=410, detail="The uploaded file is no longer available; upload it again")
+    job.status = "queued"
+    job.error = None
+    job.finished_at = None
+    session.add(job)
     session.commit()
-    return {"status": "success", "doc_id": doc.id, "chunks_created": len(chunks)}
+    ingestion_jobs.notify()
+    return ingestion_jobs.job_status(job)
 
 
 @router.get("/knowledge_bases/{kb_id}/documents")
@@ -265,25 +375,95 @@ def list_kb_documents(kb_id: int, session: Session = Depends(get_session), admin
 
 @router.delete("/documents/{doc_id}")
 def delete_document(
-    doc_id: int, session: Session = Depends(get_session), admin: User = Depends(check_demo_mode_mutation)
+    doc_id: int,
+    background_tasks: BackgroundTasks,
+    session: Session = Depends(get_session),
+    admin: User = Depends(check_demo_mode_mutation),
 ):
-    """Delete a document and all its associated chunks."""
+    """Delete a document; its chunks go with it via ON DELETE CASCADE (never loaded into Python)."""
     doc = session.get(Document, doc_id)
     if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
 
-    # Delete all chunks associated with this document first
-    chunks = session.exec(select(DocumentChunk).where(DocumentChunk.document_id == doc_id)).all()
-    for chunk in chunks:
-        session.delete(chunk)
-
-    # Delete the document
-    session.delete(doc)
+    kb_id = doc.knowledge_base_id
+    purge.delete_document_rows(session, [doc_id])
     session.commit()
+    invalidate_kb_chunk_counts(kb_id)
+    invalidate_kb_answers(kb_id)
+    background_tasks.add_task(vector_index.refresh_kb, kb_id)
+    background_tasks.add_task(kb_indexes.sync_kb_hnsw_index, kb_id)
 
     return {"status": "deleted", "doc_id": doc_id}
 
 
+class PurgeDocumentsRequest(BaseModel):
+    document_ids: list[int]
+
+
+@router.post("/documents/purge", status_code=202)
+def purge_documents(
+    request: PurgeDocumentsRequest,
+    background_tasks: BackgroundTasks,
+    admin: User = Depends(check_demo_mode_mutation),
+):
+    """Delete many documents in the background, in batches of PURGE_BATCH_CHUNKS chunks."""
+    doc_ids = list(dict.fromkeys(request.document_ids))
+    background_tasks.add_task(purge.purge_documents, doc_ids)
+    return {"status": "purging", "doc_ids": doc_ids}
+
+
+@router.post("/knowledge_bases/{kb_id}/purge", status_code=202)
+def purge_kb_documents(
+    kb_id: int,
+    background_tasks: BackgroundTasks,
+    session: Session = Depends(get_session),
+    admin: User = Depends(check_demo_mode_mutation),
+):
+    """Delete every document of a Knowledge Base in the background, keeping the KB itself."""
+    if not session.get(KnowledgeBase, kb_id):
+        raise HTTPException(status_code=404, detail="Knowledge Base not found")
+    background_tasks.add_task(purge.purge_knowledge_base, kb_id)
+    return {"status": "purging", "kb_id": kb_id}
+
+
+@router.delete("/knowledge_bases/{kb_id}", status_code=202)
+def delete_kb(
+    kb_id: int,
+    background_tasks: BackgroundTasks,
+    session: Session = Depends(get_session),
+    admin: User = Depends(check_demo_mode_mutation),
+):
+    """
+    Delete a Knowledge Base and all its documents. Users are unassigned right
+    away (so it drops out of retrieval); the rows are deleted in the background.
+    """
+    kb = session.get(KnowledgeBase, kb_id)
+    if not kb:
+        raise HTTPException(status_code=404, detail="Knowledge Base not found")
+    session.execute(
+        delete(UserKnowledgeBaseLink)
+        .where(UserKnowledgeBaseLink.knowledge_base_id == kb_id)
+        .execution_options(synchronize_session=False)
+    )
+    kb.is_default = False
+    session.add(kb)
+    session.commit()
+    invalidate_user_kbs()
+    background_tasks.add_task(purge.purge_knowledge_base, kb_id, True)
+    return {"status": "deleting", "kb_id": kb_id}
+
+
+# --- Caches ---
+@router.get("/cache/stats")
+def get_cache_stats(admin: User = Depends(get_admin_user)):
+    """Hit/miss counters for the in-process retrieval and answer caches (per worker process)."""
+    return {
+        "query_embeddings": query_embedding_cache.stats(),
+        "kb_membership": kb_membership_cache.stats(),
+        "answers": answer_cache.stats(),
+    }
+
+
 # --- System Logs ---
 
 
@@ -28,6 +28,7 @@ from app.models import KnowledgeBase, User, UserKnowledgeBaseLink, UserLog
 
 # Email service
 from app.services.email import send_reset_email, send_verification_email
+from app.services.rag import invalidate_user_kbs
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
@@ -116,6 +117,7 @@ async def register(
             link = UserKnowledgeBaseLink(user_id=new_user.id, knowledge_base_id=kb.id)
             session.add(link)
         session.commit()
+        invalidate_user_kbs(new_user.id)
 
         # Send verification email in background
         background_tasks.add_task(send_verification_email, new_user.email, verification_code)
@@ -0,0 +1,185 @@
+import threading
+import time
+from typing import Any
+
+import numpy as np
+from sqlalchemy import update
+from sqlmodel import Session, select
+
+from app.config import settings
+from app.database import engine
+from app.models import KnowledgeBase
+
+# Agent steps after which an answer must not be reused: web results go stale,
+# and rate-limit/error fallbacks are not real answers.
+UNCACHEABLE_ACTIONS = frozenset({"search", "rate_limit", "error"})
+
+
+class SemanticAnswerCache:
+    """
+    In-process cache of final chat answers for near-duplicate questions.
+
+    Entries are grouped by the asking user's KB set (users with the same KBs
+    see the same documents, so they may share answers). A question whose
+    unit-normalised embedding has cosine similarity >= `threshold` with a
+    cached question of the same KB set gets that answer. Each KB set keeps at
+    most `maxsize` entries (oldest evicted first); entries expire after `ttl`.
+
+    Every group remembers the KBs' content versions (knowledge_bases.content_version,
+    see kb_versions) it was answered from. Versions are read at lookup time and
+    passed back to store(): an answer is refused if any of its KBs has moved to a
+    newer version in the meantime, and a group older than the versions of a
+    lookup is dropped - also when the change happened in another worker.
+    """
+
+    def __init__(self, threshold: float = 0.95, maxsize: int = 256, ttl: float = 3600):
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # KB set -> (KB versions, embedding matrix, [(expires_at, payload)])
+        self._groups: dict[frozenset[int], tuple[dict[int, int], np.ndarray, list[tuple[float, dict]]]] = {}
+        # Newest content version seen per KB
+        self._versions: dict[int, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _unit(embedding: list[float]) -> np.ndarray | None:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def _observe(self, versions: dict[int, int]) -> None:
+        for kb_id, version in versions.items():
+            self._versions[kb_id] = max(self._versions.get(kb_id, version), version)
+
+    def _is_stale(self, versions: dict[int, int]) -> bool:
+        return any(self._versions.get(kb_id, version) > version for kb_id, version in versions.items())
+
+    def lookup(self, embedding: list[float], kb_ids: list[int], versions: dict[int, int] | None = None) -> dict | None:
+        """Cached answer payload for the closest question above the threshold, with its similarity."""
+        query = self._unit(embedding)
+        key = frozenset(kb_ids)
+        with self._lock:
+            self._observe(versions or {})
+            group = self._groups.get(key)
+            if group is not None and self._is_stale(group[0]):
+                del self._groups[key]
+                group = None
+            if query is None or group is None:
+                self.misses += 1
+                return None
+
+            _, matrix, entries = group
+            sims = matrix @ query
+            # Expired entries are skipped here and pruned on the next store
+            now = time.monotonic()
+            sims[[expires_at < now for expires_at, _ in entries]] = -1.0
+            best = int(np.argmax(sims))
+            if sims[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            return entries[best][1] | {"similarity": round(float(sims[best]), 4)}
+
+    def store(
+        self, embedding: list[float], kb_ids: list[int], payload: dict, versions: dict[int, int] | None = None
+    ) -> bool:
+        """
+        Cache an answer generated from KBs at `versions` (as read before retrieval).
+        Returns False if it was refused because a KB changed since.
+        """
+        versions = versions or {}
+        query = self._unit(embedding)
+        if query is None or self.maxsize <= 0:
+            return False
+        key = frozenset(kb_ids)
+        now = time.monotonic()
+        with self._lock:
+            if self._is_stale(versions):
+                return False
+            group = self._groups.get(key)
+            if group is None or group[0] != versions:
+                # New KB set, or its previous entries were answered from older content
+                group = (versions, np.empty((0, len(query)), dtype=np.float32), [])
+            _, matrix, entries = group
+            keep = [i for i, (expires_at, _) in enumerate(entries) if expires_at >= now]
+            keep = keep[max(0, len(keep) - self.maxsize + 1) :]
+            matrix = np.vstack([matrix[keep], query[None, :]])
+            entries = [entries[i] for i in keep] + [(now + self.ttl, payload)]
+            self._groups[key] = (versions, matrix, entries)
+            return True
+
+    def invalidate_kb(self, kb_id: int | None = None, version: int | None = None) -> None:
+        """
+        Drop every entry whose KB set includes kb_id (a document changed), or
+        everything. With the KB's new `version`, answers still being generated
+        from the old content will be refused by store().
+        """
+        with self._lock:
+            if kb_id is None:
+                self._groups.clear()
+                return
+            if version is not None:
+                self._observe({kb_id: version})
+            for key in [key for key in self._groups if kb_id in key]:
+                del self._groups[key]
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "kb_sets": len(self._groups),
+                "size": sum(len(entries) for _, _, entries in self._groups.values()),
+                "threshold": self.threshold,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+def is_cacheable(result: dict) -> bool:
+    """Whether a generate_response_stream result may be reused for other users."""
+    steps = result.get("reasoning_data", {}).get("steps", [])
+    return bool(result.get("response")) and not any(step.get("action") in UNCACHEABLE_ACTIONS for step in steps)
+
+
+answer_cache = SemanticAnswerCache(
+    threshold=settings.ANSWER_CACHE_THRESHOLD,
+    maxsize=settings.ANSWER_CACHE_SIZE,
+    ttl=settings.ANSWER_CACHE_TTL,
+)
+
+
+def kb_versions(kb_ids: list[int]) -> dict[int, int]:
+    """Current content version of each KB (shared by all workers through the database)."""
+    if not kb_ids:
+        return {}
+    with Session(engine) as session:
+        rows = session.exec(
+            select(KnowledgeBase.id, KnowledgeBase.content_version).where(KnowledgeBase.id.in_(kb_ids))
+        ).all()
+    return dict(rows)
+
+
+def invalidate_kb_answers(kb_id: int | None) -> None:
+    """
+    A KB's documents changed (call after the change is committed): bump its
+    content version, so every worker stops serving and storing answers from
+    the old content, and drop this process's entries right away.
+    """
+    if kb_id is None:
+        answer_cache.invalidate_kb()
+        return
+    with Session(engine) as session:
+        version = session.execute(
+            update(KnowledgeBase)
+            .where(KnowledgeBase.id == kb_id)
+            .values(content_version=KnowledgeBase.content_version + 1)
+            .returning(KnowledgeBase.content_version)
+        ).scalar()
+        session.commit()
+    answer_cache.invalidate_kb(kb_id, version)
@@ -0,0 +1,105 @@
+"""
+Bulk writer for document_chunks using COPY ... FROM STDIN (FORMAT binary).
+
+Rows are encoded in PostgreSQL's binary COPY format: integers big-endian,
+text as UTF-8, embeddings in pgvector's binary layout (int16 dim, int16
+unused, dim x float4 big-endian) straight from NumPy, so no vector is ever
+formatted as text. The COPY runs on the session's connection, inside its
+transaction; row triggers (knowledge_base sync, quantized copies) still fire
+and generated columns (content_tsv) are still computed.
+"""
+
+import io
+import json
+import struct
+from collections.abc import Iterable
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import text
+from sqlmodel import Session
+
+COPY_COLUMNS = ("document_id", "knowledge_base_id", "content", "embedding", "chunk_index", "metadata", "created_at")
+
+_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0)
+_TRAILER = struct.pack("!h", -1)
+_ROW_HEADER = struct.pack("!h", len(COPY_COLUMNS))
+_NULL = struct.pack("!i", -1)
+_PG_EPOCH = datetime(2000, 1, 1)
+
+# Type of document_chunks.metadata (jsonb via init.sql, json via SQLModel create_all), per process
+_metadata_type: str | None = None
+
+
+def _int4(value: int | None) -> bytes:
+    return _NULL if value is None else struct.pack("!ii", 4, value)
+
+
+def _bytes(value: bytes) -> bytes:
+    return struct.pack("!i", len(value)) + value
+
+
+def _vector(embedding) -> bytes:
+    values = np.asarray(embedding, dtype=">f4")
+    return _bytes(struct.pack("!hh", len(values), 0) + values.tobytes())
+
+
+def _timestamp(value: datetime) -> bytes:
+    delta = value - _PG_EPOCH
+    micros = (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+    return struct.pack("!iq", 8, micros)
+
+
+def encode_rows(rows: Iterable[dict], jsonb: bool = True) -> bytes:
+    """
+    Binary COPY payload for chunk rows, keyed like DocumentChunk attributes
+    (document_id, knowledge_base_id, content, embedding, chunk_index, chunk_metadata).
+    """
+    now = datetime.utcnow()
+    out = io.BytesIO()
+    out.write(_HEADER)
+    for row in rows:
+        metadata = json.dumps(row.get("chunk_metadata") or {}).encode("utf-8")
+        embedding = row.get("embedding")
+        out.write(_ROW_HEADER)
+        out.write(_int4(row["document_id"]))
+        out.write(_int4(row.get("knowledge_base_id")))
+        out.write(_bytes((row.get("content") or "").encode("utf-8")))
+        out.write(_NULL if embedding is None else _vector(embedding))
+        out.write(_int4(row.get("chunk_index")))
+        out.write(_bytes(b"\x01" + metadata if jsonb else metadata))  # jsonb binary = version byte + text
+        out.write(_timestamp(row.get("created_at") or now))
+    out.write(_TRAILER)
+    return out.getvalue()
+
+
+def _metadata_is_jsonb(session: Session) -> bool:
+    global _metadata_type
+    if _metadata_type is None:
+        _metadata_type = session.execute(
+            text(
+                "SELECT data_type FROM information_schema.columns "
+                "WHERE table_name = 'document_chunks' AND column_name = 'metadata'"
+            )
+        ).scalar()
+    return _metadata_type == "jsonb"
+
+
+def copy_chunks(session: Session, rows: list[dict]) -> int:
+    """COPY rows into document_chunks within the session's transaction (the caller commits)."""
+    if not rows:
+        return 0
+    session.flush()  # pending ORM rows (e.g. the parent Document) must exist before the COPY
+    payload = encode_rows(rows, jsonb=_metadata_is_jsonb(session))
+    statement = f"COPY document_chunks ({', '.join(COPY_COLUMNS)}) FROM STDIN WITH (FORMAT binary)"
+
+    cursor = session.connection().connection.dbapi_connection.cursor()
+    try:
+        if hasattr(cursor, "copy_expert"):  # psycopg2
+            cursor.copy_expert(statement, io.BytesIO(payload))
+        else:  # psycopg 3
+            with cursor.copy(statement) as copy:
+                copy.write(payload)
+    finally:
+        cursor.close()
+    return len(rows)
@@ -0,0 +1,153 @@
+"""
+Paragraph- and sentence-aware text chunking with token-based sizes.
+
+Text is split into paragraphs (blank lines) and sentences; sentences longer
+than the target are split into word windows, and words longer than the
+target (by character span) are cut. Sentences are packed greedily
+into chunks of up to `target_tokens`, preferring to break between paragraphs,
+and each chunk starts with the trailing sentences (up to `overlap_tokens`) of
+the previous one so facts straddling a boundary stay retrievable. Chunks
+without a single word character (rules, dot leaders, symbol tables) are not
+emitted: they carry nothing to retrieve and embed to a zero vector locally.
+"""
+
+import re
+from collections.abc import Iterable, Iterator
+from typing import NamedTuple
+
+from app.config import settings
+
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+_SENTENCE_RE = re.compile(r"(?<=[.!?;:])\s+")
+# Words and single punctuation marks, roughly how BPE tokenizers segment text
+_PIECE_RE = re.compile(r"\w+|[^\w\s]")
+_WORD_CHAR_RE = re.compile(r"\w")
+
+
+class TextChunk(NamedTuple):
+    text: str
+    tokens: int
+
+
+def count_tokens(text: str) -> int:
+    """
+    Estimated token count: one token per punctuation mark and per ~4 characters
+    of each word. Within ~10% of BPE tokenizers on English/Spanish prose, and
+    needs no tokenizer download.
+    """
+    return sum(1 + (len(piece) - 1) // 4 for piece in _PIECE_RE.findall(text))
+
+
+def split_sentences(text: str) -> list[str]:
+    return _SENTENCE_RE.split(text)
+
+
+def _split_run(word: str, target_tokens: int) -> Iterator[str]:
+    """
+    Cut an unbroken run (URL, base64, a table row without spaces) into parts of
+    at most target_tokens, between tokenizer pieces; long words are cut every
+    target_tokens * 4 characters.
+    """
+    width = target_tokens * 4
+    start, tokens = 0, 0
+    for match in _PIECE_RE.finditer(word):
+        for offset in range(match.start(), match.end(), width):
+            piece_tokens = 1 + (min(offset + width, match.end()) - offset - 1) // 4
+            if tokens and tokens + piece_tokens > target_tokens:
+                yield word[start:offset]
+                start, tokens = offset, 0
+            tokens += piece_tokens
+    yield word[start:]
+
+
+def _split_words(text: str, target_tokens: int) -> list[str]:
+    words = [
+        part
+        for word in text.split()
+        for part in ([word] if count_tokens(word) <= target_tokens else _split_run(word, target_tokens))
+    ]
+
+    pieces, current, current_tokens = [], [], 0
+    for word in words:
+        tokens = count_tokens(word)
+        if current and current_tokens + tokens > target_tokens:
+            pieces.append(" ".join(current))
+            current, current_tokens = [], 0
+        current.append(word)
+        current_tokens += tokens
+    if current:
+        pieces.append(" ".join(current))
+    return pieces
+
+
+def _units(blocks: Iterable[str], target_tokens: int) -> Iterator[tuple[str, str, int]]:
+    """
+    Sentences (word windows for oversized ones) as (piece, separator to the
+    previous piece, tokens of the whole paragraph if the piece starts one, else 0).
+    Each block (e.g. a PDF page) is split on its own, so only one is in memory.
+    """
+    for block in blocks:
+        for paragraph in _PARAGRAPH_RE.split(block):
+            paragraph = paragraph.strip()
+            if not paragraph:
+                continue
+            separator, paragraph_tokens = "\n\n", count_tokens(paragraph)
+            for sentence in _SENTENCE_RE.split(paragraph):
+                pieces = (
+                    [sentence] if count_tokens(sentence) <= target_tokens else _split_words(sentence, target_tokens)
+                )
+                for piece in pieces:
+                    yield piece, separator, paragraph_tokens
+                    separator, paragraph_tokens = " ", 0
+
+
+def iter_chunks(
+    blocks: Iterable[str], target_tokens: int | None = None, overlap_tokens: int | None = None
+) -> Iterator[TextChunk]:
+    """
+    Incrementally chunk a stream of text blocks (pages, file segments) into chunks
+    of at most ~target_tokens, with overlap_tokens of trailing context carried over.
+    Blocks are treated as paragraph boundaries; memory is bounded by one block plus one chunk.
+    """
+    target_tokens = target_tokens or settings.CHUNK_TARGET_TOKENS
+    overlap_tokens = settings.CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+    overlap_tokens = min(overlap_tokens, target_tokens // 2)
+
+    current: list[tuple[str, str, int]] = []  # (piece, separator, tokens)
+    current_tokens = 0
+    fresh = 0  # pieces in `current` not already emitted as overlap
+
+    def body() -> TextChunk:
+        text = current[0][0] + "".join(separator + piece for piece, separator, _ in current[1:])
+        return TextChunk(text, count_tokens(text))
+
+    for piece, separator, paragraph_tokens in _units(blocks, target_tokens):
+        tokens = count_tokens(piece)
+        # Break when full, or early at a paragraph that would not fit whole once the chunk is half full
+        full = current_tokens + tokens > target_tokens
+        paragraph_break = paragraph_tokens and current_tokens + paragraph_tokens > target_tokens
+        if fresh and (full or (paragraph_break and current_tokens >= target_tokens // 2)):
+            chunk = body()
+            if _WORD_CHAR_RE.search(chunk.text):
+                yield chunk
+            # Carry whole trailing pieces as overlap, as long as they fit the budget
+            carried, carried_tokens = [], 0
+            for item in reversed(current):
+                if carried_tokens + item[2] > overlap_tokens or carried_tokens + item[2] + tokens > target_tokens:
+                    break
+                carried.insert(0, item)
+                carried_tokens += item[2]
+            current, current_tokens, fresh = carried, carried_tokens, 0
+        current.append((piece, separator, tokens))
+        current_tokens += tokens
+        fresh += 1
+
+    if fresh:
+        chunk = body()
+        if _WORD_CHAR_RE.search(chunk.text):
+            yield chunk
+
+
+def chunk_text(text: str, target_tokens: int | None = None, overlap_tokens: int | None = None) -> list[TextChunk]:
+    """Split text into chunks of at most ~target_tokens, with overlap_tokens of trailing context carried over."""
+    return list(iter_chunks([text], target_tokens, overlap_tokens))
@@ -0,0 +1,127 @@
+"""
+Token-budgeted packing of retrieved chunks into the LLM prompt.
+
+Chunks are taken in relevance order until CONTEXT_TOKEN_BUDGET is spent.
+Chunks of the same document with consecutive chunk_index are merged into one
+passage with the chunker's overlap removed, exact duplicates (the same text
+in two documents) and chunks already contained in a selected passage are
+dropped, and the chunk that crosses the budget is cut at a sentence boundary.
+The system prompt is resent on every agent iteration, so this bounds the
+prompt size of a whole turn, not just of one call.
+"""
+
+from collections.abc import Iterable
+from typing import NamedTuple
+
+from app.config import settings
+from app.services.chunker import count_tokens, split_sentences
+from app.services.retrieved_chunk import RetrievedChunk
+
+# Below this many remaining tokens a truncated chunk is not worth including
+_MIN_PIECE_TOKENS = 40
+_GAP = "\n[...]\n"
+_SENTENCE_ENDS = ".!?;:"  # as in the chunker's sentence splitting
+
+
+class PackedContext(NamedTuple):
+    text: str
+    chunks: list[RetrievedChunk]  # the chunks that made it in, in relevance order
+    tokens: int
+    dropped: int  # retrieved chunks left out (duplicates or over budget)
+
+
+def _overlap(previous: str, current: str) -> int:
+    """
+    Length of the longest suffix of `previous` that starts a sentence and is a
+    prefix of `current`, i.e. the trailing sentences the chunker carried over.
+    """
+    for start in range(max(0, len(previous) - len(current)), len(previous)):
+        starts_sentence = start == 0 or (
+            previous[start - 1].isspace() and previous[:start].rstrip()[-1:] in _SENTENCE_ENDS
+        )
+        if starts_sentence and current.startswith(previous[start:]):
+            return len(previous) - start
+    return 0
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    """Leading sentences of `text` that fit in max_tokens ("" if not even the first one does)."""
+    kept, tokens = [], 0
+    for sentence in split_sentences(text):
+        sentence_tokens = count_tokens(sentence)
+        if tokens + sentence_tokens > max_tokens:
+            break
+        kept.append(sentence)
+        tokens += sentence_tokens
+    return " ".join(kept)
+
+
+class _Packer:
+    def __init__(self):
+        # document_id -> (title, chunk_id -> (chunk_index, text)); legacy chunks may lack chunk_index
+        self.documents: dict[int, tuple[str, dict[int, tuple[int | None, str]]]] = {}
+
+    def render_document(self, document_id: int) -> str:
+        title, pieces = self.documents[document_id]
+        ordered = sorted(pieces.items(), key=lambda item: (item[1][0] is None, item[1][0] or 0, item[0]))
+        runs, previous_index, previous_text = [], None, ""
+        for _, (index, text) in ordered:
+            if index is not None and previous_index is not None and index == previous_index + 1:
+                runs[-1] += text[_overlap(previous_text, text) :]
+            else:
+                runs.append(text)
+            previous_index, previous_text = index, text
+        return f"[{title}]\n" + _GAP.join(runs)
+
+    def render(self) -> str:
+        return "\n\n".join(self.render_document(document_id) for document_id in self.documents)
+
+    def contains(self, text: str) -> bool:
+        return any(text in piece for _, pieces in self.documents.values() for _, piece in pieces.values())
+
+    def add(self, chunk: RetrievedChunk, text: str) -> None:
+        self.documents.setdefault(chunk.document_id, (chunk.title, {}))[1][chunk.chunk_id] = (chunk.chunk_index, text)
+
+    def remove(self, chunk: RetrievedChunk) -> None:
+        pieces = self.documents[chunk.document_id][1]
+        del pieces[chunk.chunk_id]
+        if not pieces:
+            del self.documents[chunk.document_id]
+
+
+def pack_context(chunks: Iterable[RetrievedChunk], budget: int | None = None) -> PackedContext:
+    """Pack chunks (most relevant first) into at most `budget` tokens (CONTEXT_TOKEN_BUDGET by default)."""
+    budget = budget or settings.CONTEXT_TOKEN_BUDGET
+    packer = _Packer()
+    used: list[RetrievedChunk] = []
+    seen_ids, seen_texts = set(), set()
+    tokens, dropped = 0, 0
+
+    for chunk in chunks:
+        content = (chunk.content or "").strip()
+        if not content or chunk.chunk_id in seen_ids or content in seen_texts or packer.contains(content):
+            dropped += 1
+            continue
+        seen_ids.add(chunk.chunk_id)
+        seen_texts.add(content)
+
+        packer.add(chunk, content)
+        total = count_tokens(packer.render())
+        if total > budget:
+            # Only the part of the chunk that fits, cut between sentences
+            packer.remove(chunk)
+            remaining = budget - tokens
+            text = _truncate(content, remaining - (total - tokens - count_tokens(content)))
+            if remaining < _MIN_PIECE_TOKENS or not text:
+                dropped += 1
+                continue
+            packer.add(chunk, text)
+            total = count_tokens(packer.render())
+            if total > budget:
+                packer.remove(chunk)
+                dropped += 1
+                continue
+        used.append(chunk)
+        tokens = total
+
+    return PackedContext(packer.render() if used else "", used, tokens, dropped)
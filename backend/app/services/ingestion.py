@@ -0,0 +1,226 @@
+"""
+Streaming, bounded-memory document ingestion.
+
+The upload is spooled to a temp file in fixed-size blocks, text is extracted
+one PDF page (or one text segment) at a time, chunked incrementally and
+embedded/inserted in batches of INGEST_BATCH_CHUNKS. Peak memory depends on
+the batch size and the largest page, not on the document size.
+"""
+
+import codecs
+import logging
+import os
+import tempfile
+from collections import defaultdict, deque
+from collections.abc import Callable, Iterable, Iterator
+from itertools import islice
+
+from fastapi import UploadFile
+from sqlalchemy import delete, func, update
+from sqlmodel import Session, select
+
+from app.config import settings
+from app.models import Document, DocumentChunk
+from app.services import pdf_extract
+from app.services.chunk_writer import copy_chunks
+from app.services.chunker import TextChunk, iter_chunks
+from app.services.rag import content_hash, embed_chunks
+
+logger = logging.getLogger(__name__)
+
+_SPOOL_BLOCK = 1 << 20  # 1 MiB
+_TEXT_BLOCK = 1 << 16  # characters per text segment
+
+
+async def spool_upload(upload: UploadFile) -> str:
+    """Copy an upload to a file in INGEST_SPOOL_DIR block by block; returns its path (the caller deletes it)."""
+    suffix = os.path.splitext(upload.filename or "")[1]
+    os.makedirs(settings.INGEST_SPOOL_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(prefix="upload_", suffix=suffix, dir=settings.INGEST_SPOOL_DIR)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while block := await upload.read(_SPOOL_BLOCK):
+                out.write(block)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path
+
+
+def iter_pdf_pages(path: str) -> Iterator[str]:
+    """Extracted text of each PDF page with text, in order (large PDFs are extracted in parallel)."""
+    for text in pdf_extract.iter_pages(path):
+        if text:
+            yield text
+
+
+def _detect_encoding(path: str) -> str:
+    """utf-8 if the whole file decodes as utf-8 (checked incrementally), else latin-1."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    try:
+        with open(path, "rb") as f:
+            while block := f.read(_SPOOL_BLOCK):
+                decoder.decode(block)
+            decoder.decode(b"", final=True)
+    except UnicodeDecodeError:
+        return "latin-1"
+    return "utf-8"
+
+
+def iter_text_segments(path: str) -> Iterator[str]:
+    """Text file contents in segments of ~_TEXT_BLOCK characters, cut at paragraph breaks where possible."""
+    with open(path, encoding=_detect_encoding(path)) as f:
+        pending = ""
+        while block := f.read(_TEXT_BLOCK):
+            pending += block
+            cut = pending.rfind("\n\n")
+            if cut <= 0:
+                if len(pending) < 4 * _TEXT_BLOCK:
+                    continue
+                # No blank line for a long stretch: fall back to a line or word break
+                cut = max(pending.rfind("\n"), pending.rfind(" "))
+                if cut <= 0:
+                    cut = len(pending)
+            yield pending[:cut]
+            pending = pending[cut:]
+        if pending.strip():
+            yield pending
+
+
+def _batched(items: Iterable[TextChunk], size: int) -> Iterator[list[TextChunk]]:
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def pdf_page_count(path: str) -> int:
+    return pdf_extract.page_count(path)
+
+
+def ingest_chunks(
+    session: Session,
+    doc: Document,
+    blocks: Iterable[str],
+    metadata: dict | None = None,
+    start: int = 0,
+    on_batch: Callable[[int], None] | None = None,
+) -> int:
+    """
+    Chunk, embed and insert a stream of text blocks for `doc` in batches.
+    Rows are written with binary COPY (no ORM objects kept around). `start`
+    skips chunks that are already stored (resuming a job; chunking is
+    deterministic), and `on_batch(chunks_so_far)` runs after each batch, e.g.
+    to commit progress. Without it nothing is committed here. Returns the chunk count.
+    """
+    metadata = metadata or {}
+    count = start
+    for batch in _batched(islice(iter_chunks(blocks), start, None), settings.INGEST_BATCH_CHUNKS):
+        embeddings = embed_chunks(session, [chunk.text for chunk in batch])
+        copy_chunks(
+            session,
+            [
+                {
+                    "document_id": doc.id,
+                    "knowledge_base_id": doc.knowledge_base_id,
+                    "content": chunk.text,
+                    "embedding": embedding,
+                    "chunk_index": count + i,
+                    "chunk_metadata": metadata | {"tokens": chunk.tokens},
+                }
+                for i, (chunk, embedding) in enumerate(zip(batch, embeddings, strict=True))
+            ],
+        )
+        count += len(batch)
+        if on_batch:
+            on_batch(count)
+    logger.info(f"Ingested document {doc.id}: {count} chunks")
+    return count
+
+
+def _existing_chunk_hashes(session: Session, doc_id: int) -> dict[str, deque[tuple[int, int]]]:
+    """sha256 of each stored chunk -> (id, chunk_index) in index order; hashed in Postgres, no text transferred."""
+    digest = func.encode(func.sha256(func.convert_to(func.coalesce(DocumentChunk.content, ""), "UTF8")), "hex")
+    rows = session.exec(
+        select(digest, DocumentChunk.id, DocumentChunk.chunk_index)
+        .where(DocumentChunk.document_id == doc_id)
+        .order_by(DocumentChunk.chunk_index, DocumentChunk.id)
+    )
+    existing: dict[str, deque[tuple[int, int]]] = defaultdict(deque)
+    for digest_hex, chunk_id, chunk_index in rows:
+        existing[digest_hex].append((chunk_id, chunk_index))
+    return existing
+
+
+def replace_chunks(
+    session: Session,
+    doc: Document,
+    blocks: Iterable[str],
+    metadata: dict | None = None,
+    on_batch: Callable[[int], None] | None = None,
+) -> dict[str, int]:
+    """
+    Re-ingest a new version of `doc` by diffing its chunks against the stored ones.
+
+    New chunks are matched to existing rows by content hash (duplicates in
+    order). Matched rows keep their id and embedding - only chunk_index is
+    updated if the chunk moved; unmatched new chunks are embedded and inserted,
+    unmatched old rows are deleted at the end. Unchanged chunks therefore stay
+    valid in ChatMessage.used_sources and cause no vector index churn. Nothing
+    is committed here, so readers see the old version until the caller commits.
+    Returns {"kept", "moved", "inserted", "deleted", "chunks"} counts.
+    """
+    metadata = metadata or {}
+    existing = _existing_chunk_hashes(session, doc.id)
+    stats = {"kept": 0, "moved": 0, "inserted": 0, "deleted": 0, "chunks": 0}
+
+    count = 0
+    for batch in _batched(iter_chunks(blocks), settings.INGEST_BATCH_CHUNKS):
+        moved, new = [], []
+        for i, chunk in enumerate(batch, start=count):
+            matches = existing.get(content_hash(chunk.text))
+            if matches:
+                chunk_id, old_index = matches.popleft()
+                stats["kept"] += 1
+                if old_index != i:
+                    moved.append({"id": chunk_id, "chunk_index": i})
+            else:
+                new.append((i, chunk))
+
+        if moved:
+            session.execute(update(DocumentChunk), moved)
+            stats["moved"] += len(moved)
+        if new:
+            embeddings = embed_chunks(session, [chunk.text for _, chunk in new])
+            stats["inserted"] += copy_chunks(
+                session,
+                [
+                    {
+                        "document_id": doc.id,
+                        "knowledge_base_id": doc.knowledge_base_id,
+                        "content": chunk.text,
+                        "embedding": embedding,
+                        "chunk_index": i,
+                        "chunk_metadata": metadata | {"tokens": chunk.tokens},
+                    }
+                    for (i, chunk), embedding in zip(new, embeddings, strict=True)
+                ],
+            )
+        count += len(batch)
+        if on_batch:
+            on_batch(count)
+
+    stale = [chunk_id for matches in existing.values() for chunk_id, _ in matches]
+    for i in range(0, len(stale), 1000):
+        session.execute(delete(DocumentChunk).where(DocumentChunk.id.in_(stale[i : i + 1000])))
+    stats["deleted"] = len(stale)
+    stats["chunks"] = count
+    logger.info(f"Re-ingested document {doc.id}: {stats}")
+    return stats
+
+
+def iter_file_blocks(path: str, is_pdf: bool) -> Iterator[str]:
+    return iter_pdf_pages(path) if is_pdf else iter_text_segments(path)
+
+
+def ingest_file(session: Session, doc: Document, path: str, is_pdf: bool, metadata: dict | None = None) -> int:
+    return ingest_chunks(session, doc, iter_file_blocks(path, is_pdf), metadata)
@@ -0,0 +1,357 @@
+"""
+Background ingestion jobs.
+
+The upload endpoint spools the file, creates the Document and an
+IngestionJob row and returns immediately. Workers claim queued jobs with
+SELECT ... FOR UPDATE SKIP LOCKED (so several processes can share the queue)
+and run the streaming ingestion pipeline, committing each batch of chunks
+together with the job's progress. A job interrupted by a restart keeps its
+stale heartbeat, is claimed again and resumes after its last committed chunk.
+
+Each claim increments the job's `attempts`, and every write of a running job
+(progress with each batch, the final status) is conditional on that attempt,
+so a worker whose job was re-claimed cannot commit another chunk. The
+heartbeat is refreshed by a timer thread every INGEST_HEARTBEAT_SECONDS, not
+per batch, so a slow batch (embedding retries, a huge page) does not get its
+job re-claimed in the first place.
+
+Replace jobs (a new version of an existing document) diff the new chunks
+against the stored ones in a single transaction, so searches see either the
+old or the new version; an interrupted replace job simply runs the diff again.
+
+Workers run inside the API process (INGEST_WORKERS) or standalone:
+    python -m app.services.ingestion_jobs
+"""
+
+import asyncio
+import contextlib
+import logging
+import os
+import threading
+from collections.abc import Iterable, Iterator
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_, update
+from sqlmodel import Session, select
+
+from app.config import settings
+from app.database import engine
+from app.models import Document, IngestionJob
+from app.services import kb_indexes, pdf_extract, vector_index
+from app.services.answer_cache import invalidate_kb_answers
+from app.services.ingestion import ingest_chunks, iter_file_blocks, pdf_page_count, replace_chunks
+from app.services.rag import invalidate_kb_chunk_counts
+
+logger = logging.getLogger(__name__)
+
+# Set when a job is enqueued in this process, so idle workers start without waiting for the next poll
+_wakeup: asyncio.Event | None = None
+_loop: asyncio.AbstractEventLoop | None = None  # the loop the workers (and _wakeup) belong to
+# Set on shutdown: running jobs stop after their current batch and are re-queued
+_shutdown = threading.Event()
+
+
+class _Interrupted(Exception):
+    pass
+
+
+class _LostClaim(Exception):
+    """The job was re-claimed by another worker (its heartbeat went stale); this attempt must stop."""
+
+
+def job_status(job: IngestionJob) -> dict:
+    progress = None
+    if job.status == "done":
+        progress = 1.0
+    elif job.pages_total:
+        progress = round(job.pages_done / job.pages_total, 4)
+    return {
+        "id": job.id,
+        "document_id": job.document_id,
+        "filename": job.filename,
+        "status": job.status,
+        "chunks_done": job.chunks_done,
+        "pages_done": job.pages_done,
+        "pages_total": job.pages_total,
+        "progress": progress,
+        "error": job.error,
+        "replace": job.replace,
+        "diff": job.diff,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+
+def enqueue(
+    session: Session,
+    doc: Document,
+    path: str,
+    is_pdf: bool,
+    user_id: int | None,
+    replace: bool = False,
+    filename: str | None = None,
+) -> IngestionJob:
+    """Create the job for an already-added Document and commit both."""
+    job = IngestionJob(
+        document_id=doc.id,
+        user_id=user_id,
+        filename=filename or doc.title,
+        file_path=path,
+        is_pdf=is_pdf,
+        replace=replace,
+    )
+    session.add(job)
+    session.commit()
+    session.refresh(job)
+    notify()
+    return job
+
+
+def notify() -> None:
+    """Wake idle workers; safe from any thread (sync routes run in the threadpool)."""
+    if _wakeup is not None and _loop is not None:
+        with contextlib.suppress(RuntimeError):  # loop already closed
+            _loop.call_soon_threadsafe(_wakeup.set)
+
+
+def claim_job() -> tuple[int, int] | None:
+    """
+    Mark the oldest queued (or abandoned running) job as running and return
+    (job id, attempt). The attempt number is this worker's claim on the job.
+    """
+    now = datetime.utcnow()
+    stale = now - timedelta(seconds=settings.INGEST_JOB_STALE_SECONDS)
+    with Session(engine) as session:
+        job = session.exec(
+            select(IngestionJob)
+            .where(
+                or_(
+                    IngestionJob.status == "queued",
+                    and_(IngestionJob.status == "running", IngestionJob.heartbeat_at < stale),
+                )
+            )
+            .order_by(IngestionJob.id)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+        ).first()
+        if job is None:
+            return None
+        if job.status == "running":
+            logger.warning(f"Resuming ingestion job {job.id} after chunk {job.chunks_done}")
+        job.status = "running"
+        job.attempts += 1
+        job.started_at = job.started_at or now
+        job.heartbeat_at = now
+        session.add(job)
+        session.commit()
+        return job.id, job.attempts
+
+
+def _update_claimed(session: Session, job_id: int, attempt: int, **values) -> None:
+    """
+    Update a running job only while `attempt` is still its current claim; raises
+    _LostClaim (and changes nothing) once another worker has re-claimed it. Does not commit.
+    """
+    result = session.execute(
+        update(IngestionJob)
+        .where(IngestionJob.id == job_id, IngestionJob.attempts == attempt, IngestionJob.status == "running")
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        raise _LostClaim
+
+
+class _Heartbeat(threading.Thread):
+    """Refreshes a running job's heartbeat_at every INGEST_HEARTBEAT_SECONDS, however long a batch takes."""
+
+    def __init__(self, job_id: int, attempt: int):
+        super().__init__(name=f"ingestion-heartbeat-{job_id}", daemon=True)
+        self.job_id = job_id
+        self.attempt = attempt
+        self.lost = threading.Event()  # set once another worker has re-claimed the job
+        self._halt = threading.Event()
+
+    def run(self) -> None:
+        while not self._halt.wait(settings.INGEST_HEARTBEAT_SECONDS):
+            try:
+                with Session(engine) as session:
+                    _update_claimed(session, self.job_id, self.attempt, heartbeat_at=datetime.utcnow())
+                    session.commit()
+            except _LostClaim:
+                self.lost.set()
+                return
+            except Exception as e:
+                logger.warning(f"Heartbeat of ingestion job {self.job_id} failed: {e}")
+
+    def stop(self) -> None:
+        self._halt.set()
+        self.join()
+
+
+def _count_pages(blocks: Iterable[str], job: IngestionJob) -> Iterator[str]:
+    """Pass blocks through, counting them on the job (committed with the next batch)."""
+    job.pages_done = 0
+    for block in blocks:
+        job.pages_done += 1
+        yield block
+
+
+def run_job(job_id: int, attempt: int) -> None:
+    """
+    Ingest one claimed job; progress is committed with every batch of chunks,
+    and only while `attempt` is still the job's current claim.
+    """
+    with Session(engine) as session:
+        job = session.get(IngestionJob, job_id)
+        doc = session.get(Document, job.document_id) if job else None
+        if job is None or doc is None:
+            logger.warning(f"Ingestion job {job_id}: job or document no longer exists")
+            return
+        kb_id = doc.knowledge_base_id
+        # Detached: the job row is only written through _update_claimed, and autoflush
+        # never locks it for the length of a transaction the heartbeat has to wait for
+        session.expunge(job)
+
+        def progress() -> dict:
+            return {"chunks_done": job.chunks_done, "pages_done": job.pages_done, "pages_total": job.pages_total}
+
+        def on_batch(chunks_done: int) -> None:
+            # The batch's chunks are committed only if this worker still owns the job
+            job.chunks_done = chunks_done
+            _update_claimed(session, job_id, attempt, **progress())
+            session.commit()
+            if _shutdown.is_set():
+                raise _Interrupted
+
+        def on_replace_batch(chunks_done: int) -> None:
+            # The diff commits once at the end; progress goes through its own short transaction
+            job.chunks_done = chunks_done
+            with Session(engine) as progress_session:
+                _update_claimed(progress_session, job_id, attempt, **progress())
+                progress_session.commit()
+            if _shutdown.is_set():
+                raise _Interrupted
+
+        heartbeat = _Heartbeat(job_id, attempt)
+        heartbeat.start()
+        try:
+            if not os.path.exists(job.file_path):
+                raise FileNotFoundError(
+                    f"Spooled upload {job.file_path} no longer exists (INGEST_SPOOL_DIR is not persistent?); "
+                    "upload the document again"
+                )
+            if job.is_pdf and job.pages_total is None:
+                job.pages_total = pdf_page_count(job.file_path)
+            blocks = _count_pages(iter_file_blocks(job.file_path, job.is_pdf), job)
+            metadata = {"filename": job.filename}
+            if job.replace:
+                job.diff = replace_chunks(session, doc, blocks, metadata, on_replace_batch)
+                chunks = job.diff["chunks"]
+            else:
+                chunks = ingest_chunks(session, doc, blocks, metadata, job.chunks_done, on_batch)
+            if job.is_pdf and not chunks:
+                raise ValueError("Could not extract text from PDF. The PDF might be scanned/image-based.")
+
+            if job.replace:
+                doc.title = job.filename
+                doc.type = "pdf" if job.is_pdf else "text"
+                session.add(doc)
+            job.chunks_done = chunks
+            _update_claimed(
+                session, job_id, attempt, **progress(), status="done", diff=job.diff, finished_at=datetime.utcnow()
+            )
+            session.commit()
+            with contextlib.suppress(OSError):
+                os.remove(job.file_path)
+        except _LostClaim:
+            session.rollback()
+            logger.warning(f"Ingestion job {job_id} was re-claimed by another worker, abandoning attempt {attempt}")
+            return
+        except _Interrupted:
+            logger.info(f"Ingestion job {job_id} interrupted after chunk {job.chunks_done}, re-queued")
+            session.rollback()  # nothing pending for ingestion; a replace diff is re-run from scratch
+            with contextlib.suppress(_LostClaim):
+                _update_claimed(session, job_id, attempt, status="queued")
+                session.commit()
+        except Exception as e:
+            logger.error(f"Ingestion job {job_id} failed: {e}")
+            session.rollback()
+            with contextlib.suppress(_LostClaim):
+                _update_claimed(
+                    session, job_id, attempt, status="failed", error=str(e)[:2000], finished_at=datetime.utcnow()
+                )
+                session.commit()
+        finally:
+            heartbeat.stop()
+
+    # Committed chunks are searchable either way
+    invalidate_kb_chunk_counts(kb_id)
+    invalidate_kb_answers(kb_id)
+    vector_index.refresh_kb(kb_id)
+    kb_indexes.sync_kb_hnsw_index(kb_id)
+
+
+async def worker_loop(stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        try:
+            claim = await asyncio.to_thread(claim_job)
+        except Exception as e:
+            logger.error(f"Ingestion worker could not poll the queue: {e}")
+            claim = None
+
+        if claim is not None:
+            job_id, attempt = claim
+            try:
+                await asyncio.to_thread(run_job, job_id, attempt)
+            except Exception as e:
+                # e.g. the database went away mid-job; the stale heartbeat gets the job re-claimed
+                logger.error(f"Ingestion job {job_id} aborted: {e}")
+            continue
+
+        _wakeup.clear()
+        try:
+            await asyncio.wait_for(_wakeup.wait(), settings.INGEST_POLL_INTERVAL)
+        except TimeoutError:
+            pass
+
+
+class WorkerPool:
+    """`size` ingestion workers on the running event loop."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._stop = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+
+    def start(self) -> None:
+        global _wakeup, _loop
+        _wakeup = asyncio.Event()
+        _loop = asyncio.get_running_loop()
+        _shutdown.clear()
+        self._tasks = [asyncio.create_task(worker_loop(self._stop)) for _ in range(self.size)]
+        if self._tasks:
+            logger.info(f"Started {self.size} ingestion worker(s)")
+
+    async def stop(self) -> None:
+        """Stop after the current jobs' batches; unfinished jobs resume on the next start."""
+        self._stop.set()
+        _shutdown.set()
+        notify()
+        await self.wait()
+        pdf_extract.shutdown_pool()
+
+    async def wait(self) -> None:
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+async def _run_standalone() -> None:
+    pool = WorkerPool(max(settings.INGEST_WORKERS, 1))
+    pool.start()
+    await pool.wait()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_run_standalone())
@@ -0,0 +1,261 @@
+"""
+Portable Knowledge Base archives: export a KB with its embeddings and load it
+elsewhere without re-embedding anything.
+
+An archive is an uncompressed tar stream (vectors barely compress) of:
+    manifest.json         format version, KB name/description, embedding model, dim, dtype
+    documents.jsonl       one document per line (archive-local id, title, type, path_url)
+    chunks-00000.jsonl    up to KB_ARCHIVE_BLOCK_CHUNKS chunks (document id, index, content, metadata)
+    vectors-00000.npy     their embeddings, one row per line of the matching chunks file
+    ...
+
+Vectors are float16 by default (half the size of float32; cosine rankings are
+unaffected in practice), float32 on request. Chunks without an embedding are
+not exported. Export reads the KB by keyset pagination and yields the tar one
+block at a time, so memory is bounded by a block. Import bulk-loads each block with binary COPY; the KB's partial HNSW
+index is only built once at the end (with INDEX_BUILD_MAINTENANCE_WORK_MEM),
+and restores into an empty database can also defer the global HNSW index.
+"""
+
+import io
+import json
+import logging
+import tarfile
+import time
+from collections.abc import Iterator
+
+import numpy as np
+from sqlalchemy import text
+from sqlmodel import Session, select
+
+from app.config import settings
+from app.database import engine
+from app.models import Document, DocumentChunk, KnowledgeBase
+from app.services import kb_indexes, purge, vector_index
+from app.services.answer_cache import invalidate_kb_answers
+from app.services.chunk_writer import copy_chunks
+from app.services.rag import EMBEDDING_DIM, EMBEDDING_MODEL, invalidate_kb_chunk_counts
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+DTYPES = ("float16", "float32")
+
+
+class ArchiveError(ValueError):
+    pass
+
+
+class _TarStream(io.RawIOBase):
+    """Write-only sink for tarfile's stream mode; `drain()` returns what was written since the last call."""
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._buffer += data
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+def _add_member(tar: tarfile.TarFile, name: str, data: bytes) -> None:
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = int(time.time())
+    tar.addfile(info, io.BytesIO(data))
+
+
+def _jsonl(records: list[dict]) -> bytes:
+    return "".join(json.dumps(record, ensure_ascii=False, default=str) + "\n" for record in records).encode("utf-8")
+
+
+def _npy(array: np.ndarray) -> bytes:
+    out = io.BytesIO()
+    np.save(out, array, allow_pickle=False)
+    return out.getvalue()
+
+
+def export_kb(kb_id: int, dtype: str = "float16") -> Iterator[bytes]:
+    """Stream a KB as a tar archive, block by block (see the module docstring for the layout)."""
+    if dtype not in DTYPES:
+        raise ArchiveError(f"dtype must be one of {DTYPES}")
+    stream = _TarStream()
+    tar = tarfile.open(fileobj=stream, mode="w|", format=tarfile.PAX_FORMAT)
+
+    with Session(engine) as session:
+        kb = session.get(KnowledgeBase, kb_id)
+        if kb is None:
+            raise ArchiveError(f"Knowledge Base {kb_id} not found")
+        documents = session.exec(select(Document).where(Document.knowledge_base_id == kb_id).order_by(Document.id))
+        documents = [
+            {"id": doc.id, "title": doc.title, "type": doc.type, "path_url": doc.path_url, "created_at": doc.created_at}
+            for doc in documents
+        ]
+        manifest = {
+            "format_version": FORMAT_VERSION,
+            "knowledge_base": {"name": kb.name, "description": kb.description},
+            "embedding_model": EMBEDDING_MODEL,
+            "dim": EMBEDDING_DIM,
+            "dtype": dtype,
+            "documents": len(documents),
+        }
+        _add_member(tar, "manifest.json", json.dumps(manifest, indent=2).encode("utf-8"))
+        _add_member(tar, "documents.jsonl", _jsonl(documents))
+        yield stream.drain()
+
+        last_id, block = 0, 0
+        while True:
+            rows = session.exec(
+                select(
+                    DocumentChunk.id,
+                    DocumentChunk.document_id,
+                    DocumentChunk.chunk_index,
+                    DocumentChunk.content,
+                    DocumentChunk.chunk_metadata,
+                    DocumentChunk.embedding,
+                )
+                # Chunks without an embedding are unsearchable; exporting them would import zero vectors
+                .where(
+                    DocumentChunk.knowledge_base_id == kb_id,
+                    DocumentChunk.embedding.is_not(None),
+                    DocumentChunk.id > last_id,
+                )
+                .order_by(DocumentChunk.id)
+                .limit(settings.KB_ARCHIVE_BLOCK_CHUNKS)
+            ).all()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            chunks = [
+                {"document_id": row[1], "chunk_index": row[2], "content": row[3], "metadata": row[4]} for row in rows
+            ]
+            vectors = np.array([row[5] for row in rows], dtype=dtype)
+            _add_member(tar, f"chunks-{block:05d}.jsonl", _jsonl(chunks))
+            _add_member(tar, f"vectors-{block:05d}.npy", _npy(vectors))
+            block += 1
+            yield stream.drain()
+
+    tar.close()
+    yield stream.drain()
+    logger.info(f"Exported KB {kb_id}: {len(documents)} documents, {block} blocks")
+
+
+def read_manifest(path: str) -> dict:
+    """Validate an archive's manifest against this deployment (embedding model and dimension)."""
+    with tarfile.open(path, mode="r|") as tar:
+        member = tar.next()
+        if member is None or member.name != "manifest.json":
+            raise ArchiveError("Not a knowledge base archive (manifest.json must come first)")
+        manifest = json.load(tar.extractfile(member))
+    if manifest.get("format_version") != FORMAT_VERSION:
+        raise ArchiveError(f"Unsupported archive format version {manifest.get('format_version')}")
+    if manifest.get("embedding_model") != EMBEDDING_MODEL or manifest.get("dim") != EMBEDDING_DIM:
+        raise ArchiveError(
+            f"Archive embeddings are {manifest.get('embedding_model')} ({manifest.get('dim')}d), "
+            f"this deployment uses {EMBEDDING_MODEL} ({EMBEDDING_DIM}d)"
+        )
+    return manifest
+
+
+def _set_global_index(present: bool) -> bool:
+    """
+    Drop or (re)build the global HNSW index of the active EMBEDDING_QUANTIZATION
+    mode. Returns whether the index existed beforehand.
+    """
+    name, column, opclass = kb_indexes.QUANTIZED_INDEXES[settings.EMBEDDING_QUANTIZATION]
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        existed = connection.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar() is not None
+        if present:
+            kb_indexes.create_index(
+                connection,
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON document_chunks USING hnsw ({column} {opclass})",
+            )
+        else:
+            connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+    return existed
+
+
+def import_kb(path: str, kb_id: int, user_id: int, defer_global_index: bool = False) -> int:
+    """
+    Load an archive into an existing (empty) KB: documents are recreated with
+    new ids owned by `user_id`, chunks are COPYed one block per transaction.
+    On failure the partially loaded KB is purged. Returns the chunk count.
+
+    `defer_global_index` drops the global HNSW index for the load and rebuilds
+    it afterwards - much faster for restores into an otherwise empty database,
+    but searches on other KBs fall back to exact scans meanwhile. Only an index
+    that was actually dropped is rebuilt (after a failed import too, once the
+    partial load is purged).
+    """
+    chunks = 0
+    dropped_index = defer_global_index and _set_global_index(False)
+    try:
+        with Session(engine) as session, tarfile.open(path, mode="r|") as tar:
+            doc_ids: dict[int, int] = {}
+            pending: list[dict] | None = None
+            for member in tar:
+                data = tar.extractfile(member).read()
+                if member.name == "manifest.json":
+                    continue
+                if member.name == "documents.jsonl":
+                    records = [json.loads(line) for line in data.splitlines() if line]
+                    docs = [
+                        Document(
+                            title=record["title"],
+                            type=record.get("type"),
+                            path_url=record.get("path_url"),
+                            user_id=user_id,
+                            knowledge_base_id=kb_id,
+                        )
+                        for record in records
+                    ]
+                    session.add_all(docs)
+                    session.flush()
+                    doc_ids = {record["id"]: doc.id for record, doc in zip(records, docs, strict=True)}
+                    session.commit()
+                elif member.name.startswith("chunks-"):
+                    pending = [json.loads(line) for line in data.splitlines() if line]
+                elif member.name.startswith("vectors-"):
+                    vectors = np.load(io.BytesIO(data), allow_pickle=False).astype(np.float32)
+                    if pending is None or len(pending) != len(vectors):
+                        raise ArchiveError(f"{member.name} does not match its chunks file")
+                    chunks += copy_chunks(
+                        session,
+                        [
+                            {
+                                "document_id": doc_ids[chunk["document_id"]],
+                                "knowledge_base_id": kb_id,
+                                "content": chunk["content"],
+                                "embedding": vector,
+                                "chunk_index": chunk["chunk_index"],
+                                "chunk_metadata": chunk.get("metadata") or {},
+                            }
+                            for chunk, vector in zip(pending, vectors, strict=True)
+                        ],
+                    )
+                    session.commit()
+                    pending = None
+    except Exception:
+        logger.exception(f"Import into KB {kb_id} failed, removing the partial load")
+        purge.purge_knowledge_base(kb_id, delete_kb=True)
+        if dropped_index:
+            logger.warning(f"Restoring the global HNSW index dropped for the failed import into KB {kb_id}")
+            _set_global_index(True)
+        raise
+
+    if dropped_index:
+        _set_global_index(True)
+    # Answers cached while the KB was partly loaded must not outlive the load
+    invalidate_kb_answers(kb_id)
+    invalidate_kb_chunk_counts(kb_id)
+    vector_index.refresh_kb(kb_id)
+    kb_indexes.sync_kb_hnsw_index(kb_id)
+    logger.info(f"Imported {chunks} chunks into KB {kb_id}")
+    return chunks
@@ -0,0 +1,132 @@
+"""
+Per-Knowledge-Base partial HNSW indexes.
+
+A single global HNSW index filtered by knowledge_base_id degrades for KBs that
+are a small slice of the corpus (the scan runs out of candidates before it
+finds `limit` matches). KBs with at least KB_HNSW_INDEX_MIN_CHUNKS chunks get
+their own partial index, which the planner uses for the per-KB branches of
+rag.nearest_chunks; smaller KBs are scanned exactly via idx_chunks_kb_id.
+
+With EMBEDDING_QUANTIZATION enabled, the indexes are built on the quantized
+copy of the embedding instead (see QUANTIZED_INDEXES). sync_quantization_mode
+runs at startup: only quantized modes pay for the trigger that writes the
+quantized copies, and with "none" the global full-precision index is built
+(CONCURRENTLY, and only if it is missing).
+"""
+
+import logging
+
+from sqlalchemy import text
+from sqlmodel import Session, func, select
+
+from app.config import settings
+from app.database import engine
+from app.models import DocumentChunk
+
+logger = logging.getLogger(__name__)
+
+
+# Quantization mode -> (index name prefix, indexed column, operator class)
+QUANTIZED_INDEXES = {
+    "none": ("idx_chunks_embedding_hnsw", "embedding", "vector_cosine_ops"),
+    "halfvec": ("idx_chunks_embedding_half_hnsw", "embedding_half", "halfvec_cosine_ops"),
+    "binary": ("idx_chunks_embedding_bin_hnsw", "embedding_bin", "bit_hamming_ops"),
+}
+
+
+# Keeps embedding_half / embedding_bin in sync with `embedding` (quantized modes only)
+QUANTIZE_TRIGGER_SQL = """
+CREATE OR REPLACE FUNCTION quantize_chunk_embedding() RETURNS trigger AS $fn$
+BEGIN
+    NEW.embedding_half := NEW.embedding::halfvec(1024);
+    NEW.embedding_bin := binary_quantize(NEW.embedding)::bit(1024);
+    RETURN NEW;
+END;
+$fn$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_chunks_quantize ON document_chunks;
+CREATE TRIGGER trg_chunks_quantize
+BEFORE INSERT OR UPDATE OF embedding ON document_chunks
+FOR EACH ROW EXECUTE FUNCTION quantize_chunk_embedding();
+"""
+
+
+def kb_index_name(kb_id: int, mode: str | None = None) -> str:
+    prefix = QUANTIZED_INDEXES[mode or settings.EMBEDDING_QUANTIZATION][0]
+    return f"{prefix}_kb_{int(kb_id)}"
+
+
+def create_index(connection, ddl: str) -> None:
+    """
+    Run a CREATE INDEX statement with INDEX_BUILD_MAINTENANCE_WORK_MEM. The SET is
+    session-level and pooled connections are reused, so it is always reset afterwards.
+    """
+    connection.execute(text(f"SET maintenance_work_mem = '{settings.INDEX_BUILD_MAINTENANCE_WORK_MEM}'"))
+    try:
+        connection.execute(text(ddl))
+    finally:
+        connection.execute(text("RESET maintenance_work_mem"))
+
+
+def sync_quantization_mode() -> None:
+    """
+    Match the schema to EMBEDDING_QUANTIZATION: quantized modes get the
+    trg_chunks_quantize trigger (backfill and index: migrate_quantized_embeddings.py);
+    "none" drops it and builds the full-precision HNSW index if it is missing.
+    """
+    mode = settings.EMBEDDING_QUANTIZATION
+    try:
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            installed = connection.execute(
+                text("SELECT 1 FROM pg_trigger WHERE tgname = 'trg_chunks_quantize'")
+            ).first()
+            if mode != "none":
+                if installed is None:
+                    connection.execute(text(QUANTIZE_TRIGGER_SQL))
+                return
+            if installed is not None:
+                connection.execute(text("DROP TRIGGER IF EXISTS trg_chunks_quantize ON document_chunks"))
+            name, column, opclass = QUANTIZED_INDEXES["none"]
+            create_index(
+                connection,
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON document_chunks USING hnsw ({column} {opclass})",
+            )
+    except Exception as e:
+        logger.error(f"Failed to apply EMBEDDING_QUANTIZATION={mode}: {e}")
+
+
+def sync_kb_hnsw_index(kb_id: int | None) -> None:
+    """Create or drop the partial HNSW index of one KB according to its size (safe as a background task)."""
+    if kb_id is None:
+        return
+    kb_id = int(kb_id)
+    name = kb_index_name(kb_id)
+    _, column, opclass = QUANTIZED_INDEXES[settings.EMBEDDING_QUANTIZATION]
+
+    try:
+        with Session(engine) as session:
+            count = session.exec(
+                select(func.count(DocumentChunk.id)).where(DocumentChunk.knowledge_base_id == kb_id)
+            ).one()
+
+        # CONCURRENTLY keeps the table writable during the build, but cannot run inside a transaction
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            if count >= settings.KB_HNSW_INDEX_MIN_CHUNKS:
+                create_index(
+                    connection,
+                    f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON document_chunks "
+                    f"USING hnsw ({column} {opclass}) WHERE knowledge_base_id = {kb_id}",
+                )
+            else:
+                connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+    except Exception as e:
+        logger.error(f"Failed to sync partial HNSW index for KB {kb_id}: {e}")
+
+
+def drop_kb_hnsw_index(kb_id: int) -> None:
+    """Drop a KB's partial HNSW index, e.g. before bulk-deleting its chunks (vacuuming HNSW entries is costly)."""
+    try:
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {kb_index_name(kb_id)}"))
+    except Exception as e:
+        logger.error(f"Failed to drop partial HNSW index for KB {kb_id}: {e}")
@@ -19,6 +19,9 @@ from langchain_core.messages import AIMessage, HumanMessage, SystemMessage  # no
 from langchain_groq import ChatGroq  # noqa: E402
 from tavily import TavilyClient  # noqa: E402
 
+from app.config import settings  # noqa: E402
+from app.services.context_packer import pack_context  # noqa: E402
+
 # Initialize Clients
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 TAVILY_API_KEY = os.getenv("TAVILY_API_KEY")
@@ -89,6 +92,24 @@ else:
     llm = None
 
 
+# Until a reply has this many characters, a leading "`" may still open a ```json action block
+_ACTION_PROBE_CHARS = 8
+
+
+def _looks_like_action(head: str) -> bool | None:
+    """Whether a reply starting with `head` is a JSON action (True) or answer text (False); None = undecided."""
+    head = head.lstrip()
+    if not head:
+        return None
+    if head[0] == "{":
+        return True
+    if head[0] != "`":
+        return False
+    if len(head) < _ACTION_PROBE_CHARS:
+        return None
+    return head.startswith("```json") or "{" in head[:_ACTION_PROBE_CHARS]
+
+
 def load_prompt(filename: str) -> str:
     """Load a prompt from the backend/agent/prompts directory."""
     current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -128,31 +149,39 @@ async def generate_response_stream(query: str, context_chunks: list = None, hist
 
     context_text = ""
     sources = []
+    context_stats = None
 
-    # 1. Prepare Context from RAG
+    # 1. Prepare Context from RAG (packed into a fixed token budget)
     if context_chunks:
         logger.info(f"[LLM] Processing {len(context_chunks)} context chunks")
         try:
-            context_text = "\n\n".join([c.content for c in context_chunks])
-            sources = [c.document.title if c.document else "Internal Doc" for c in context_chunks]
-            logger.info(f"[LLM] Context prepared: {len(context_text)} chars")
+            packed = pack_context(context_chunks)
+            context_text = packed.text
+            sources = [c.title for c in packed.chunks]
+            context_stats = {
+                "tokens": packed.tokens,
+                "budget": settings.CONTEXT_TOKEN_BUDGET,
+                "chunk_ids": [c.chunk_id for c in packed.chunks],
+                "dropped": packed.dropped,
+            }
+            logger.info(
+                f"[LLM] Context packed: {len(packed.chunks)}/{len(context_chunks)} chunks, {packed.tokens} tokens"
+            )
         except Exception as e:
             logger.error(f"[LLM] Error preparing context: {e}")
             sources = ["Internal Documents"]
-        record_token_usage("retriever", len(context_text) // 4, user_id=user_id)
+        record_token_usage("retriever", context_stats["tokens"] if context_stats else 0, user_id=user_id)
     else:
         logger.info("[LLM] No context chunks provided")
 
-    # 2. Build system prompt
+    # 2. Build system prompt (no Knowledge Base section when nothing relevant was retrieved)
     current_date = datetime.utcnow().strftime("%Y-%m-%d")
+    knowledge_section = f"## YOUR KNOWLEDGE BASE (from user's documents)\n{context_text}\n\n" if context_text else ""
     system_content = f"""You are VaultMind AI, a deep reasoning agent with access to tools.
 
 ## TODAY'S DATE: {current_date}
 
-## YOUR KNOWLEDGE BASE (from user's documents)
-{context_text if context_text else "⚠️ No relevant documents found in Knowledge Base."}
-
----
+{knowledge_section}---
 
 ## 🚨 CRITICAL RULES (MUST FOLLOW)
 
@@ -296,12 +325,16 @@ You have up to 20 steps. Use as many as needed. DO NOT RUSH."""
             step_data["todo_list"] = todo_list
         reasoning_steps.append(step_data)
 
+    # Text the client has been shown as deltas since the last delta_reset (None: nothing streamed)
+    streamed_text = None
+
     # Initial status
     add_step("Initializing Agent & Planning...", "analyze")
     yield {"type": "status", "content": "Planning..."}
 
     if context_chunks:
-        add_step(f"Loaded {len(context_chunks)} docs from Knowledge Base", "retriever")
+        used = len(context_stats["chunk_ids"]) if context_stats else len(context_chunks)
+        add_step(f"Loaded {used} docs from Knowledge Base", "retriever")
 
     for iteration in range(max_iterations):
         if not llm:
@@ -319,14 +352,35 @@ You have up to 20 steps. Use as many as needed. DO NOT RUSH."""
 
         try:
             record_api_call()
-            # Call the model
-            logger.info(f"[LLM] Iteration {iteration + 1}: Calling Groq API...")
-            response = await llm.ainvoke(messages)
+            # Call the model, streaming. A reply that starts as plain text is the final answer:
+            # it is forwarded as "delta" events while it is generated. JSON actions are buffered.
+            logger.info(f"[LLM] Iteration {iteration + 1}: Calling Groq API (streaming)...")
+            response = None
+            streaming = None  # None until the start of the reply shows whether it is an action
+            async for piece in llm.astream(messages):
+                response = piece if response is None else response + piece
+                if streaming is None:
+                    is_action = _looks_like_action(response.content or "")
+                    if is_action is None:
+                        continue
+                    streaming = not is_action
+                    if streaming:
+                        streamed_text = (response.content or "").lstrip()
+                        yield {"type": "delta", "content": streamed_text}
+                elif streaming and piece.content:
+                    streamed_text += piece.content
+                    yield {"type": "delta", "content": piece.content}
             logger.info(f"[LLM] Iteration {iteration + 1}: Got response from Groq")
+            if response is None:
+                response = AIMessage(content="")
 
-            # Record usage
-            metadata = getattr(response, "response_metadata", {})
-            usage = metadata.get("usage", {}) or metadata.get("token_usage", {})
+            # Record usage (usage_metadata on the aggregated stream, response_metadata on older clients)
+            metadata = getattr(response, "response_metadata", {}) or {}
+            usage = (
+                getattr(response, "usage_metadata", None)
+                or metadata.get("usage", {})
+                or metadata.get("token_usage", {})
+            )
 
             if usage.get("total_tokens", 0) > 0:
                 record_token_usage("groq", usage["total_tokens"], user_id=user_id)
@@ -370,6 +424,11 @@ You have up to 20 steps. Use as many as needed. DO NOT RUSH."""
             # Prioritize: search > plan > any other
             parsed_json = search_json or plan_json or any_json
 
+            if streaming and parsed_json and parsed_json.get("action") != "answer":
+                # Text streamed as an answer ended in an action after all: the client drops it
+                streamed_text = None
+                yield {"type": "delta_reset"}
+
             # Parsing logic
             if parsed_json:
                 action = parsed_json.get("action", "")
@@ -497,9 +556,15 @@ You have up to 20 steps. Use as many as needed. DO NOT RUSH."""
     final_response = re.sub(r'\{"action"[^}]+\}', "", final_response)
     final_response = final_response.strip()
 
+    if streamed_text is not None and streamed_text.strip() != final_response:
+        # The streamed text was not the answer as delivered (e.g. a JSON answer action after some
+        # text, or JSON stripped above): replace what the client shows with the final answer
+        yield {"type": "delta_reset"}
+        yield {"type": "delta", "content": final_response}
+
     yield {
         "type": "answer",
         "response": final_response,
         "sources": list(set(sources)),
-        "reasoning_data": {"steps": reasoning_steps},
+        "reasoning_data": {"steps": reasoning_steps, "context": context_stats},
     }
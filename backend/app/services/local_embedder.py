@@ -0,0 +1,74 @@
+import re
+import zlib
+from types import SimpleNamespace
+
+import numpy as np
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+class LocalEmbedder:
+    """
+    Deterministic offline embedder for dev, tests and benchmarks.
+
+    Word unigrams, word bigrams and character trigrams are feature-hashed
+    (signed, crc32) into `dim` buckets, damped with log1p and L2-normalised.
+    Texts sharing vocabulary land close in cosine space, so retrieval stays
+    meaningful without an API key, and the same text always gets the same vector.
+    Text without any word token has no features and raises ValueError instead
+    of getting a zero vector (cosine distance to it is NaN).
+
+    Exposes the same `embed(texts, model=..., input_type=...)` shape as
+    voyageai.Client so it can be used anywhere the Voyage client is.
+    """
+
+    model_name = "local-hash-v1"
+
+    def __init__(self, dim: int = 1024, char_ngram: int = 3):
+        self.dim = dim
+        self.char_ngram = char_ngram
+
+    def _features(self, text: str) -> tuple[list[str], list[float]]:
+        tokens = _TOKEN_RE.findall(text.lower())
+        features = list(tokens)
+        weights = [1.0] * len(tokens)
+
+        bigrams = [f"{a} {b}" for a, b in zip(tokens, tokens[1:], strict=False)]
+        features += bigrams
+        weights += [1.0] * len(bigrams)
+
+        n = self.char_ngram
+        for token in tokens:
+            padded = f"<{token}>"
+            grams = [f"#{padded[i : i + n]}" for i in range(len(padded) - n + 1)]
+            features += grams
+            weights += [0.5] * len(grams)
+        return features, weights
+
+    def encode(self, texts: list[str]) -> np.ndarray:
+        """Embed a batch of texts into an (n, dim) float32 matrix of unit vectors."""
+        rows, hashes, weights = [], [], []
+        for row, text in enumerate(texts):
+            features, feature_weights = self._features(text)
+            rows.extend([row] * len(features))
+            hashes.extend(zlib.crc32(f.encode("utf-8")) for f in features)
+            weights.extend(feature_weights)
+
+        hashes = np.asarray(hashes, dtype=np.uint32)
+        columns = (hashes % self.dim).astype(np.intp)
+        # Top bit picks the sign so colliding features tend to cancel out instead of piling up
+        signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        np.add.at(matrix, (np.asarray(rows, dtype=np.intp), columns), signs * np.asarray(weights, dtype=np.float32))
+
+        matrix = np.sign(matrix) * np.log1p(np.abs(matrix))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        empty = np.flatnonzero(norms[:, 0] == 0)
+        if empty.size:
+            raise ValueError(f"No embeddable tokens in text {int(empty[0])} of the batch: {texts[empty[0]][:40]!r}")
+        matrix /= norms
+        return matrix
+
+    def embed(self, texts: list[str], model: str | None = None, input_type: str | None = None) -> SimpleNamespace:
+        return SimpleNamespace(embeddings=self.encode(texts).tolist())
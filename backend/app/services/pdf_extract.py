@@ -0,0 +1,105 @@
+"""
+PDF text extraction, serial or fanned out over a process pool.
+
+PyPDF2's extract_text is CPU-bound pure Python, so threads do not help. Large
+PDFs (>= PDF_PARALLEL_MIN_BYTES) are split into page ranges that worker
+processes extract in parallel; results are yielded in page order with a
+bounded number of ranges in flight, so memory stays flat. Kept free of
+database/LLM imports so spawned workers start quickly.
+"""
+
+import multiprocessing
+import os
+import threading
+from collections import deque
+from collections.abc import Iterator
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from app.config import settings
+
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+# Per worker process: the reader of the file it extracted from last
+_reader_cache: dict = {}
+
+
+def _open_reader(path: str):
+    from PyPDF2 import PdfReader
+
+    if _reader_cache.get("path") != path:
+        if "handle" in _reader_cache:
+            _reader_cache["handle"].close()
+        _reader_cache.clear()
+        # A file object, not a path: PdfReader reads a path fully into memory
+        handle = open(path, "rb")  # noqa: SIM115 - kept open for the cached reader
+        _reader_cache.update(path=path, handle=handle, reader=PdfReader(handle))
+    return _reader_cache["reader"]
+
+
+def _extract_page(reader, index: int) -> str:
+    text = reader.pages[index].extract_text() or ""
+    # Parsed objects are memoised per reader; drop them so they do not accumulate across pages
+    reader.resolved_objects.clear()
+    return text
+
+
+def extract_range(path: str, start: int, stop: int) -> list[str]:
+    """Text of pages [start, stop) (runs in a worker process)."""
+    reader = _open_reader(path)
+    return [_extract_page(reader, i) for i in range(start, stop)]
+
+
+def page_count(path: str) -> int:
+    from PyPDF2 import PdfReader
+
+    with open(path, "rb") as f:
+        return len(PdfReader(f).pages)
+
+
+def _processes() -> int:
+    return settings.PDF_EXTRACT_PROCESSES or os.cpu_count() or 1
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: the API process has running threads (event loop, DB pool)
+            _pool = ProcessPoolExecutor(_processes(), mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(cancel_futures=True)
+            _pool = None
+
+
+def iter_pages(path: str) -> Iterator[str]:
+    """Extracted text of each page, in order (empty string for pages without text)."""
+    if _processes() < 2 or os.path.getsize(path) < settings.PDF_PARALLEL_MIN_BYTES:
+        with open(path, "rb") as f:
+            from PyPDF2 import PdfReader
+
+            reader = PdfReader(f)
+            for index in range(len(reader.pages)):
+                yield _extract_page(reader, index)
+        return
+
+    total = page_count(path)
+    step = settings.PDF_PAGES_PER_TASK
+    ranges = deque((start, min(start + step, total)) for start in range(0, total, step))
+    pool = _get_pool()
+    in_flight: deque[Future] = deque()
+    try:
+        while ranges or in_flight:
+            # Keep every process busy plus one range queued each, but no more (bounded memory)
+            while ranges and len(in_flight) < 2 * _processes():
+                in_flight.append(pool.submit(extract_range, path, *ranges.popleft()))
+            yield from in_flight.popleft().result()
+    finally:
+        for future in in_flight:
+            future.cancel()
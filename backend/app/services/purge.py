@@ -0,0 +1,112 @@
+"""
+Set-based, batched deletion of documents and Knowledge Bases.
+
+Chunks are deleted by id in batches of PURGE_BATCH_CHUNKS, one transaction
+per batch, then the document rows themselves (ingestion jobs cascade). No
+chunk row or embedding is loaded into Python, WAL and lock footprints stay
+bounded, and autovacuum can keep up between batches instead of facing one
+huge dead-tuple burst. A KB's partial HNSW index is dropped before its
+chunks are deleted and re-synced afterwards, since vacuuming HNSW entries
+is much more expensive than rebuilding a small index.
+
+Meant to run as a background task; every batch commits, so an interrupted
+purge can simply be started again.
+"""
+
+import contextlib
+import logging
+import os
+
+from sqlalchemy import delete
+from sqlmodel import Session, select
+
+from app.config import settings
+from app.database import engine
+from app.models import Document, DocumentChunk, IngestionJob, KnowledgeBase
+from app.services import kb_indexes, vector_index
+from app.services.answer_cache import answer_cache, invalidate_kb_answers
+from app.services.rag import invalidate_kb_chunk_counts
+
+logger = logging.getLogger(__name__)
+
+
+def delete_document_rows(session: Session, doc_ids: list[int]) -> None:
+    """Delete documents with one statement; chunks and jobs go via ON DELETE CASCADE. Does not commit."""
+    if not doc_ids:
+        return
+    # Spooled uploads of jobs that never finished would otherwise be left behind
+    paths = session.exec(
+        select(IngestionJob.file_path).where(IngestionJob.document_id.in_(doc_ids), IngestionJob.status != "done")
+    ).all()
+    session.execute(delete(Document).where(Document.id.in_(doc_ids)).execution_options(synchronize_session=False))
+    for path in paths:
+        with contextlib.suppress(OSError):
+            os.remove(path)
+
+
+def _delete_chunk_batches(session: Session, condition) -> int:
+    deleted = 0
+    while True:
+        batch = select(DocumentChunk.id).where(condition).limit(settings.PURGE_BATCH_CHUNKS)
+        result = session.execute(
+            delete(DocumentChunk)
+            .where(DocumentChunk.id.in_(batch.scalar_subquery()))
+            .execution_options(synchronize_session=False)
+        )
+        session.commit()
+        deleted += result.rowcount
+        if result.rowcount < settings.PURGE_BATCH_CHUNKS:
+            return deleted
+
+
+def purge_documents(doc_ids: list[int]) -> int:
+    """Delete documents and their chunks in bounded batches; returns the number of chunks deleted."""
+    deleted = 0
+    with Session(engine) as session:
+        kb_ids = set(session.exec(select(Document.knowledge_base_id).where(Document.id.in_(doc_ids))).all())
+        for i in range(0, len(doc_ids), 100):
+            ids = doc_ids[i : i + 100]
+            deleted += _delete_chunk_batches(session, DocumentChunk.document_id.in_(ids))
+            delete_document_rows(session, ids)
+            session.commit()
+
+    for kb_id in kb_ids:
+        _refresh_kb(kb_id)
+    logger.info(f"Purged {len(doc_ids)} documents ({deleted} chunks)")
+    return deleted
+
+
+def purge_knowledge_base(kb_id: int, delete_kb: bool = False) -> int:
+    """
+    Delete every document of a KB in bounded batches, and the KB itself if
+    `delete_kb` (user links cascade). Returns the number of chunks deleted.
+    """
+    kb_indexes.drop_kb_hnsw_index(kb_id)
+    with Session(engine) as session:
+        deleted = _delete_chunk_batches(session, DocumentChunk.knowledge_base_id == kb_id)
+        doc_ids = session.exec(select(Document.id).where(Document.knowledge_base_id == kb_id)).all()
+        for i in range(0, len(doc_ids), 1000):
+            # Chunks are gone already, so each statement only cascades to a few job rows
+            delete_document_rows(session, doc_ids[i : i + 1000])
+            session.commit()
+        if delete_kb:
+            session.execute(delete(KnowledgeBase).where(KnowledgeBase.id == kb_id))
+            session.commit()
+
+    if delete_kb:
+        invalidate_kb_chunk_counts(kb_id)
+        answer_cache.invalidate_kb(kb_id)
+        vector_index.drop_snapshot(kb_id)
+    else:
+        _refresh_kb(kb_id)
+    logger.info(
+        f"Purged KB {kb_id} ({len(doc_ids)} documents, {deleted} chunks){' and deleted it' if delete_kb else ''}"
+    )
+    return deleted
+
+
+def _refresh_kb(kb_id: int | None) -> None:
+    invalidate_kb_chunk_counts(kb_id)
+    invalidate_kb_answers(kb_id)
+    vector_index.refresh_kb(kb_id)
+    kb_indexes.sync_kb_hnsw_index(kb_id)
@@ -1,89 +1,637 @@
+import asyncio
+import hashlib
 import logging
 import os
-import random
+import time
+from concurrent.futures import ThreadPoolExecutor
 
+import numpy as np
 import voyageai
+from pgvector.sqlalchemy import BIT, HALFVEC, Vector
+from sqlalchemy import cast, func, literal_column, text, union_all
+from sqlalchemy.dialects.postgresql import insert
 from sqlmodel import Session, select
 
-from app.models import Document, DocumentChunk, User, UserKnowledgeBaseLink
+from app.config import settings
+from app.database import engine
+from app.models import ChunkEmbedding, Document, DocumentChunk, UserKnowledgeBaseLink
+from app.services import vector_index
+from app.services.cache import TTLCache
+from app.services.local_embedder import LocalEmbedder
+from app.services.reranker import fuse_scores, mmr_select, query_terms
+from app.services.retrieved_chunk import RetrievedChunk
 
 logger = logging.getLogger(__name__)
 
 # --- Embeddings ---
 VOYAGE_API_KEY = os.getenv("VOYAGE_API_KEY")
-vo_client = voyageai.Client(api_key=VOYAGE_API_KEY) if VOYAGE_API_KEY else None
+EMBEDDING_DIM = 1024
+
+if settings.EMBEDDING_BACKEND == "voyage" and VOYAGE_API_KEY:
+    vo_client = voyageai.Client(api_key=VOYAGE_API_KEY)
+    avo_client = voyageai.AsyncClient(api_key=VOYAGE_API_KEY)
+    embedding_client = vo_client
+    EMBEDDING_MODEL = "voyage-2"
+else:
+    if settings.EMBEDDING_BACKEND == "voyage":
+        logger.warning("VOYAGE_API_KEY not set. Using the local hashing embedder.")
+    vo_client = None
+    avo_client = None
+    # Distinct model name keeps local vectors apart from Voyage ones in chunk_embeddings
+    embedding_client = LocalEmbedder(dim=EMBEDDING_DIM)
+    EMBEDDING_MODEL = LocalEmbedder.model_name
+
+
+class EmbeddingError(RuntimeError):
+    """The embedding provider failed; nothing must be stored or cached in place of the vectors."""
+
+
+# Relevance cutoff (cosine distance) per embedding model, unless RETRIEVAL_MAX_DISTANCE is set.
+# The hashing embedder spreads related texts much wider than Voyage does.
+DEFAULT_MAX_DISTANCE = {"voyage-2": 0.6, LocalEmbedder.model_name: 0.9}
+
+# Repeated chat questions ("what is the transfer limit") skip the embedding call
+query_embedding_cache = TTLCache(maxsize=settings.QUERY_EMBEDDING_CACHE_SIZE, ttl=settings.QUERY_EMBEDDING_CACHE_TTL)
+
+# user_id -> KB ids, so a chat turn doesn't re-read the user and its links every time
+kb_membership_cache = TTLCache(maxsize=10_000, ttl=settings.KB_MEMBERSHIP_CACHE_TTL)
+
+# kb_id -> chunk count, used to choose between exact and HNSW search per query
+kb_chunk_count_cache = TTLCache(maxsize=10_000, ttl=settings.KB_MEMBERSHIP_CACHE_TTL)
 
 
 def get_embedding(text: str) -> list[float]:
-    """Generates embedding using Voyage AI (model=voyage-2, dim=1024)."""
-    if vo_client:
+    """
+    Generates embedding using the configured backend (Voyage voyage-2 or local, dim=1024).
+    Raises EmbeddingError if the provider fails.
+    """
+    try:
+        return embedding_client.embed([text], model=EMBEDDING_MODEL, input_type="document").embeddings[0]
+    except Exception as e:
+        logger.error(f"Embedding Error: {e}")
+        raise EmbeddingError(f"Embedding failed: {e}") from e
+
+
+def normalize_query(query: str) -> str:
+    """Case- and whitespace-insensitive form of a query, used as cache key."""
+    return " ".join(query.lower().split())
+
+
+def get_query_embedding(query: str) -> list[float]:
+    """Embedding for a chat query, served from the in-process cache when possible (EmbeddingError on failure)."""
+    key = (EMBEDDING_MODEL, normalize_query(query))
+    cached = query_embedding_cache.get(key)
+    if cached is not None:
+        return cached
+
+    embedding = get_embedding(query)
+    query_embedding_cache.set(key, embedding)
+    return embedding
+
+
+async def aget_query_embedding(query: str) -> list[float]:
+    """
+    Async variant of get_query_embedding - awaits Voyage instead of blocking the event loop.
+    Raises EmbeddingError if Voyage fails; failures are never cached.
+    """
+    key = (EMBEDDING_MODEL, normalize_query(query))
+    cached = query_embedding_cache.get(key)
+    if cached is not None:
+        return cached
+
+    if avo_client:
         try:
-            # voyage-2 is 1024 dimensions.
-            result = vo_client.embed([text], model="voyage-2", input_type="document").embeddings[0]
-            return result
+            result = await avo_client.embed([query], model=EMBEDDING_MODEL, input_type="document")
+            embedding = result.embeddings[0]
         except Exception as e:
             logger.error(f"Voyage Error: {e}")
-            # Fallback mock for dev if API fails
-            return [0.0] * 1024
+            raise EmbeddingError(f"Query embedding failed: {e}") from e
+    else:
+        # Local backend is CPU-only and sub-millisecond for a single query
+        embedding = get_embedding(query)
+
+    query_embedding_cache.set(key, embedding)
+    return embedding
+
+
+def embed_texts(
+    texts: list[str],
+    input_type: str = "document",
+    client=None,
+    batch_size: int | None = None,
+    max_concurrency: int | None = None,
+) -> list[list[float]]:
+    """
+    Embed many texts with as few provider round trips as possible.
+
+    Texts are split into provider-sized batches which are sent concurrently
+    (bounded by EMBEDDING_MAX_CONCURRENCY). Vectors are returned in input order.
+    A batch that still fails after EMBEDDING_RETRIES retries raises EmbeddingError.
+    `client` defaults to the configured embedding backend; anything exposing the
+    same `embed(texts, model=..., input_type=...)` method can be passed in.
+    """
+    if not texts:
+        return []
+
+    client = client or embedding_client
 
-    # Mock for local dev without key
-    return [random.uniform(-0.1, 0.1) for _ in range(1024)]
+    batch_size = batch_size or settings.EMBEDDING_BATCH_SIZE
+    max_concurrency = max_concurrency or settings.EMBEDDING_MAX_CONCURRENCY
+    batches = [texts[i : i + batch_size] for i in range(0, len(texts), batch_size)]
 
+    def embed_batch(batch: list[str]) -> list[list[float]]:
+        for attempt in range(settings.EMBEDDING_RETRIES + 1):
+            try:
+                return client.embed(batch, model=EMBEDDING_MODEL, input_type=input_type).embeddings
+            except Exception as e:
+                logger.warning(f"Embedding Error (batch of {len(batch)}, attempt {attempt + 1}): {e}")
+                error = e
+                if attempt < settings.EMBEDDING_RETRIES:
+                    time.sleep(0.5 * 2**attempt)
+        # Placeholder vectors would be stored as unsearchable rows, so the upload fails instead
+        raise EmbeddingError(f"Embedding failed for a batch of {len(batch)} texts: {error}") from error
 
-def rerank_documents(query: str, chunks: list[DocumentChunk], top_k: int = 5) -> list[DocumentChunk]:
-    """Mock Reranker for MVP - just return top K from vector search."""
-    # In production, use vo_client.rerank(...)
-    return chunks[:top_k]
+    if len(batches) == 1 or max_concurrency <= 1:
+        results = [embed_batch(batch) for batch in batches]
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_concurrency, len(batches))) as pool:
+            # map() preserves batch order, so the flattened output lines up with `texts`
+            results = list(pool.map(embed_batch, batches))
 
+    return [vector for batch_vectors in results for vector in batch_vectors]
 
-def vector_search(session: Session, query: str, user_id: int, limit: int = 20) -> list[DocumentChunk]:
+
+def content_hash(text: str) -> str:
+    """Content address of a chunk text (sha256 hex)."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# Hashes per chunk_embeddings lookup and rows per insert (a few bind parameters each, far below
+# PostgreSQL's 65535 per statement)
+_CHUNK_EMBEDDING_BATCH = 1000
+
+
+def embed_chunks(session: Session, texts: list[str]) -> list[list[float]]:
     """
-    Perform vector search filtered by User's assigned Knowledge Bases.
+    Embed document chunks, reusing vectors already stored in `chunk_embeddings`.
+
+    Vectors are looked up in bulk by (sha256(text), model); only the misses are
+    sent to the provider, and new vectors are written back for next time.
+    Does not commit - the caller commits together with its chunk rows.
     """
-    # 1. Get User's Knowledge Bases
-    # Optimization: Could cache this or pass it in.
-    user = session.get(User, user_id)
-    if not user:
+    if not texts:
         return []
 
-    # Get IDs of KBs assigned to user
-    # If admin, maybe search all? No, behave like user for chat.
-    # explicit link check
-    kb_links = session.exec(select(UserKnowledgeBaseLink).where(UserKnowledgeBaseLink.user_id == user_id)).all()
-    kb_ids = [link.knowledge_base_id for link in kb_links]
+    hashes = [content_hash(text) for text in texts]
+    unique_hashes = list(dict.fromkeys(hashes))
 
-    # If no KBs assigned, return empty (or default public ones?)
-    # Let's say if no KBs assigned, they see nothing.
-    if not kb_ids:
-        # Check for 'default' global KBs if any
-        # defaults = session.exec(select(KnowledgeBase).where(KnowledgeBase.is_default == True)).all()
-        # kb_ids = [kb.id for kb in defaults]
-        if not kb_ids:
-            return []
+    known: dict[str, list[float]] = {}
+    for i in range(0, len(unique_hashes), _CHUNK_EMBEDDING_BATCH):
+        rows = session.exec(
+            select(ChunkEmbedding.content_hash, ChunkEmbedding.embedding).where(
+                ChunkEmbedding.model == EMBEDDING_MODEL,
+                ChunkEmbedding.content_hash.in_(unique_hashes[i : i + _CHUNK_EMBEDDING_BATCH]),
+            )
+        ).all()
+        known.update({row[0]: row[1] for row in rows})
 
-    # 2. Generate query embedding
-    query_embedding = get_embedding(query)
+    # Embed each distinct missing text once, even if it repeats within the document
+    missing = {h: text for h, text in zip(hashes, texts, strict=True) if h not in known}
+    if missing:
+        new_vectors = embed_texts(list(missing.values()))
+        fresh = dict(zip(missing.keys(), new_vectors, strict=True))
+        known.update(fresh)
 
-    # 3. SQLModel Query with PGVector & Filtering
-    # Join filtered by KB IDs
-    statement = (
-        select(DocumentChunk)
-        .join(Document)
-        .where(Document.knowledge_base_id.in_(kb_ids))
-        .order_by(DocumentChunk.embedding.cosine_distance(query_embedding))
+        to_store = [{"content_hash": h, "model": EMBEDDING_MODEL, "embedding": vector} for h, vector in fresh.items()]
+        for i in range(0, len(to_store), _CHUNK_EMBEDDING_BATCH):
+            batch = to_store[i : i + _CHUNK_EMBEDDING_BATCH]
+            session.execute(insert(ChunkEmbedding).values(batch).on_conflict_do_nothing())
+
+    logger.info(f"Chunk embeddings: {len(texts) - len(missing)} reused, {len(missing)} embedded")
+    return [known[h] for h in hashes]
+
+
+def _fused_relevance(query: str, candidates: list[RetrievedChunk]) -> np.ndarray:
+    """BM25 over the candidate set fused with vector similarity (1 - distance)."""
+    return fuse_scores(
+        query,
+        [chunk.content for chunk in candidates],
+        [chunk.distance for chunk in candidates],
+        lexical_weight=settings.RERANK_LEXICAL_WEIGHT,
+    )
+
+
+def rerank_documents(query: str, candidates: list[RetrievedChunk], top_k: int = 5) -> list[RetrievedChunk]:
+    """Re-score vector search candidates with the fused relevance and keep the best top_k."""
+    if len(candidates) < 2:
+        return candidates[:top_k]
+
+    scores = _fused_relevance(query, candidates)
+    # Stable sort keeps vector order among ties
+    order = np.argsort(-scores, kind="stable")[:top_k]
+    return [candidates[i] for i in order]
+
+
+def apply_distance_cutoff(candidates: list[RetrievedChunk]) -> list[RetrievedChunk]:
+    """Candidates within the absolute distance cutoff and within RETRIEVAL_RELATIVE_GAP of the best one."""
+    max_distance = settings.RETRIEVAL_MAX_DISTANCE
+    if max_distance is None:
+        max_distance = DEFAULT_MAX_DISTANCE.get(EMBEDDING_MODEL, 1.0)
+    if not candidates:
+        return []
+    limit = min(max_distance, min(chunk.distance for chunk in candidates) + settings.RETRIEVAL_RELATIVE_GAP)
+    return [chunk for chunk in candidates if chunk.distance <= limit]
+
+
+def get_chunk_embeddings(session: Session, chunk_ids: list[int]) -> np.ndarray:
+    """Embeddings of a few chunks by primary key, in the given order (zero vectors for vanished rows)."""
+    rows = dict(
+        session.exec(select(DocumentChunk.id, DocumentChunk.embedding).where(DocumentChunk.id.in_(chunk_ids))).all()
+    )
+    zero = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+    return np.array([rows.get(chunk_id, zero) for chunk_id in chunk_ids], dtype=np.float32)
+
+
+def select_context(
+    session: Session, query: str, candidates: list[RetrievedChunk], top_k: int = 5, stats: dict | None = None
+) -> list[RetrievedChunk]:
+    """
+    Pick the chunks that go to the LLM: drop irrelevant candidates (distance
+    cutoff), score the rest with the fused relevance, then choose up to top_k
+    with MMR so near-copies of a picked chunk are skipped (rerank_documents
+    when MMR is off). May return fewer than top_k chunks, or none when nothing
+    is relevant.
+    """
+    stats = stats if stats is not None else {}
+    relevant = apply_distance_cutoff(candidates)
+    selection = {"candidates": len(candidates), "relevant": len(relevant)}
+    stats["selection"] = selection
+    if not relevant:
+        selection["selected"] = 0
+        return []
+    selection["best_distance"] = round(min(chunk.distance for chunk in relevant), 4)
+
+    if len(relevant) == 1 or settings.MMR_LAMBDA >= 1:
+        selected = rerank_documents(query, relevant, top_k)
+    else:
+        embeddings = get_chunk_embeddings(session, [chunk.chunk_id for chunk in relevant])
+        order = mmr_select(
+            _fused_relevance(query, relevant),
+            embeddings,
+            top_k,
+            settings.MMR_LAMBDA,
+            max_similarity=settings.MMR_DUPLICATE_SIMILARITY,
+        )
+        selected = [relevant[i] for i in order]
+    selection["selected"] = len(selected)
+    return selected
+
+
+def get_user_kb_ids(session: Session, user_id: int) -> list[int]:
+    """IDs of the Knowledge Bases assigned to a user (cached, see invalidate_user_kbs)."""
+    cached = kb_membership_cache.get(user_id)
+    if cached is not None:
+        return list(cached)
+
+    # Unknown users simply have no links, so the link table alone is enough
+    kb_ids = session.exec(
+        select(UserKnowledgeBaseLink.knowledge_base_id).where(UserKnowledgeBaseLink.user_id == user_id)
+    ).all()
+    kb_membership_cache.set(user_id, tuple(kb_ids))
+    return list(kb_ids)
+
+
+def invalidate_user_kbs(user_id: int | None = None) -> None:
+    """Drop cached KB membership for one user, or for everyone when user_id is None."""
+    if user_id is None:
+        kb_membership_cache.clear()
+    else:
+        kb_membership_cache.delete(user_id)
+
+
+# Reciprocal-rank fusion constant (standard value from the RRF paper)
+RRF_K = 60
+
+
+def get_kb_chunk_counts(session: Session, kb_ids: list[int]) -> dict[int, int]:
+    """Chunk count per KB (cached, see invalidate_kb_chunk_counts)."""
+    counts = {}
+    missing = []
+    for kb_id in kb_ids:
+        cached = kb_chunk_count_cache.get(kb_id)
+        if cached is None:
+            missing.append(kb_id)
+        else:
+            counts[kb_id] = cached
+
+    if missing:
+        rows = session.exec(
+            select(DocumentChunk.knowledge_base_id, func.count(DocumentChunk.id))
+            .where(DocumentChunk.knowledge_base_id.in_(missing))
+            .group_by(DocumentChunk.knowledge_base_id)
+        ).all()
+        fetched = dict.fromkeys(missing, 0) | dict(rows)
+        for kb_id, count in fetched.items():
+            kb_chunk_count_cache.set(kb_id, count)
+        counts.update(fetched)
+    return counts
+
+
+def invalidate_kb_chunk_counts(kb_id: int | None = None) -> None:
+    """Drop the cached chunk count of one KB (after uploads/deletes), or of all KBs."""
+    if kb_id is None:
+        kb_chunk_count_cache.clear()
+    else:
+        kb_chunk_count_cache.delete(kb_id)
+
+
+_pgvector_version: tuple[int, ...] | None = None
+
+
+def pgvector_version(session: Session) -> tuple[int, ...]:
+    """Installed pgvector extension version, e.g. (0, 8, 0). Looked up once per process."""
+    global _pgvector_version
+    if _pgvector_version is None:
+        try:
+            version = session.execute(text("SELECT extversion FROM pg_extension WHERE extname = 'vector'")).scalar()
+            _pgvector_version = tuple(int(part) for part in (version or "0").split("."))
+        except Exception as e:
+            logger.warning(f"Could not read pgvector version: {e}")
+            _pgvector_version = (0,)
+    return _pgvector_version
+
+
+def configure_hnsw_scan(session: Session, limit: int) -> dict:
+    """
+    Tune HNSW for this transaction only (set_config(..., is_local => true)):
+    ef_search large enough for `limit` results, and iterative index scans on
+    pgvector >= 0.8 so filtered scans keep going until `limit` rows are found.
+    """
+    ef_search = min(1000, max(settings.HNSW_EF_SEARCH, 2 * limit))
+    session.execute(text("SELECT set_config('hnsw.ef_search', :value, true)").bindparams(value=str(ef_search)))
+    iterative = pgvector_version(session) >= (0, 8)
+    if iterative:
+        session.execute(text("SELECT set_config('hnsw.iterative_scan', 'relaxed_order', true)"))
+    return {"ef_search": ef_search, "iterative_scan": iterative}
+
+
+def search_chunks(
+    session: Session,
+    query_embedding: list[float],
+    kb_ids: list[int],
+    limit: int = 20,
+    query_text: str | None = None,
+    stats: dict | None = None,
+) -> list[RetrievedChunk]:
+    """
+    Nearest chunks within the given Knowledge Bases, best first, with their cosine distance.
+    When `query_text` is given, full-text matches are fused in as well (see hybrid_search_statement).
+
+    The plan is chosen per query: an in-process snapshot if available, an exact
+    scan when the user's KBs hold at most EXACT_SEARCH_MAX_CHUNKS chunks, HNSW
+    otherwise. The chosen plan and its latency are written into `stats`.
+    """
+    stats = stats if stats is not None else {}
+    start = time.perf_counter()
+    terms = query_terms(query_text) if query_text else []
+
+    # Small, snapshotted KBs are answered in-process (no full-text there, so not for hybrid)
+    if settings.VECTOR_INDEX_ENABLED and not terms:
+        results = vector_index.search(session, query_embedding, kb_ids, limit)
+        if results is not None:
+            stats.update(plan="in_process", search_ms=round((time.perf_counter() - start) * 1000, 2))
+            return results
+
+    candidates = sum(get_kb_chunk_counts(session, kb_ids).values())
+    exact = candidates <= settings.EXACT_SEARCH_MAX_CHUNKS
+    stats.update(plan="exact" if exact else "hnsw", candidates=candidates, hybrid=bool(terms))
+    if not exact:
+        quantized = settings.EMBEDDING_QUANTIZATION != "none"
+        ann_limit = limit * settings.QUANTIZED_SEARCH_OVERSAMPLE if quantized else limit
+        stats.update(configure_hnsw_scan(session, ann_limit), quantization=settings.EMBEDDING_QUANTIZATION)
+
+    if terms:
+        statement = hybrid_search_statement(query_embedding, terms, kb_ids, limit, exact=exact)
+    else:
+        nearest = nearest_chunks(query_embedding, kb_ids, limit, exact=exact)
+        statement = (
+            chunk_projection(nearest.c.distance)
+            .join(nearest, nearest.c.id == DocumentChunk.id)
+            .order_by(nearest.c.distance)
+            .limit(limit)
+        )
+
+    results = [RetrievedChunk(*row) for row in session.exec(statement).all()]
+    stats["search_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    return results
+
+
+def chunk_projection(distance):
+    """
+    SELECT of exactly the RetrievedChunk fields, with the document title joined in
+    one query. The embedding is never fetched and nothing is lazy-loaded later,
+    so results stay usable after the session is closed (see avector_search).
+    """
+    return select(
+        DocumentChunk.id,
+        DocumentChunk.document_id,
+        Document.title,
+        DocumentChunk.content,
+        DocumentChunk.chunk_index,
+        distance.label("distance"),
+    ).join(Document, Document.id == DocumentChunk.document_id)
+
+
+def quantized_distance(query_embedding: list[float], mode: str):
+    """
+    Distance on the quantized copy of the embedding (maintained by the
+    trg_chunks_quantize trigger): cosine on halfvec, Hamming on binary.
+    """
+    if mode == "halfvec":
+        column = literal_column("document_chunks.embedding_half", HALFVEC(EMBEDDING_DIM))
+        return column.cosine_distance(query_embedding)
+    column = literal_column("document_chunks.embedding_bin", BIT(EMBEDDING_DIM))
+    query_bits = cast(func.binary_quantize(cast(query_embedding, Vector(EMBEDDING_DIM))), BIT(EMBEDDING_DIM))
+    return column.hamming_distance(query_bits)
+
+
+def nearest_chunks(query_embedding: list[float], kb_ids: list[int], limit: int, exact: bool = False):
+    """
+    Subquery of (id, distance) for the `limit` nearest chunks of each KB.
+
+    Filters on the denormalized document_chunks.knowledge_base_id (no join), one
+    branch per KB with an equality predicate, so each branch can use that KB's
+    partial HNSW index (large KBs) or an exact scan via idx_chunks_kb_id (small
+    KBs) and always returns up to `limit` rows. `exact` orders by an expression
+    no vector index can serve, forcing an exact scan.
+
+    With EMBEDDING_QUANTIZATION, the ANN scan runs on the quantized index for
+    limit * QUANTIZED_SEARCH_OVERSAMPLE candidates, which are then re-scored
+    with the full-precision vectors. Exact scans always use full precision.
+    """
+    distance = DocumentChunk.embedding.cosine_distance(query_embedding)
+    mode = settings.EMBEDDING_QUANTIZATION
+
+    def branch(kb_id: int):
+        in_kb = DocumentChunk.knowledge_base_id == kb_id
+        if exact or mode == "none":
+            order_key = distance + 0 if exact else distance
+            return select(DocumentChunk.id.label("id"), distance.label("distance")).where(in_kb).order_by(order_key)
+
+        shortlist = (
+            select(DocumentChunk.id)
+            .where(in_kb)
+            .order_by(quantized_distance(query_embedding, mode))
+            .limit(limit * settings.QUANTIZED_SEARCH_OVERSAMPLE)
+        )
+        return (
+            select(DocumentChunk.id.label("id"), distance.label("distance"))
+            .where(DocumentChunk.id.in_(shortlist.scalar_subquery()))
+            .order_by(distance + 0)
+        )
+
+    branches = [branch(kb_id).limit(limit) for kb_id in kb_ids]
+    if len(branches) == 1:
+        return branches[0].subquery("nearest")
+    return union_all(*branches).subquery("nearest")
+
+
+def hybrid_search_statement(
+    query_embedding: list[float], terms: list[str], kb_ids: list[int], limit: int, exact: bool = False
+):
+    """
+    One statement that runs the HNSW search and a GIN full-text search
+    (OR of the query terms over document_chunks.content_tsv) side by side,
+    then merges both rankings with reciprocal-rank fusion.
+    """
+    distance = DocumentChunk.embedding.cosine_distance(query_embedding)
+
+    nearest = nearest_chunks(query_embedding, kb_ids, limit, exact=exact)
+    vector_ranked = (
+        select(nearest.c.id, func.row_number().over(order_by=nearest.c.distance).label("rnk"))
+        .order_by(nearest.c.distance)
         .limit(limit)
+        .cte("vector_ranked")
     )
 
-    results = session.exec(statement).all()
-    return list(results)
+    # Terms are \w+ tokens, so they are safe to join into to_tsquery syntax
+    tsquery = func.to_tsquery("simple", " | ".join(terms))
+    content_tsv = literal_column("document_chunks.content_tsv")
+    text_rank = func.ts_rank_cd(content_tsv, tsquery)
+    lexical_ranked = (
+        select(DocumentChunk.id.label("id"), func.row_number().over(order_by=text_rank.desc()).label("rnk"))
+        .where(DocumentChunk.knowledge_base_id.in_(kb_ids), content_tsv.op("@@")(tsquery))
+        .order_by(text_rank.desc())
+        .limit(limit)
+        .cte("lexical_ranked")
+    )
+
+    ranks = union_all(
+        select(vector_ranked.c.id, vector_ranked.c.rnk), select(lexical_ranked.c.id, lexical_ranked.c.rnk)
+    ).subquery("ranks")
+    fused = (
+        select(ranks.c.id, func.sum(1.0 / (RRF_K + ranks.c.rnk)).label("rrf")).group_by(ranks.c.id).subquery("fused")
+    )
+
+    return (
+        chunk_projection(distance).join(fused, fused.c.id == DocumentChunk.id).order_by(fused.c.rrf.desc()).limit(limit)
+    )
+
+
+def vector_search(
+    session: Session,
+    query: str,
+    user_id: int,
+    limit: int = 20,
+    hybrid: bool | None = None,
+    stats: dict | None = None,
+) -> list[RetrievedChunk]:
+    """
+    Perform vector search filtered by User's assigned Knowledge Bases.
+    Returns RetrievedChunk results (with cosine distance), best first. `hybrid` (default:
+    settings.HYBRID_SEARCH) also fuses in full-text matches. Plan and timings
+    are reported in `stats` if given.
+    """
+    stats = stats if stats is not None else {}
+    start = time.perf_counter()
+
+    # 1. Get User's Knowledge Bases
+    kb_ids = get_user_kb_ids(session, user_id)
+
+    # If no KBs assigned, they see nothing.
+    if not kb_ids:
+        stats["plan"] = "no_kbs"
+        return []
+
+    # 2. Generate query embedding (no context rather than a search with a meaningless vector)
+    try:
+        query_embedding = get_query_embedding(query)
+    except EmbeddingError:
+        stats["plan"] = "embedding_failed"
+        return []
+
+    # 3. SQLModel Query with PGVector & Filtering
+    use_hybrid = settings.HYBRID_SEARCH if hybrid is None else hybrid
+    results = search_chunks(session, query_embedding, kb_ids, limit, query if use_hybrid else None, stats)
+    stats["latency_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    return results
 
 
-def rag_pipeline(session: Session, query: str, user_id: int) -> list[DocumentChunk]:
-    """Full RAG Pipeline: Retrieval + Reranking."""
+def rag_pipeline(session: Session, query: str, user_id: int, stats: dict | None = None) -> list[RetrievedChunk]:
+    """Full RAG Pipeline: Retrieval + context selection."""
     # 1. Retrieve candidates
-    candidates = vector_search(session, query, user_id, limit=20)
+    candidates = vector_search(session, query, user_id, limit=20, stats=stats)
+
+    # 2. Select: relevance cutoff, rerank and MMR diversity
+    return select_context(session, query, candidates, top_k=5, stats=stats)
+
+
+# --- Async retrieval (used by the streaming chat endpoint) ---
+def _run_in_session(fn, *args):
+    """Run `fn(session, *args)` with a short-lived session. Sessions are not thread-safe."""
+    with Session(engine) as session:
+        return fn(session, *args)
+
+
+async def aget_user_kb_ids(user_id: int) -> list[int]:
+    """get_user_kb_ids without blocking the event loop (cache hits skip the DB entirely)."""
+    return await asyncio.to_thread(_run_in_session, get_user_kb_ids, user_id)
+
+
+async def avector_search(
+    query: str, user_id: int, limit: int = 20, hybrid: bool | None = None, stats: dict | None = None
+) -> list[RetrievedChunk]:
+    """
+    Non-blocking vector_search: the embedding call is awaited and the (sync)
+    pgvector queries run in a worker thread, so other streams keep flowing.
+    Returns no chunks (plan "embedding_failed") if the query cannot be embedded.
+    """
+    stats = stats if stats is not None else {}
+    start = time.perf_counter()
+
+    kb_ids = await aget_user_kb_ids(user_id)
+    if not kb_ids:
+        stats["plan"] = "no_kbs"
+        return []
+
+    try:
+        query_embedding = await aget_query_embedding(query)
+    except EmbeddingError:
+        # Answer without knowledge base context rather than search with a meaningless vector
+        stats["plan"] = "embedding_failed"
+        return []
+    use_hybrid = settings.HYBRID_SEARCH if hybrid is None else hybrid
+    results = await asyncio.to_thread(
+        _run_in_session, search_chunks, query_embedding, kb_ids, limit, query if use_hybrid else None, stats
+    )
+    stats["latency_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    return results
 
-    # 2. Rerank
-    final_results = rerank_documents(query, candidates, top_k=5)
 
-    return final_results
+async def arag_pipeline(query: str, user_id: int, stats: dict | None = None) -> list[RetrievedChunk]:
+    """Async Full RAG Pipeline: Retrieval + context selection."""
+    candidates = await avector_search(query, user_id, limit=20, stats=stats)
+    if not candidates:
+        # Nothing to select from: no session or thread needed, but the same stats["selection"] shape
+        return select_context(None, query, [], stats=stats)
+    return await asyncio.to_thread(_run_in_session, select_context, query, candidates, 5, stats)
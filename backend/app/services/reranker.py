@@ -0,0 +1,102 @@
+import re
+from collections import Counter
+
+import numpy as np
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+# Very common English/Spanish words; they would match nearly every chunk in an OR full-text query
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it me my of on or the to was what when where "
+    "which who why with you your al como con cual cuales cuando de del el en es la las lo los mi mis para "
+    "por que qué cuál cuáles cómo dónde cuándo se su sus un una y".split()
+)
+
+
+def tokenize(text: str) -> list[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def query_terms(text: str) -> list[str]:
+    """Distinct, non-stopword query tokens in order of appearance."""
+    return [term for term in dict.fromkeys(tokenize(text)) if term not in STOPWORDS]
+
+
+def bm25_scores(query: str, documents: list[str], k1: float = 1.5, b: float = 0.75) -> np.ndarray:
+    """
+    BM25 score of each document for the query, with IDF computed over the
+    given documents only (the retrieved candidate set, not the whole corpus).
+    """
+    terms = list(dict.fromkeys(tokenize(query)))
+    if not documents or not terms:
+        return np.zeros(len(documents), dtype=np.float64)
+
+    doc_tokens = [tokenize(doc) for doc in documents]
+    lengths = np.array([len(tokens) for tokens in doc_tokens], dtype=np.float64)
+
+    # (n_docs, n_query_terms) term-frequency matrix
+    tf = np.zeros((len(documents), len(terms)), dtype=np.float64)
+    for row, tokens in enumerate(doc_tokens):
+        counts = Counter(tokens)
+        tf[row] = [counts.get(term, 0) for term in terms]
+
+    n_docs = len(documents)
+    df = np.count_nonzero(tf, axis=0)
+    idf = np.log1p((n_docs - df + 0.5) / (df + 0.5))
+
+    avg_len = lengths.mean() or 1.0
+    norm = k1 * (1 - b + b * lengths / avg_len)
+    return ((tf * (k1 + 1)) / (tf + norm[:, None]) * idf).sum(axis=1)
+
+
+def _min_max(values: np.ndarray) -> np.ndarray:
+    span = values.max() - values.min()
+    if span <= 0:
+        return np.zeros_like(values)
+    return (values - values.min()) / span
+
+
+def fuse_scores(query: str, documents: list[str], distances: list[float], lexical_weight: float = 0.3) -> np.ndarray:
+    """
+    Fused relevance of each candidate: a convex mix of min-max normalised
+    vector similarity (1 - cosine distance) and BM25. Higher is better.
+    """
+    similarity = 1.0 - np.asarray(distances, dtype=np.float64)
+    lexical = bm25_scores(query, documents)
+    return (1 - lexical_weight) * _min_max(similarity) + lexical_weight * _min_max(lexical)
+
+
+def mmr_select(
+    relevance: np.ndarray,
+    embeddings: np.ndarray,
+    k: int,
+    lambda_: float = 0.7,
+    max_similarity: float = 1.0,
+) -> list[int]:
+    """
+    Maximal Marginal Relevance: pick up to k candidates, each maximising
+    lambda * relevance - (1 - lambda) * (max cosine similarity to the ones
+    already picked). Candidates more similar than `max_similarity` to a picked
+    one are near-copies and never picked. Returns indices in pick order.
+    """
+    n = len(relevance)
+    if n == 0 or k <= 0:
+        return []
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = vectors / np.where(norms > 0, norms, 1.0)
+    similarity = vectors @ vectors.T  # (n, n), one matrix product for the whole selection
+
+    relevance = np.asarray(relevance, dtype=np.float64)
+    redundancy = np.zeros(n)  # max similarity to any picked candidate
+    available = np.ones(n, dtype=bool)
+    picked: list[int] = []
+    while len(picked) < k and available.any():
+        scores = np.where(available, lambda_ * relevance - (1 - lambda_) * redundancy, -np.inf)
+        best = int(np.argmax(scores))
+        picked.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, similarity[best])
+        available &= similarity[best] < max_similarity
+    return picked
@@ -0,0 +1,28 @@
+class RetrievedChunk:
+    """
+    Lean, session-independent retrieval result: just what the reranker, the
+    LLM prompt and the sources list need. Built from a column projection
+    (chunk + document title), so the embedding is never fetched and no
+    lazy relationship loads happen after retrieval.
+    """
+
+    __slots__ = ("chunk_id", "document_id", "title", "content", "chunk_index", "distance")
+
+    def __init__(
+        self,
+        chunk_id: int,
+        document_id: int,
+        title: str | None,
+        content: str | None,
+        chunk_index: int | None,
+        distance: float,
+    ):
+        self.chunk_id = chunk_id
+        self.document_id = document_id
+        self.title = title or "unknown"
+        self.content = content or ""
+        self.chunk_index = chunk_index
+        self.distance = float(distance)
+
+    def __repr__(self) -> str:
+        return f"RetrievedChunk(chunk_id={self.chunk_id}, title={self.title!r}, distance={self.distance:.4f})"
@@ -0,0 +1,278 @@
+"""
+In-process exact vector index for small Knowledge Bases.
+
+Each KB snapshot is a directory holding a float16 (see VECTOR_INDEX_DTYPE)
+matrix of unit-normalised chunk embeddings (`vectors.npy`) and the matching
+chunk ids (`ids.npy`), both memory-mapped so every worker process shares the
+same page-cache pages, plus `meta.json` with the KB's content_version at build
+time. Chunk contents and titles are not part of the snapshot: the top-k hits
+of a search are read from the database by primary key. `kb_<id>` is a symlink
+to the current snapshot directory; refreshing builds a new directory and swaps
+the symlink atomically, so readers always see a consistent snapshot.
+
+Builds and drops of a KB's snapshot are serialized across processes with a
+file lock (`kb_<id>.lock`), so workers refreshing the same KB take turns
+instead of racing on the swap, and the directory a swap replaces is always
+deleted. At startup a KB whose snapshot was built at its current
+knowledge_bases.content_version (bumped on every document change, see
+answer_cache.invalidate_kb_answers) is not rebuilt, so only the first worker
+does the work.
+"""
+
+import contextlib
+import fcntl
+import glob
+import json
+import logging
+import os
+import shutil
+import threading
+import uuid
+from collections.abc import Iterator
+
+import numpy as np
+from sqlmodel import Session, func, select
+
+from app.config import settings
+from app.database import engine
+from app.models import Document, DocumentChunk, KnowledgeBase
+from app.services.retrieved_chunk import RetrievedChunk
+
+logger = logging.getLogger(__name__)
+
+# Rows converted to float32 per matmul block; bounds the temporary copy per query
+_BLOCK_ROWS = 4096
+
+
+class KBSnapshot:
+    def __init__(self, path: str, vectors: np.ndarray, chunk_ids: np.ndarray, meta: dict):
+        self.path = path
+        self.vectors = vectors
+        self.chunk_ids = chunk_ids
+        self.content_version: int | None = meta.get("content_version")
+
+    def __len__(self) -> int:
+        return len(self.chunk_ids)
+
+    def similarities(self, query: np.ndarray) -> np.ndarray:
+        """Cosine similarity of every chunk with a unit-norm float32 query."""
+        if self.vectors.dtype == np.float32:
+            return np.asarray(self.vectors @ query)
+        out = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), _BLOCK_ROWS):
+            block = np.asarray(self.vectors[start : start + _BLOCK_ROWS], dtype=np.float32)
+            out[start : start + len(block)] = block @ query
+        return out
+
+
+_loaded: dict[int, KBSnapshot] = {}
+_lock = threading.Lock()
+
+
+def _link_path(kb_id: int) -> str:
+    return os.path.join(settings.VECTOR_INDEX_DIR, f"kb_{kb_id}")
+
+
+def load_snapshot(kb_id: int) -> KBSnapshot | None:
+    """Current snapshot for a KB, reloaded when another process has swapped in a newer one."""
+    try:
+        path = os.path.realpath(_link_path(kb_id), strict=True)
+    except OSError:
+        _loaded.pop(kb_id, None)
+        return None
+
+    snapshot = _loaded.get(kb_id)
+    if snapshot and snapshot.path == path:
+        return snapshot
+
+    with _lock:
+        try:
+            with open(os.path.join(path, "meta.json")) as f:
+                meta = json.load(f)
+            # An empty array cannot be memory-mapped
+            mmap_mode = "r" if meta["chunks"] else None
+            vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode=mmap_mode)
+            chunk_ids = np.load(os.path.join(path, "ids.npy"), mmap_mode=mmap_mode)
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Vector index snapshot for KB {kb_id} unreadable: {e}")
+            return None
+        snapshot = KBSnapshot(path, vectors, chunk_ids, meta)
+        _loaded[kb_id] = snapshot
+        return snapshot
+
+
+def _hydrate(session: Session, hits: list[tuple[int, float]]) -> list[RetrievedChunk]:
+    """RetrievedChunks for (chunk id, distance) hits, in hit order; chunks deleted since the snapshot are skipped."""
+    rows = session.exec(
+        select(
+            DocumentChunk.id,
+            DocumentChunk.document_id,
+            Document.title,
+            DocumentChunk.content,
+            DocumentChunk.chunk_index,
+        )
+        .join(Document)
+        .where(DocumentChunk.id.in_([chunk_id for chunk_id, _ in hits]))
+    ).all()
+    by_id = {row[0]: row for row in rows}
+    return [RetrievedChunk(*by_id[chunk_id], distance) for chunk_id, distance in hits if chunk_id in by_id]
+
+
+def search(
+    session: Session, query_embedding: list[float], kb_ids: list[int], limit: int
+) -> list[RetrievedChunk] | None:
+    """
+    Exact top-k over the snapshots of all given KBs, best first; only the hits
+    are read from the database. Returns None if any KB has no snapshot, so the
+    caller falls back to pgvector.
+    """
+    snapshots = [load_snapshot(kb_id) for kb_id in kb_ids]
+    if any(snapshot is None for snapshot in snapshots):
+        return None
+
+    query = np.asarray(query_embedding, dtype=np.float32)
+    norm = np.linalg.norm(query)
+    if norm == 0:
+        return None
+    query /= norm
+
+    sims = [snapshot.similarities(query) for snapshot in snapshots]
+    owners = np.concatenate([np.full(len(s), i, dtype=np.intp) for i, s in enumerate(snapshots)])
+    rows = np.concatenate([np.arange(len(s), dtype=np.intp) for s in snapshots])
+    scores = np.concatenate(sims) if sims else np.empty(0, dtype=np.float32)
+    if not len(scores):
+        return []
+
+    k = min(limit, len(scores))
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top], kind="stable")]
+    return _hydrate(session, [(int(snapshots[owners[i]].chunk_ids[rows[i]]), 1.0 - float(scores[i])) for i in top])
+
+
+@contextlib.contextmanager
+def _build_lock(kb_id: int) -> Iterator[None]:
+    """Exclusive per-KB lock shared by all processes using VECTOR_INDEX_DIR (released on close)."""
+    os.makedirs(settings.VECTOR_INDEX_DIR, exist_ok=True)
+    with open(os.path.join(settings.VECTOR_INDEX_DIR, f"kb_{kb_id}.lock"), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+
+def _remove_stale_dirs(kb_id: int) -> None:
+    """Delete snapshot directories of a KB other than the current one (left by crashed builds). Call under the lock."""
+    link = _link_path(kb_id)
+    current = os.path.realpath(link) if os.path.islink(link) else None
+    for path in glob.glob(os.path.join(settings.VECTOR_INDEX_DIR, f"kb_{kb_id}.*")):
+        if os.path.islink(path):
+            os.unlink(path)  # temporary link of an interrupted swap
+        elif os.path.isdir(path) and path != current:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def _drop_snapshot(kb_id: int) -> None:
+    link = _link_path(kb_id)
+    if os.path.islink(link):
+        target = os.path.realpath(link)
+        os.unlink(link)
+        shutil.rmtree(target, ignore_errors=True)
+    _loaded.pop(kb_id, None)
+
+
+def drop_snapshot(kb_id: int) -> None:
+    with _build_lock(kb_id):
+        _drop_snapshot(kb_id)
+
+
+def build_snapshot(session: Session, kb_id: int, force: bool = True) -> bool:
+    """
+    (Re)build the snapshot of one KB from document_chunks. KBs larger than
+    VECTOR_INDEX_MAX_CHUNKS are not snapshotted (and any old snapshot is dropped).
+    Without `force`, a snapshot built at the KB's current content_version is
+    kept as is. Returns whether the KB has a snapshot.
+    """
+    with _build_lock(kb_id):
+        return _build_snapshot(session, kb_id, force)
+
+
+def _build_snapshot(session: Session, kb_id: int, force: bool) -> bool:
+    # Read before the rows: rows committed after this read carry a newer version and trigger another build
+    chunk_count = select(func.count(DocumentChunk.id)).where(DocumentChunk.knowledge_base_id == kb_id).scalar_subquery()
+    kb = session.exec(select(KnowledgeBase.content_version, chunk_count).where(KnowledgeBase.id == kb_id)).first()
+    if kb is None or kb[1] > settings.VECTOR_INDEX_MAX_CHUNKS:
+        _drop_snapshot(kb_id)
+        return False
+    content_version = kb[0]
+
+    if not force:
+        current = load_snapshot(kb_id)
+        if current is not None and current.content_version == content_version:
+            return True
+    _remove_stale_dirs(kb_id)
+
+    rows = session.exec(
+        select(DocumentChunk.id, DocumentChunk.embedding)
+        .where(DocumentChunk.knowledge_base_id == kb_id)
+        .order_by(DocumentChunk.id)
+    ).all()
+
+    snapshot_dir = os.path.join(settings.VECTOR_INDEX_DIR, f"kb_{kb_id}.{uuid.uuid4().hex}")
+    os.makedirs(snapshot_dir)
+    try:
+        vectors = np.lib.format.open_memmap(
+            os.path.join(snapshot_dir, "vectors.npy"),
+            mode="w+",
+            dtype=np.dtype(settings.VECTOR_INDEX_DTYPE),
+            shape=(len(rows), 1024),
+        )
+        for i, (_, embedding) in enumerate(rows):
+            vector = np.asarray(embedding, dtype=np.float32)
+            norm = np.linalg.norm(vector)
+            vectors[i] = vector / norm if norm else vector
+        vectors.flush()
+        del vectors
+        np.save(os.path.join(snapshot_dir, "ids.npy"), np.array([row[0] for row in rows], dtype=np.int64))
+
+        with open(os.path.join(snapshot_dir, "meta.json"), "w") as f:
+            json.dump({"chunks": len(rows), "content_version": content_version}, f)
+    except BaseException:
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+        raise
+
+    # Atomic swap: readers resolve the symlink once and get either the old or the new snapshot
+    link = _link_path(kb_id)
+    old_target = os.path.realpath(link) if os.path.islink(link) else None
+    tmp_link = f"{snapshot_dir}.link"
+    os.symlink(snapshot_dir, tmp_link)
+    os.replace(tmp_link, link)
+    if old_target and old_target != snapshot_dir:
+        # Processes that still have the old matrix mapped keep their pages until they reload
+        shutil.rmtree(old_target, ignore_errors=True)
+
+    logger.info(f"Vector index snapshot for KB {kb_id}: {len(rows)} chunks")
+    return True
+
+
+def refresh_kb(kb_id: int | None, force: bool = True) -> None:
+    """Rebuild one KB's snapshot in its own session (safe to run as a background task)."""
+    if not settings.VECTOR_INDEX_ENABLED or kb_id is None:
+        return
+    try:
+        with Session(engine) as session:
+            build_snapshot(session, kb_id, force)
+    except Exception as e:
+        logger.error(f"Failed to refresh vector index for KB {kb_id}: {e}")
+        drop_snapshot(kb_id)
+
+
+def refresh_all() -> None:
+    """Snapshot every small KB whose snapshot is missing or out of date (run at startup by every worker)."""
+    if not settings.VECTOR_INDEX_ENABLED:
+        return
+    try:
+        with Session(engine) as session:
+            kb_ids = session.exec(select(KnowledgeBase.id)).all()
+    except Exception as e:
+        logger.error(f"Failed to list KBs for vector index: {e}")
+        return
+    for kb_id in kb_ids:
+        refresh_kb(kb_id, force=False)
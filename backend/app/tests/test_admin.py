@@ -6,6 +6,8 @@ These tests verify:
 2. Mutation endpoints return 403 in PROD mode
 """
 
+import pytest
+
 from app.routers.admin import censor_email
 
 
@@ -81,3 +83,169 @@ def test_check_demo_mode_mutation_exists():
     from app.routers.admin import check_demo_mode_mutation
 
     assert callable(check_demo_mode_mutation)
+
+
+# --- Ingestion, purge and archive endpoints ---
+@pytest.fixture
+def admin_client(mocker):
+    """TestClient logged in as an admin, with a mocked DB session (returned alongside)."""
+    from fastapi.testclient import TestClient
+
+    from app.auth import get_current_user
+    from app.database import get_session
+    from app.main import app
+    from app.models import User
+
+    session = mocker.Mock()
+    admin = User(id=1, email="admin@bank.com", hashed_password="x", role="admin", status="active")
+    app.dependency_overrides[get_session] = lambda: session
+    app.dependency_overrides[get_current_user] = lambda: admin
+    yield TestClient(app), session
+    app.dependency_overrides.clear()
+
+
+def _spooled(mocker, tmp_path):
+    """Patch spool_upload to write into tmp_path; returns the spool file path."""
+    from app.routers import admin
+
+    path = tmp_path / "spooled"
+
+    async def spool(file):
+        path.write_bytes(await file.read())
+        return str(path)
+
+    mocker.patch.object(admin, "spool_upload", side_effect=spool)
+    return path
+
+
+def test_upload_document_queues_job(admin_client, mocker, tmp_path):
+    """Uploads are accepted with 202 and the id of the queued ingestion job."""
+    from app.models import IngestionJob
+    from app.routers import admin
+
+    client, session = admin_client
+    path = _spooled(mocker, tmp_path)
+    enqueue = mocker.patch.object(admin.ingestion_jobs, "enqueue", return_value=IngestionJob(id=7, document_id=3))
+
+    response = client.post(
+        "/admin/documents/upload", files={"file": ("policy.pdf", b"%PDF-")}, data={"knowledge_base_id": "2"}
+    )
+
+    assert response.status_code == 202
+    assert response.json()["job_id"] == 7
+    doc, spool_path, is_pdf, user_id = enqueue.call_args.args[1:]
+    assert (doc.knowledge_base_id, doc.type, spool_path, is_pdf, user_id) == (2, "pdf", str(path), True, 1)
+
+
+def test_ingestion_job_list_status_and_retry(admin_client, mocker, tmp_path):
+    """Jobs can be listed and inspected; only failed jobs whose upload still exists can be retried."""
+    from app.models import IngestionJob
+    from app.routers import admin
+
+    client, session = admin_client
+    notify = mocker.patch.object(admin.ingestion_jobs, "notify")
+    spool = tmp_path / "upload"
+    spool.write_text("text")
+    job = IngestionJob(id=5, document_id=3, filename="a.txt", file_path=str(spool), status="failed", error="boom")
+    session.exec.return_value.all.return_value = [job]
+    session.get.return_value = job
+
+    assert [entry["id"] for entry in client.get("/admin/ingestion/jobs?status=failed").json()] == [5]
+    assert client.get("/admin/ingestion/jobs/5").json()["status"] == "failed"
+
+    response = client.post("/admin/ingestion/jobs/5/retry")
+    assert response.status_code == 200
+    assert (response.json()["status"], response.json()["error"]) == ("queued", None)
+    notify.assert_called_once()
+
+    assert client.post("/admin/ingestion/jobs/5/retry").status_code == 400  # now queued
+
+    job.status = "failed"
+    spool.unlink()
+    assert client.post("/admin/ingestion/jobs/5/retry").status_code == 410
+
+    session.get.return_value = None
+    assert client.get("/admin/ingestion/jobs/6").status_code == 404
+
+
+def test_replace_document_conflicts_with_active_job(admin_client, mocker, tmp_path):
+    """A document still being ingested cannot be replaced; otherwise a replace job is queued."""
+    from app.models import Document, IngestionJob
+    from app.routers import admin
+
+    client, session = admin_client
+    _spooled(mocker, tmp_path)
+    enqueue = mocker.patch.object(admin.ingestion_jobs, "enqueue", return_value=IngestionJob(id=9, document_id=3))
+    session.get.return_value = Document(id=3, title="old.txt", user_id=1)
+
+    session.exec.return_value.first.return_value = 8
+    response = client.put("/admin/documents/3", files={"file": ("new.txt", b"text")})
+    assert response.status_code == 409
+    enqueue.assert_not_called()
+
+    session.exec.return_value.first.return_value = None
+    response = client.put("/admin/documents/3", files={"file": ("new.txt", b"text")})
+    assert (response.status_code, response.json()["job_id"]) == (202, 9)
+    assert enqueue.call_args.kwargs == {"replace": True, "filename": "new.txt"}
+
+
+def test_purge_and_delete_kb_run_in_background(admin_client, mocker):
+    """Purges return 202 and run afterwards; deleting a KB unassigns its users first."""
+    from app.models import KnowledgeBase
+    from app.routers import admin
+
+    client, session = admin_client
+    purge_documents = mocker.patch.object(admin.purge, "purge_documents")
+    purge_kb = mocker.patch.object(admin.purge, "purge_knowledge_base")
+    invalidate = mocker.patch.object(admin, "invalidate_user_kbs")
+
+    response = client.post("/admin/documents/purge", json={"document_ids": [4, 5, 4]})
+    assert (response.status_code, response.json()["doc_ids"]) == (202, [4, 5])
+    purge_documents.assert_called_once_with([4, 5])
+
+    session.get.return_value = KnowledgeBase(id=2, name="Cards", is_default=True)
+    assert client.post("/admin/knowledge_bases/2/purge").status_code == 202
+    purge_kb.assert_called_once_with(2)
+
+    purge_kb.reset_mock()
+    assert client.delete("/admin/knowledge_bases/2").status_code == 202
+    purge_kb.assert_called_once_with(2, True)
+    invalidate.assert_called_once_with()
+    assert session.get.return_value.is_default is False
+
+    session.get.return_value = None
+    assert client.delete("/admin/knowledge_bases/2").status_code == 404
+
+
+def test_kb_export_and_import(admin_client, mocker, tmp_path):
+    """Exports stream the archive; imports create the KB, reject taken names and clean up the spool file."""
+    from app.models import KnowledgeBase
+    from app.routers import admin
+
+    client, session = admin_client
+    session.get.return_value = KnowledgeBase(id=2, name="Cards")
+    mocker.patch.object(admin.kb_archive, "export_kb", return_value=iter([b"tar", b"ball"]))
+
+    response = client.get("/admin/knowledge_bases/2/export")
+    assert response.status_code == 200
+    assert response.content == b"tarball"
+    assert 'filename="kb-2.tar"' in response.headers["content-disposition"]
+    assert client.get("/admin/knowledge_bases/2/export?dtype=int8").status_code == 400
+
+    path = _spooled(mocker, tmp_path)
+    manifest = {"knowledge_base": {"name": "Cards", "description": None}, "documents": 3}
+    mocker.patch.object(admin.kb_archive, "read_manifest", return_value=manifest)
+    load = mocker.patch.object(admin, "_import_kb_archive")
+
+    session.exec.return_value.first.return_value = 2
+    response = client.post("/admin/knowledge_bases/import", files={"file": ("kb.tar", b"tar")})
+    assert response.status_code == 409
+    assert not path.exists()
+    load.assert_not_called()
+
+    session.exec.return_value.first.return_value = None
+    session.refresh.side_effect = lambda kb: setattr(kb, "id", 11)
+    response = client.post("/admin/knowledge_bases/import", files={"file": ("kb.tar", b"tar")}, data={"name": "Copy"})
+    assert response.status_code == 202
+    assert response.json() == {"status": "importing", "kb_id": 11, "name": "Copy", "documents": 3}
+    load.assert_called_once_with(str(path), 11, 1, False)
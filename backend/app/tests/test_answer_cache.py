@@ -0,0 +1,53 @@
+def test_semantic_answer_cache_threshold_kb_scope_and_invalidation():
+    """Near-duplicate questions hit within the same KB set; document changes in a KB drop its answers."""
+    from app.services.answer_cache import SemanticAnswerCache
+    from app.services.local_embedder import LocalEmbedder
+
+    embedder = LocalEmbedder()
+    cache = SemanticAnswerCache(threshold=0.8, maxsize=2, ttl=60)
+    question, paraphrase, other = embedder.encode(
+        ["What is the daily transfer limit?", "what is the daily transfer limit", "How do I close my savings account?"]
+    ).tolist()
+
+    cache.store(question, [1, 2], {"response": "10,000 EUR"})
+    hit = cache.lookup(paraphrase, [2, 1])
+    assert hit["response"] == "10,000 EUR" and hit["similarity"] >= 0.8
+    assert cache.lookup(other, [1, 2]) is None
+    assert cache.lookup(paraphrase, [1]) is None  # different KB set, different documents
+
+    cache.invalidate_kb(2)
+    assert cache.lookup(paraphrase, [1, 2]) is None
+    assert cache.stats()["hits"] == 1
+
+
+def test_answers_using_web_search_are_not_cacheable():
+    from app.services.answer_cache import is_cacheable
+
+    answer = {"response": "ok", "reasoning_data": {"steps": [{"action": "thought"}, {"action": "answer"}]}}
+    searched = {"response": "ok", "reasoning_data": {"steps": [{"action": "search"}, {"action": "answer"}]}}
+    assert is_cacheable(answer)
+    assert not is_cacheable(searched)
+    assert not is_cacheable({"response": "", "reasoning_data": {"steps": []}})
+
+
+def test_answer_cache_respects_kb_content_versions():
+    """An answer built before a KB changed is not stored, and other workers drop answers of older versions."""
+    from app.services.answer_cache import SemanticAnswerCache
+    from app.services.local_embedder import LocalEmbedder
+
+    question = LocalEmbedder().encode(["What is the daily transfer limit?"])[0].tolist()
+    worker_a = SemanticAnswerCache(threshold=0.8)
+    worker_b = SemanticAnswerCache(threshold=0.8)
+
+    # Worker A reads version 3, a document changes (version 4) while the answer is generated
+    assert worker_a.lookup(question, [1], {1: 3}) is None
+    worker_a.invalidate_kb(1, version=4)
+    assert worker_a.store(question, [1], {"response": "old limit"}, {1: 3}) is False
+    assert worker_a.lookup(question, [1], {1: 4}) is None
+
+    # Worker B cached the answer at version 3 and never saw the invalidation; the version read at lookup does
+    assert worker_b.store(question, [1], {"response": "old limit"}, {1: 3})
+    assert worker_b.lookup(question, [1], {1: 3})["response"] == "old limit"
+    assert worker_b.lookup(question, [1], {1: 4}) is None
+    assert worker_b.store(question, [1], {"response": "new limit"}, {1: 4})
+    assert worker_b.lookup(question, [1], {1: 4})["response"] == "new limit"
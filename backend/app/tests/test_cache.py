@@ -0,0 +1,23 @@
+def test_ttl_cache_lru_eviction_and_counters():
+    """The cache evicts the least recently used key and counts hits/misses."""
+    from app.services.cache import TTLCache
+
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # 'a' is now most recently used
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"]) == (2, 1, 1)
+
+
+def test_ttl_cache_expiry():
+    """Expired entries are reported as misses."""
+    from app.services.cache import TTLCache
+
+    cache = TTLCache(maxsize=10, ttl=-1)
+    cache.set("a", 1)
+    assert cache.get("a") is None
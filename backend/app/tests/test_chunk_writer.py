@@ -0,0 +1,39 @@
+def test_chunk_writer_binary_copy_encoding():
+    """Rows are encoded in PostgreSQL binary COPY format with pgvector's binary vector layout."""
+    import struct
+    from datetime import datetime
+
+    import numpy as np
+
+    from app.services.chunk_writer import COPY_COLUMNS, encode_rows
+
+    row = {
+        "document_id": 7,
+        "knowledge_base_id": None,
+        "content": "límite",
+        "embedding": np.array([0.5, -1.0, 2.0], dtype=np.float32),
+        "chunk_index": 3,
+        "chunk_metadata": {"tokens": 2},
+        "created_at": datetime(2000, 1, 1, 0, 0, 1),
+    }
+    payload = encode_rows([row])
+
+    assert payload.startswith(b"PGCOPY\n\xff\r\n\x00") and payload.endswith(struct.pack("!h", -1))
+    body = memoryview(payload)[19:-2]
+    assert struct.unpack_from("!h", body, 0)[0] == len(COPY_COLUMNS)
+
+    fields, offset = [], 2
+    for _ in COPY_COLUMNS:
+        (length,) = struct.unpack_from("!i", body, offset)
+        offset += 4
+        fields.append(None if length == -1 else bytes(body[offset : offset + length]))
+        offset += max(length, 0)
+
+    document_id, kb_id, content, vector, chunk_index, metadata, created_at = fields
+    assert struct.unpack("!i", document_id)[0] == 7 and kb_id is None
+    assert content.decode("utf-8") == "límite"
+    assert struct.unpack("!hh", vector[:4]) == (3, 0)
+    assert np.frombuffer(vector[4:], dtype=">f4").tolist() == [0.5, -1.0, 2.0]
+    assert struct.unpack("!i", chunk_index)[0] == 3
+    assert metadata == b'\x01{"tokens": 2}'
+    assert struct.unpack("!q", created_at)[0] == 1_000_000
@@ -0,0 +1,45 @@
+def test_chunker_respects_token_budget_boundaries_and_overlap():
+    """Chunks stay within the token target, end on sentence boundaries and repeat the previous tail."""
+    from app.services.chunker import chunk_text, count_tokens
+
+    text = "Intro paragraph.\n\n" + " ".join(f"Rule {i} applies to transfers." for i in range(30))
+    chunks = chunk_text(text, target_tokens=40, overlap_tokens=10)
+
+    assert len(chunks) > 1
+    assert all(chunk.tokens <= 40 and chunk.tokens == count_tokens(chunk.text) for chunk in chunks)
+    assert all(chunk.text.endswith(".") for chunk in chunks)
+    assert chunks[0].text.startswith("Intro paragraph.\n\nRule 0")
+    # The last sentence of each chunk opens the next one
+    for previous, current in zip(chunks, chunks[1:], strict=False):
+        assert current.text.startswith(previous.text.rsplit(". ", 1)[-1])
+
+    assert chunk_text("   \n\n ") == []
+    assert [chunk.tokens for chunk in chunk_text("x" * 2000, target_tokens=100)] == [100] * 5
+
+
+def test_chunker_hard_splits_punctuation_heavy_runs():
+    """Unbroken runs dense in punctuation are cut by token count, so no chunk exceeds the target."""
+    from app.services.chunker import chunk_text, count_tokens
+
+    dotted = "|".join(f"{i:03d}" for i in range(400))  # a table row without spaces, ~800 tokens
+    text = f"Rates: {dotted} https://bank.example/{'a/b?c=d&' * 60} and more words here."
+    chunks = chunk_text(text, target_tokens=100, overlap_tokens=10)
+
+    assert all(chunk.tokens <= 100 for chunk in chunks)
+    assert "".join(chunk.text for chunk in chunks).count("|") == dotted.count("|")
+    assert sum(count_tokens(chunk.text) for chunk in chunks) >= count_tokens(text)
+
+
+def test_chunker_drops_chunks_without_word_characters():
+    """Rules and symbol tables from PDFs yield no chunk, and no zero vector downstream."""
+    from app.services.chunker import iter_chunks
+
+    blocks = [
+        "Daily transfer limit is 5000 EUR.",
+        "-" * 400 + "\n\n" + "| * | * |\n" * 60,
+        "Fees are listed in annex B.",
+    ]
+    chunks = list(iter_chunks(blocks, target_tokens=40, overlap_tokens=0))
+
+    assert chunks and all(any(c.isalnum() for c in chunk.text) for chunk in chunks)
+    assert chunks[0].text.startswith("Daily") and chunks[-1].text.endswith("annex B.")
@@ -0,0 +1,24 @@
+def test_context_packer_merges_dedupes_and_respects_budget():
+    """Adjacent chunks merge without their overlap, duplicates are dropped and the budget cuts at a sentence."""
+    from app.services.chunker import chunk_text, count_tokens
+    from app.services.context_packer import pack_context
+    from app.services.retrieved_chunk import RetrievedChunk
+
+    text = " ".join(f"Rule {i} says transfers above {i}000 EUR need a second approval." for i in range(12))
+    pieces = chunk_text(text, target_tokens=60, overlap_tokens=20)
+    assert len(pieces) >= 3
+    chunks = [RetrievedChunk(10 + i, 1, "rules.pdf", piece.text, i, 0.1 * i) for i, piece in enumerate(pieces)]
+    duplicate = RetrievedChunk(99, 2, "copy.pdf", pieces[0].text, 0, 0.05)
+
+    # Most relevant first: chunk 1, chunk 0, then a copy of chunk 0 from another document
+    packed = pack_context([chunks[1], chunks[0], duplicate], budget=1000)
+    assert [c.chunk_id for c in packed.chunks] == [11, 10] and packed.dropped == 1
+    assert packed.text.startswith("[rules.pdf]\n") and "copy.pdf" not in packed.text
+    passage = packed.text.removeprefix("[rules.pdf]\n")
+    assert passage.startswith(pieces[0].text) and passage.endswith(pieces[1].text)
+    assert len(passage) < len(pieces[0].text) + len(pieces[1].text)  # the overlap appears once
+    assert packed.tokens == count_tokens(packed.text)
+
+    tight = pack_context(chunks, budget=100)
+    assert tight.tokens <= 100 and tight.dropped > 0
+    assert tight.text.rstrip().endswith(".")
@@ -0,0 +1,88 @@
+def test_streaming_ingestion_batches_inserts(mocker, tmp_path):
+    """Text files are decoded incrementally (latin-1 fallback) and chunks are inserted in fixed-size batches."""
+    from app.models import Document
+    from app.services import ingestion
+
+    path = tmp_path / "doc.txt"
+    path.write_bytes("\n\n".join(f"Cláusula {i}. El límite diario es {i} EUR." for i in range(200)).encode("latin-1"))
+    mocker.patch.object(ingestion.settings, "INGEST_BATCH_CHUNKS", 4)
+    mocker.patch.object(ingestion.settings, "CHUNK_TARGET_TOKENS", 40)
+    mocker.patch.object(ingestion, "embed_chunks", side_effect=lambda session, texts: [[0.0]] * len(texts))
+    copy = mocker.patch.object(ingestion, "copy_chunks")
+    session = mocker.Mock()
+
+    count = ingestion.ingest_file(session, Document(id=3, knowledge_base_id=9), str(path), is_pdf=False)
+
+    batches = [call.args[1] for call in copy.call_args_list]
+    assert count == sum(len(rows) for rows in batches) > 4
+    assert all(len(rows) <= 4 for rows in batches)
+    rows = [row for batch in batches for row in batch]
+    assert [row["chunk_index"] for row in rows] == list(range(count))
+    assert rows[0]["knowledge_base_id"] == 9 and rows[0]["content"].startswith("Cláusula 0.")
+    session.commit.assert_not_called()
+
+
+def test_ingestion_resumes_after_last_committed_chunk(mocker):
+    """A resumed job skips the chunks it already committed and continues the chunk_index sequence."""
+    from app.models import Document
+    from app.services import ingestion
+
+    mocker.patch.object(ingestion.settings, "INGEST_BATCH_CHUNKS", 2)
+    mocker.patch.object(ingestion, "embed_chunks", side_effect=lambda session, texts: [[0.0]] * len(texts))
+    pages = [f"Page {i}. " + "Account rules apply here. " * 30 for i in range(4)]
+    doc = Document(id=1, knowledge_base_id=1)
+
+    copy = mocker.patch.object(ingestion, "copy_chunks")
+    progress = []
+    total = ingestion.ingest_chunks(mocker.Mock(), doc, pages, on_batch=progress.append)
+    assert progress[-1] == total and progress == sorted(progress)
+    full_rows = [row for call in copy.call_args_list for row in call.args[1]]
+
+    copy.reset_mock()
+    assert ingestion.ingest_chunks(mocker.Mock(), doc, pages, start=progress[0]) == total
+    resumed_rows = [row for call in copy.call_args_list for row in call.args[1]]
+    assert resumed_rows == full_rows[progress[0] :]
+
+
+def test_replace_document_only_writes_changed_chunks(mocker):
+    """Re-ingesting a new version keeps unchanged chunks (and their ids), inserts new ones and deletes the rest."""
+    from collections import defaultdict, deque
+
+    from app.models import Document
+    from app.services import ingestion
+    from app.services.chunker import chunk_text
+    from app.services.rag import content_hash
+
+    mocker.patch.object(ingestion.settings, "CHUNK_TARGET_TOKENS", 20)
+    mocker.patch.object(ingestion.settings, "CHUNK_OVERLAP_TOKENS", 0)
+    embed = mocker.patch.object(ingestion, "embed_chunks", side_effect=lambda session, texts: [[0.0]] * len(texts))
+    copy = mocker.patch.object(ingestion, "copy_chunks", side_effect=lambda session, rows: len(rows))
+
+    old = [f"Section {i}. The transfer limit for plan {i} is {i * 100} EUR per day." for i in range(6)]
+    stored = defaultdict(deque)
+    for index, chunk in enumerate(chunk_text("\n\n".join(old))):
+        stored[content_hash(chunk.text)].append((100 + index, index))
+    mocker.patch.object(ingestion, "_existing_chunk_hashes", return_value=stored)
+
+    # New version: a section prepended, section 2 edited, section 5 removed
+    new = (
+        ["Preface. Rates and limits were revised in March of this year."]
+        + old[:2]
+        + [old[2].replace("200", "250")]
+        + old[3:5]
+    )
+    session = mocker.Mock()
+    stats = ingestion.replace_chunks(session, Document(id=1, knowledge_base_id=2), ["\n\n".join(new)])
+
+    assert stats == {"kept": 4, "moved": 4, "inserted": 2, "deleted": 2, "chunks": 6}
+    assert [call.args[1] for call in embed.call_args_list] == [[new[0], new[3]]]
+    assert [row["chunk_index"] for row in copy.call_args.args[1]] == [0, 3]
+    update_call, delete_call = session.execute.call_args_list
+    assert update_call.args[1] == [
+        {"id": 100, "chunk_index": 1},
+        {"id": 101, "chunk_index": 2},
+        {"id": 103, "chunk_index": 4},
+        {"id": 104, "chunk_index": 5},
+    ]
+    assert sorted(delete_call.args[0].compile().params.values())[0] == [102, 105]
+    session.commit.assert_not_called()
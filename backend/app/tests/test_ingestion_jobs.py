@@ -0,0 +1,83 @@
+def test_run_job_stops_without_committing_once_its_claim_is_lost(mocker, tmp_path):
+    """A batch is only committed while the worker's attempt is the job's current claim."""
+    from app.models import Document, IngestionJob
+    from app.services import ingestion_jobs
+
+    path = tmp_path / "upload.txt"
+    path.write_text("Transfer limits apply.")
+    job = IngestionJob(id=5, document_id=3, filename="a.txt", file_path=str(path), is_pdf=False, attempts=2)
+    session = mocker.MagicMock()
+    session.get.side_effect = [job, Document(id=3, knowledge_base_id=9)]
+    session.execute.return_value.rowcount = 0  # another worker re-claimed the job (attempt 3)
+    mocker.patch.object(ingestion_jobs, "Session").return_value.__enter__.return_value = session
+    mocker.patch.object(ingestion_jobs, "ingest_chunks", side_effect=lambda s, d, b, m, start, on_batch: on_batch(4))
+    refresh = mocker.patch.object(ingestion_jobs.vector_index, "refresh_kb")
+
+    ingestion_jobs.run_job(5, 2)
+
+    (statement,) = [call.args[0] for call in session.execute.call_args_list]
+    assert "attempts" in str(statement) and statement.compile().params["attempts_1"] == 2
+    session.rollback.assert_called_once()
+    session.commit.assert_not_called()
+    refresh.assert_not_called()
+    assert path.exists()
+
+
+def test_heartbeat_runs_on_a_timer_and_notices_a_lost_claim(mocker):
+    from app.services import ingestion_jobs
+
+    mocker.patch.object(ingestion_jobs.settings, "INGEST_HEARTBEAT_SECONDS", 0.01)
+    session = mocker.MagicMock()
+    # The first beat still owns the job, the second finds it re-claimed
+    session.execute.side_effect = [mocker.Mock(rowcount=1), mocker.Mock(rowcount=0)]
+    mocker.patch.object(ingestion_jobs, "Session").return_value.__enter__.return_value = session
+
+    heartbeat = ingestion_jobs._Heartbeat(5, 2)
+    heartbeat.start()
+    try:
+        assert heartbeat.lost.wait(2)
+    finally:
+        heartbeat.stop()
+    assert session.execute.call_count == 2 and session.commit.call_count == 1
+
+
+def test_run_job_fails_clearly_when_the_spooled_upload_is_gone(mocker, tmp_path):
+    from app.models import Document, IngestionJob
+    from app.services import ingestion_jobs
+
+    job = IngestionJob(id=5, document_id=3, filename="a.txt", file_path=str(tmp_path / "gone.txt"), attempts=1)
+    session = mocker.MagicMock()
+    session.get.side_effect = [job, Document(id=3, knowledge_base_id=9)]
+    session.execute.return_value.rowcount = 1
+    mocker.patch.object(ingestion_jobs, "Session").return_value.__enter__.return_value = session
+    ingest = mocker.patch.object(ingestion_jobs, "ingest_chunks")
+    mocker.patch.object(ingestion_jobs.vector_index, "refresh_kb")
+    mocker.patch.object(ingestion_jobs.kb_indexes, "sync_kb_hnsw_index")
+    mocker.patch.object(ingestion_jobs, "invalidate_kb_answers")
+
+    ingestion_jobs.run_job(5, 1)
+
+    ingest.assert_not_called()
+    values = session.execute.call_args.args[0].compile().params
+    assert values["status"] == "failed" and "upload the document again" in values["error"]
+    session.commit.assert_called_once()
+
+
+def test_notify_from_a_threadpool_thread_wakes_the_workers_loop(mocker):
+    """Sync routes call notify() off the event loop; the wakeup is handed to the loop thread."""
+    import asyncio
+    import threading
+
+    from app.services import ingestion_jobs
+
+    async def scenario():
+        mocker.patch.object(ingestion_jobs, "_wakeup", asyncio.Event())
+        mocker.patch.object(ingestion_jobs, "_loop", asyncio.get_running_loop())
+        set_on = []
+        mocker.patch.object(ingestion_jobs._wakeup, "set", side_effect=lambda: set_on.append(threading.get_ident()))
+
+        await asyncio.to_thread(ingestion_jobs.notify)
+        await asyncio.sleep(0)
+        return set_on
+
+    assert asyncio.run(scenario()) == [threading.get_ident()]
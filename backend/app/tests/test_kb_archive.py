@@ -0,0 +1,73 @@
+def test_kb_archive_round_trip(mocker, tmp_path):
+    """An exported KB re-imports with remapped document ids and float16 vectors, without re-embedding."""
+    import numpy as np
+
+    from app.models import Document, KnowledgeBase
+    from app.services import kb_archive
+
+    mocker.patch.object(kb_archive.settings, "KB_ARCHIVE_BLOCK_CHUNKS", 2)
+    rng = np.random.default_rng(1)
+    vectors = rng.standard_normal((3, kb_archive.EMBEDDING_DIM)).astype(np.float32)
+    rows = [(10 + i, 7, i, f"Chunk {i} about card fees", {"tokens": 5}, vectors[i]) for i in range(3)]
+
+    source = mocker.MagicMock()
+    source.__enter__.return_value = source
+    source.get.return_value = KnowledgeBase(id=1, name="Fees", description="Card fees")
+    source.exec.side_effect = [
+        [Document(id=7, title="fees.pdf", type="pdf", user_id=1)],
+        mocker.Mock(all=lambda: rows[:2]),
+        mocker.Mock(all=lambda: rows[2:]),
+        mocker.Mock(all=lambda: []),
+    ]
+    mocker.patch.object(kb_archive, "Session", return_value=source)
+    archive = tmp_path / "kb.tar"
+    archive.write_bytes(b"".join(kb_archive.export_kb(1)))
+
+    assert kb_archive.read_manifest(str(archive))["knowledge_base"]["name"] == "Fees"
+    chunk_query = str(source.exec.call_args_list[1].args[0])
+    assert "document_chunks.embedding IS NOT NULL" in chunk_query  # NULL embeddings would import as zero vectors
+
+    target = mocker.MagicMock()
+    target.__enter__.return_value = target
+    target.add_all.side_effect = lambda docs: [setattr(doc, "id", 70 + i) for i, doc in enumerate(docs)]
+    mocker.patch.object(kb_archive, "Session", return_value=target)
+    copy = mocker.patch.object(kb_archive, "copy_chunks", side_effect=lambda session, rows: len(rows))
+    mocker.patch.object(kb_archive, "vector_index")
+    mocker.patch.object(kb_archive, "kb_indexes")
+    invalidate_answers = mocker.patch.object(kb_archive, "invalidate_kb_answers")
+
+    assert kb_archive.import_kb(str(archive), kb_id=5, user_id=2) == 3
+    invalidate_answers.assert_called_once_with(5)
+    imported = [row for call in copy.call_args_list for row in call.args[1]]
+    assert [len(call.args[1]) for call in copy.call_args_list] == [2, 1]
+    assert {row["document_id"] for row in imported} == {70} and {row["knowledge_base_id"] for row in imported} == {5}
+    assert [row["content"] for row in imported] == [row[3] for row in rows]
+    assert imported[0]["chunk_metadata"] == {"tokens": 5}
+    np.testing.assert_allclose(np.array([row["embedding"] for row in imported]), vectors, atol=2e-3)
+
+
+def test_failed_import_purges_before_restoring_only_a_dropped_global_index(mocker, tmp_path):
+    """The full-corpus HNSW rebuild runs only for an index the import dropped, after the partial load is gone."""
+    import pytest
+
+    from app.services import kb_archive
+
+    archive = tmp_path / "broken.tar"
+    archive.write_bytes(b"not a tar archive")
+    calls = mocker.Mock()
+    mocker.patch.object(kb_archive, "_set_global_index", calls.set_global_index)
+    mocker.patch.object(kb_archive.purge, "purge_knowledge_base", calls.purge)
+    invalidate_answers = mocker.patch.object(kb_archive, "invalidate_kb_answers")
+
+    calls.set_global_index.return_value = True
+    with pytest.raises(kb_archive.tarfile.TarError):
+        kb_archive.import_kb(str(archive), kb_id=5, user_id=2, defer_global_index=True)
+    assert [call[0] for call in calls.mock_calls] == ["set_global_index", "purge", "set_global_index"]
+    assert calls.set_global_index.call_args_list == [mocker.call(False), mocker.call(True)]
+
+    calls.reset_mock()
+    calls.set_global_index.return_value = False  # no global index to begin with
+    with pytest.raises(kb_archive.tarfile.TarError):
+        kb_archive.import_kb(str(archive), kb_id=5, user_id=2, defer_global_index=True)
+    calls.set_global_index.assert_called_once_with(False)
+    invalidate_answers.assert_not_called()
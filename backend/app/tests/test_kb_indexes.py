@@ -0,0 +1,38 @@
+def test_index_builds_reset_maintenance_work_mem_on_the_pooled_connection(mocker):
+    """The session-level SET must not outlive the build, even when the build fails."""
+    import pytest
+
+    from app.services import kb_indexes
+
+    connection = mocker.Mock()
+    connection.execute.side_effect = [None, RuntimeError("canceling statement"), None]
+
+    with pytest.raises(RuntimeError):
+        kb_indexes.create_index(connection, "CREATE INDEX CONCURRENTLY ix ON document_chunks (id)")
+
+    statements = [str(call.args[0]) for call in connection.execute.call_args_list]
+    assert statements[0].startswith("SET maintenance_work_mem") and statements[2] == "RESET maintenance_work_mem"
+
+
+def test_quantization_trigger_only_installed_in_quantized_modes(mocker):
+    """With "none" the trigger is dropped and the full-precision index built; quantized modes get the trigger."""
+    from app.services import kb_indexes
+
+    connection = mocker.MagicMock()
+    connection.execute.return_value.first.return_value = (1,)  # trigger installed by an earlier migration
+    engine = mocker.patch.object(kb_indexes, "engine")
+    engine.connect.return_value.execution_options.return_value.__enter__.return_value = connection
+
+    mocker.patch.object(kb_indexes.settings, "EMBEDDING_QUANTIZATION", "none")
+    kb_indexes.sync_quantization_mode()
+    statements = [str(call.args[0]) for call in connection.execute.call_args_list]
+    assert "DROP TRIGGER IF EXISTS trg_chunks_quantize ON document_chunks" in statements
+    assert any("CONCURRENTLY IF NOT EXISTS idx_chunks_embedding_hnsw" in s for s in statements)
+
+    connection.reset_mock()
+    connection.execute.return_value.first.return_value = None
+    mocker.patch.object(kb_indexes.settings, "EMBEDDING_QUANTIZATION", "binary")
+    kb_indexes.sync_quantization_mode()
+    statements = [str(call.args[0]) for call in connection.execute.call_args_list]
+    assert any("CREATE TRIGGER trg_chunks_quantize" in s for s in statements)
+    assert not any("CREATE INDEX" in s for s in statements)
@@ -0,0 +1,70 @@
+def test_final_answer_streams_deltas(mocker):
+    """Action replies are buffered; the final answer is forwarded as deltas while the model generates it."""
+    import asyncio
+
+    from langchain_core.messages import AIMessageChunk
+
+    from app.services import llm
+
+    log = []
+    replies = [
+        ['{"thought": "check KB", ', '"action": "plan", "todo": ["[ ] KB"]}'],
+        ["The daily", " limit is", " **5000 EUR**", "."],
+    ]
+
+    class FakeModel:
+        async def astream(self, messages):
+            for piece in replies.pop(0):
+                log.append(f"model:{piece}")
+                yield AIMessageChunk(content=piece)
+
+    mocker.patch.object(llm, "llm", FakeModel())
+    mocker.patch.object(llm, "record_token_usage")
+    llm.api_call_timestamps.clear()
+
+    async def run():
+        events = []
+        async for event in llm.generate_response_stream("What is the daily limit?"):
+            events.append(event)
+            if event["type"] == "delta":
+                log.append(f"delta:{event['content']}")
+        return events
+
+    events = asyncio.run(run())
+    deltas = [event["content"] for event in events if event["type"] == "delta"]
+    assert deltas == ["The daily", " limit is", " **5000 EUR**", "."]
+    assert events[-1]["type"] == "answer" and events[-1]["response"] == "".join(deltas)
+    # The first delta is forwarded before the model produced the rest of the answer
+    assert log.index("delta:The daily") < log.index("model: limit is")
+    assert not any(entry.startswith("delta:{") for entry in log)
+
+
+def test_streamed_text_replaced_when_it_turns_out_to_be_a_json_answer(mocker):
+    """Text that ends in a JSON answer action is reset on the client and replaced by the extracted answer."""
+    import asyncio
+
+    from langchain_core.messages import AIMessageChunk
+
+    from app.services import llm
+
+    pieces = ["Sure, here it is: ", '{"action": "answer", ', '"content": "The daily limit is 5000 EUR."}']
+
+    class FakeModel:
+        async def astream(self, messages):
+            for piece in pieces:
+                yield AIMessageChunk(content=piece)
+
+    mocker.patch.object(llm, "llm", FakeModel())
+    mocker.patch.object(llm, "record_token_usage")
+    llm.api_call_timestamps.clear()
+
+    async def run():
+        return [event async for event in llm.generate_response_stream("What is the daily limit?")]
+
+    events = [event for event in asyncio.run(run()) if event["type"] in ("delta", "delta_reset", "answer")]
+    shown = ""
+    for event in events[:-1]:
+        shown = shown + event["content"] if event["type"] == "delta" else ""
+    assert events[0] == {"type": "delta", "content": "Sure, here it is: "}
+    assert events[-3:-1] == [{"type": "delta_reset"}, {"type": "delta", "content": "The daily limit is 5000 EUR."}]
+    assert shown == events[-1]["response"] == "The daily limit is 5000 EUR."
@@ -0,0 +1,33 @@
+def test_local_embedder_is_deterministic_and_batched():
+    """Same text -> same unit vector, whether embedded alone or in a batch."""
+    import numpy as np
+
+    from app.services.local_embedder import LocalEmbedder
+
+    embedder = LocalEmbedder(dim=1024)
+    batch = embedder.encode(["transfer limit for savings accounts", "mortgage interest rates"])
+    single = LocalEmbedder(dim=1024).encode(["transfer limit for savings accounts"])
+
+    assert batch.shape == (2, 1024)
+    np.testing.assert_allclose(batch[0], single[0])
+    np.testing.assert_allclose(np.linalg.norm(batch, axis=1), 1.0, rtol=1e-5)
+
+
+def test_local_embedder_similarity_tracks_shared_vocabulary():
+    """A paraphrase sharing vocabulary scores higher than an unrelated text."""
+    from app.services.local_embedder import LocalEmbedder
+
+    query, related, unrelated = LocalEmbedder().encode(
+        ["daily transfer limit", "What is the daily limit for a transfer?", "Branch opening hours on holidays"]
+    )
+    assert query @ related > query @ unrelated
+
+
+def test_local_embedder_refuses_text_without_word_tokens():
+    """A zero vector would make every cosine distance to it NaN, so featureless text is an error."""
+    import pytest
+
+    from app.services.local_embedder import LocalEmbedder
+
+    with pytest.raises(ValueError, match="No embeddable tokens"):
+        LocalEmbedder().encode(["Transfer fees", "----- | ----- | *** "])
@@ -0,0 +1,22 @@
+def test_parallel_pdf_extraction_keeps_page_order(mocker, tmp_path):
+    """Large PDFs are extracted as page ranges in a pool and reassembled in page order."""
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    from app.services import pdf_extract
+
+    path = tmp_path / "big.pdf"
+    path.write_bytes(b"x" * 100)
+    mocker.patch.object(pdf_extract.settings, "PDF_PARALLEL_MIN_BYTES", 10)
+    mocker.patch.object(pdf_extract.settings, "PDF_EXTRACT_PROCESSES", 3)
+    mocker.patch.object(pdf_extract.settings, "PDF_PAGES_PER_TASK", 4)
+    mocker.patch.object(pdf_extract, "page_count", return_value=23)
+
+    def extract_range(path, start, stop):
+        time.sleep(0.001 * (23 - start))  # earlier ranges finish last
+        return [f"page {i}" for i in range(start, stop)]
+
+    mocker.patch.object(pdf_extract, "extract_range", side_effect=extract_range)
+    with ThreadPoolExecutor(3) as pool:
+        mocker.patch.object(pdf_extract, "_get_pool", return_value=pool)
+        assert list(pdf_extract.iter_pages(str(path))) == [f"page {i}" for i in range(23)]
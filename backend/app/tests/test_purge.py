@@ -0,0 +1,16 @@
+def test_purge_deletes_chunks_in_bounded_batches(mocker):
+    """Chunks are deleted by id in LIMITed batches, one commit per batch, until a short batch."""
+    from sqlalchemy.dialects import postgresql
+
+    from app.models import DocumentChunk
+    from app.services import purge
+
+    mocker.patch.object(purge.settings, "PURGE_BATCH_CHUNKS", 1000)
+    session = mocker.Mock()
+    session.execute.side_effect = [mocker.Mock(rowcount=n) for n in (1000, 1000, 37)]
+
+    assert purge._delete_chunk_batches(session, DocumentChunk.knowledge_base_id == 4) == 2037
+    assert session.commit.call_count == 3
+    sql = str(session.execute.call_args.args[0].compile(dialect=postgresql.dialect()))
+    assert sql.startswith("DELETE FROM document_chunks WHERE document_chunks.id IN (SELECT document_chunks.id")
+    assert "LIMIT" in sql and "embedding" not in sql
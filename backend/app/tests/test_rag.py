@@ -10,3 +10,329 @@ def test_chat_requires_auth():
     response = client.post("/chat", json={"query": "test"})
     # Should return 401 Unauthorized without auth token
     assert response.status_code == 401
+
+
+class _FakeEmbedClient:
+    """Stand-in for voyageai.Client that encodes each text's position in its vector."""
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def embed(self, texts, model=None, input_type=None):
+        from types import SimpleNamespace
+
+        self.batch_sizes.append(len(texts))
+        return SimpleNamespace(embeddings=[[float(t.split(":")[1])] for t in texts])
+
+
+def test_embed_texts_batches_and_preserves_order():
+    """Batched embedding should respect the batch size and return vectors in input order."""
+    from app.services.rag import embed_texts
+
+    client = _FakeEmbedClient()
+    texts = [f"chunk:{i}" for i in range(10)]
+    vectors = embed_texts(texts, client=client, batch_size=3, max_concurrency=4)
+
+    assert vectors == [[float(i)] for i in range(10)]
+    assert sorted(client.batch_sizes) == [1, 3, 3, 3]
+
+
+def test_embed_texts_empty_input():
+    """No texts means no provider calls."""
+    from app.services.rag import embed_texts
+
+    client = _FakeEmbedClient()
+    assert embed_texts([], client=client) == []
+    assert client.batch_sizes == []
+
+
+def test_embed_texts_retries_then_raises(mocker):
+    """A failing batch is retried, and raises instead of returning placeholder vectors once retries run out."""
+    from types import SimpleNamespace
+
+    import pytest
+
+    from app.services import rag
+
+    mocker.patch.object(rag.settings, "EMBEDDING_RETRIES", 2)
+    sleep = mocker.patch.object(rag.time, "sleep")
+    client = mocker.Mock()
+    client.embed.side_effect = [TimeoutError("slow"), SimpleNamespace(embeddings=[[1.0]])]
+    assert rag.embed_texts(["a"], client=client) == [[1.0]]
+    sleep.assert_called_once()
+
+    client.embed.side_effect = TimeoutError("down")
+    client.embed.reset_mock()
+    with pytest.raises(rag.EmbeddingError):
+        rag.embed_texts(["a"], client=client)
+    assert client.embed.call_count == 3
+
+
+def test_normalize_query_for_cache_key():
+    """Case and whitespace differences map to the same cache key."""
+    from app.services.rag import normalize_query
+
+    assert normalize_query("  What is the   Transfer LIMIT ") == "what is the transfer limit"
+
+
+def test_embed_chunks_only_embeds_unknown_texts(mocker):
+    """Stored vectors are reused; only new, de-duplicated texts hit the embedder."""
+    from app.services import rag
+
+    session = mocker.Mock()
+    session.exec.return_value.all.return_value = [(rag.content_hash("known"), [1.0])]
+    embed = mocker.patch.object(rag, "embed_texts", return_value=[[2.0]])
+
+    vectors = rag.embed_chunks(session, ["known", "new", "new"])
+
+    embed.assert_called_once_with(["new"])
+    assert vectors == [[1.0], [2.0], [2.0]]
+
+
+def test_embed_chunks_writes_new_vectors_in_bounded_batches(mocker):
+    """A large document's misses are stored in several INSERTs, each well under the bind-parameter limit."""
+    from app.services import rag
+
+    mocker.patch.object(rag, "_CHUNK_EMBEDDING_BATCH", 4)
+    session = mocker.Mock()
+    session.exec.return_value.all.return_value = []
+    mocker.patch.object(rag, "embed_texts", side_effect=lambda texts: [[float(i)] for i in range(len(texts))])
+
+    assert len(rag.embed_chunks(session, [f"chunk {i}" for i in range(10)])) == 10
+
+    assert session.exec.call_count == 3
+    inserts = [call.args[0].compile().params for call in session.execute.call_args_list]
+    assert [sum(key.startswith("content_hash") for key in params) for params in inserts] == [4, 4, 2]
+
+
+def test_concurrent_chat_retrievals_overlap(mocker):
+    """Simultaneous async retrievals run concurrently instead of blocking the event loop in turn."""
+    import asyncio
+    import time
+
+    from app.services import rag
+
+    delay = 0.1
+
+    def slow_db_call(fn, *args):
+        time.sleep(delay)  # blocking DB round trip, offloaded to a worker thread
+        return [1] if fn is rag.get_user_kb_ids else []
+
+    async def slow_embedding(query):
+        await asyncio.sleep(delay)  # network round trip to the embedding provider
+        return [0.1] * rag.EMBEDDING_DIM
+
+    mocker.patch.object(rag, "_run_in_session", side_effect=slow_db_call)
+    mocker.patch.object(rag, "aget_query_embedding", side_effect=slow_embedding)
+
+    async def run_chats(n):
+        return await asyncio.gather(*(rag.arag_pipeline(f"question {i}", i) for i in range(n)))
+
+    chats = 8
+    start = time.perf_counter()
+    results = asyncio.run(run_chats(chats))
+    elapsed = time.perf_counter() - start
+
+    assert len(results) == chats
+    serialized = chats * 3 * delay
+    assert elapsed < serialized / 2
+
+
+def test_select_context_applies_cutoff_and_mmr(mocker):
+    """Far candidates are cut, near-copies of a selected chunk are skipped, and nothing relevant means no context."""
+    import numpy as np
+
+    from app.services import rag
+    from app.services.retrieved_chunk import RetrievedChunk
+
+    mocker.patch.object(rag.settings, "RETRIEVAL_MAX_DISTANCE", 0.5)
+    mocker.patch.object(rag.settings, "RETRIEVAL_RELATIVE_GAP", 0.2)
+    mocker.patch.object(rag.settings, "MMR_LAMBDA", 0.7)
+    mocker.patch.object(rag.settings, "MMR_DUPLICATE_SIMILARITY", 0.95)
+    best = RetrievedChunk(1, 1, "a.pdf", "Daily transfer limit is 5000 EUR.", 0, 0.10)
+    copy = RetrievedChunk(2, 2, "b.pdf", "The daily transfer limit is 5000 EUR.", 0, 0.11)
+    other = RetrievedChunk(3, 1, "a.pdf", "International transfers take two days.", 4, 0.20)
+    gap = RetrievedChunk(4, 3, "c.pdf", "Card fees are listed in annex B.", 0, 0.35)  # beyond best + gap
+    vectors = {1: [1.0, 0.0, 0.0], 2: [0.99, 0.05, 0.0], 3: [0.6, 0.8, 0.0]}
+    fetch = mocker.patch.object(
+        rag, "get_chunk_embeddings", side_effect=lambda session, ids: np.array([vectors[i] for i in ids])
+    )
+
+    stats = {}
+    selected = rag.select_context(None, "daily transfer limit", [best, copy, other, gap], top_k=5, stats=stats)
+    assert [chunk.chunk_id for chunk in selected] == [1, 3]
+    assert fetch.call_args.args[1] == [1, 2, 3]
+    assert stats["selection"] == {"candidates": 4, "relevant": 3, "best_distance": 0.1, "selected": 2}
+
+    far = RetrievedChunk(5, 3, "c.pdf", "Unrelated.", 0, 0.8)
+    assert rag.select_context(None, "daily transfer limit", [far], stats=stats) == []
+    assert stats["selection"]["selected"] == 0
+
+
+def test_user_kb_ids_cached_until_invalidated(mocker):
+    """KB membership is read once per user until invalidate_user_kbs is called."""
+    from app.services import rag
+
+    rag.invalidate_user_kbs()
+    session = mocker.Mock()
+    session.exec.return_value.all.return_value = [1, 2]
+
+    assert rag.get_user_kb_ids(session, 42) == [1, 2]
+    assert rag.get_user_kb_ids(session, 42) == [1, 2]
+    assert session.exec.call_count == 1
+
+    rag.invalidate_user_kbs(42)
+    rag.get_user_kb_ids(session, 42)
+    assert session.exec.call_count == 2
+
+
+def test_select_context_without_mmr_reranks_by_fused_score(mocker):
+    """A slightly farther chunk with an exact term match can overtake the nearest one."""
+    from app.services import rag
+    from app.services.retrieved_chunk import RetrievedChunk
+
+    mocker.patch.object(rag.settings, "RERANK_LEXICAL_WEIGHT", 0.5)
+    mocker.patch.object(rag.settings, "RETRIEVAL_MAX_DISTANCE", 1.0)
+    mocker.patch.object(rag.settings, "RETRIEVAL_RELATIVE_GAP", 1.0)
+    mocker.patch.object(rag.settings, "MMR_LAMBDA", 1.0)
+    rerank = mocker.spy(rag, "rerank_documents")
+    near = RetrievedChunk(1, 1, "Doc", "Overview of transfer products", 0, 0.20)
+    exact = RetrievedChunk(2, 1, "Doc", "Wire transfer limit for code TX-9 is 10,000", 1, 0.22)
+    far = RetrievedChunk(3, 2, "Doc", "Branch opening hours", 0, 0.60)
+
+    assert rag.select_context(None, "TX-9 transfer limit", [near, exact, far], top_k=2) == [exact, near]
+    rerank.assert_called_once()
+
+
+def test_search_plan_exact_for_small_candidate_sets(mocker):
+    """Users whose KBs are small get an exact scan; the plan is reported in stats."""
+    from app.services import rag
+
+    rag.invalidate_kb_chunk_counts()
+    session = mocker.Mock()
+    session.exec.return_value.all.side_effect = [[(1, 120), (2, 80)], []]
+    configure = mocker.patch.object(rag, "configure_hnsw_scan")
+
+    stats = {}
+    rag.search_chunks(session, [0.1] * rag.EMBEDDING_DIM, [1, 2], limit=5, stats=stats)
+
+    assert stats["plan"] == "exact"
+    assert stats["candidates"] == 200
+    assert "search_ms" in stats
+    configure.assert_not_called()
+
+
+def test_search_plan_hnsw_for_large_candidate_sets(mocker):
+    """Large candidate sets use HNSW with a tuned ef_search."""
+    from app.services import rag
+
+    rag.invalidate_kb_chunk_counts()
+    session = mocker.Mock()
+    session.exec.return_value.all.side_effect = [[(3, rag.settings.EXACT_SEARCH_MAX_CHUNKS + 1)], []]
+    mocker.patch.object(rag, "pgvector_version", return_value=(0, 8, 0))
+
+    stats = {}
+    rag.search_chunks(session, [0.1] * rag.EMBEDDING_DIM, [3], limit=20, stats=stats)
+
+    assert stats["plan"] == "hnsw"
+    assert stats["iterative_scan"] is True
+    assert stats["ef_search"] >= 40
+
+
+def test_quantized_search_rescores_oversampled_shortlist(mocker):
+    """With quantization, the ANN scan runs on the quantized column and full vectors re-rank the shortlist."""
+    from sqlalchemy.dialects import postgresql
+    from sqlmodel import select
+
+    from app.services import rag
+
+    mocker.patch.object(rag.settings, "EMBEDDING_QUANTIZATION", "halfvec")
+    mocker.patch.object(rag.settings, "QUANTIZED_SEARCH_OVERSAMPLE", 4)
+    nearest = rag.nearest_chunks([0.1] * rag.EMBEDDING_DIM, [7], limit=5)
+    compiled = select(nearest).compile(dialect=postgresql.dialect())
+    sql = str(compiled)
+
+    assert "document_chunks.embedding_half <=>" in sql
+    assert "document_chunks.embedding <=>" in sql
+    assert 20 in compiled.params.values()
+
+    # Exact scans ignore the quantized copy
+    exact_sql = str(select(rag.nearest_chunks([0.1] * rag.EMBEDDING_DIM, [7], 5, exact=True)).compile())
+    assert "embedding_half" not in exact_sql
+
+
+def test_search_chunks_returns_lean_results_in_one_query(mocker):
+    """Retrieval projects chunk columns + document title (no embedding) and builds RetrievedChunk rows."""
+    from sqlalchemy.dialects import postgresql
+
+    from app.services import rag
+
+    rag.invalidate_kb_chunk_counts()
+    session = mocker.Mock()
+    session.exec.return_value.all.side_effect = [[(1, 10)], [(5, 2, "Policy", "text", 3, 0.12)]]
+
+    results = rag.search_chunks(session, [0.1] * rag.EMBEDDING_DIM, [1], limit=5)
+
+    assert session.exec.call_count == 2  # chunk count + the search itself, no per-chunk loads
+    sql = str(session.exec.call_args.args[0].compile(dialect=postgresql.dialect()))
+    assert "documents.title" in sql
+    assert "document_chunks.embedding," not in sql and "document_chunks.embedding AS" not in sql
+    (chunk,) = results
+    assert (chunk.chunk_id, chunk.document_id, chunk.title, chunk.chunk_index, chunk.distance) == (
+        5,
+        2,
+        "Policy",
+        3,
+        0.12,
+    )
+    assert not hasattr(chunk, "__dict__")
+
+
+def test_failed_query_embedding_is_not_cached_and_yields_no_context(mocker):
+    """A provider error is never cached as a vector; the chat turn gets no context instead of garbage."""
+    import asyncio
+
+    import pytest
+
+    from app.services import rag
+
+    client = mocker.Mock()
+    client.embed = mocker.AsyncMock(side_effect=TimeoutError("down"))
+    mocker.patch.object(rag, "avo_client", client)
+    mocker.patch.object(rag, "aget_user_kb_ids", mocker.AsyncMock(return_value=[1]))
+    search = mocker.patch.object(rag, "_run_in_session")
+    rag.query_embedding_cache.clear()
+
+    with pytest.raises(rag.EmbeddingError):
+        asyncio.run(rag.aget_query_embedding("transfer limit"))
+    assert rag.query_embedding_cache.get((rag.EMBEDDING_MODEL, "transfer limit")) is None
+
+    stats = {}
+    assert asyncio.run(rag.arag_pipeline("transfer limit", 1, stats=stats)) == []
+    assert stats["plan"] == "embedding_failed"
+    # Same stats shape as a turn whose candidates were all cut
+    assert stats["selection"] == {"candidates": 0, "relevant": 0, "selected": 0}
+    search.assert_not_called()
+
+
+def test_embedding_failure_raises_and_sync_search_returns_no_context(mocker):
+    """get_embedding raises instead of returning a placeholder; vector_search then returns no candidates."""
+    import pytest
+
+    from app.services import rag
+
+    client = mocker.Mock()
+    client.embed.side_effect = ConnectionError("down")
+    mocker.patch.object(rag, "embedding_client", client)
+    mocker.patch.object(rag, "get_user_kb_ids", return_value=[1])
+    search = mocker.patch.object(rag, "search_chunks")
+    rag.query_embedding_cache.clear()
+
+    with pytest.raises(rag.EmbeddingError):
+        rag.get_embedding("transfer limit")
+
+    stats = {}
+    assert rag.vector_search(None, "transfer limit", 1, stats=stats) == []
+    assert stats["plan"] == "embedding_failed"
+    assert rag.query_embedding_cache.get((rag.EMBEDDING_MODEL, "transfer limit")) is None
+    search.assert_not_called()
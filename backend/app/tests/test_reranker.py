@@ -0,0 +1,17 @@
+def test_bm25_prefers_documents_with_query_terms():
+    """Lexical scoring ranks the chunk containing the exact product code first."""
+    from app.services.reranker import bm25_scores
+
+    scores = bm25_scores(
+        "fees for account CA-204",
+        ["General information about our branches", "Account CA-204 has no monthly fees", "Savings account rates"],
+    )
+    assert scores.argmax() == 1
+
+
+def test_query_terms_drop_stopwords_for_full_text_search():
+    """Full-text terms keep codes and content words, not filler words."""
+    from app.services.reranker import query_terms
+
+    assert query_terms("What is the limit for CA-204?") == ["limit", "ca", "204"]
+    assert query_terms("¿Cuál es el límite de la cuenta?") == ["límite", "cuenta"]
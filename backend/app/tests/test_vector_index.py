@@ -0,0 +1,84 @@
+def _build(mocker, vector_index, kb_id, rows, version, force=True):
+    """Build a snapshot from (chunk id, embedding) rows at a KB content_version."""
+    session = mocker.Mock()
+    session.exec.return_value.first.return_value = (version, len(rows))
+    session.exec.return_value.all.return_value = rows
+    assert vector_index.build_snapshot(session, kb_id=kb_id, force=force)
+    return session
+
+
+def _db(mocker, rows):
+    """Session answering the hydration query with (id, document_id, title, content, chunk_index) rows."""
+    session = mocker.Mock()
+    session.exec.return_value.all.side_effect = lambda: rows
+    return session
+
+
+def test_vector_index_snapshot_exact_search_and_refresh(mocker, tmp_path):
+    """A KB snapshot answers exact top-k in-process, reads only the hits from the DB, and is swapped on refresh."""
+    import json
+    import os
+
+    import numpy as np
+
+    from app.services import vector_index
+
+    mocker.patch.object(vector_index.settings, "VECTOR_INDEX_DIR", str(tmp_path))
+    basis = np.eye(1024, dtype=np.float32)
+
+    _build(mocker, vector_index, 7, [(1, basis[0]), (2, basis[1] * 3)], version=1)
+    # Contents stay in the database, not in every worker's heap
+    meta = json.loads((tmp_path / "kb_7" / "meta.json").read_text())
+    assert meta == {"chunks": 2, "content_version": 1}
+
+    db = _db(mocker, [(2, 10, "Doc A", "beta", 1)])
+    chunk = vector_index.search(db, basis[1] + 0.1 * basis[0], [7], limit=1)[0]
+    assert (chunk.chunk_id, chunk.content, chunk.title, chunk.chunk_index) == (2, "beta", "Doc A", 1)
+    assert chunk.distance < 0.01
+    assert "document_chunks.id IN" in str(db.exec.call_args.args[0])
+
+    _build(mocker, vector_index, 7, [(3, basis[2])], version=2)
+    results = vector_index.search(_db(mocker, [(3, 11, "Doc B", "gamma", 0)]), basis[2], [7], limit=5)
+    assert [chunk.chunk_id for chunk in results] == [3]
+    # The replaced snapshot directory is deleted; only the current one, its symlink and the lock remain
+    current = os.path.basename(os.readlink(tmp_path / "kb_7"))
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted(["kb_7", "kb_7.lock", current])
+
+    # A hit deleted since the snapshot was built is skipped
+    assert vector_index.search(_db(mocker, []), basis[2], [7], limit=5) == []
+    assert vector_index.search(_db(mocker, []), basis[0], [7, 8], limit=5) is None  # KB 8 has no snapshot
+
+
+def test_vector_index_empty_kb_snapshot(mocker, tmp_path):
+    """A KB without chunks still gets a (non-memory-mapped) snapshot."""
+    from app.services import vector_index
+
+    mocker.patch.object(vector_index.settings, "VECTOR_INDEX_DIR", str(tmp_path))
+    _build(mocker, vector_index, 9, [], version=0)
+    assert vector_index.search(_db(mocker, []), [1.0] * 1024, [9], limit=5) == []
+
+
+def test_vector_index_startup_refresh_keys_on_content_version(mocker, tmp_path):
+    """Without force, a snapshot of the KB's current content_version is kept; any change rebuilds it."""
+    import os
+
+    import numpy as np
+
+    from app.services import vector_index
+
+    mocker.patch.object(vector_index.settings, "VECTOR_INDEX_DIR", str(tmp_path))
+    rows = [(1, np.ones(1024)), (2, np.ones(1024))]
+    session = _build(mocker, vector_index, 4, rows, version=3)
+    snapshot = os.readlink(tmp_path / "kb_4")
+
+    assert vector_index.build_snapshot(session, kb_id=4, force=False)
+    assert os.readlink(tmp_path / "kb_4") == snapshot
+    session.exec.return_value.all.assert_called_once()  # rows were not read again
+
+    # A replace that only moved chunks keeps count and ids, but bumped the version
+    (tmp_path / "kb_4.crashed").mkdir()
+    _build(mocker, vector_index, 4, rows, version=4, force=False)
+    assert os.readlink(tmp_path / "kb_4") != snapshot
+    assert not os.path.exists(snapshot)
+    assert not (tmp_path / "kb_4.crashed").exists()
+    assert vector_index.load_snapshot(4).content_version == 4
@@ -0,0 +1,102 @@
+"""
+Benchmark: ORM adds vs. binary COPY (app/services/chunk_writer.py) for document_chunks.
+
+Without --db it only compares client-side serialization: pgvector's text
+format (what the ORM path sends) vs. the binary COPY payload. With --db it
+inserts the chunks both ways into the configured database inside a
+transaction that is rolled back, so nothing is kept.
+
+Usage:
+    python scripts/bench_chunk_writer.py --chunks 100000
+    python scripts/bench_chunk_writer.py --chunks 100000 --db
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+# Add the parent directory to sys.path
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from pgvector.sqlalchemy import Vector  # noqa: E402
+
+from app.services.chunk_writer import encode_rows  # noqa: E402
+
+
+def make_rows(n: int, document_id: int, kb_id: int | None) -> list[dict]:
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((n, 1024), dtype=np.float32)
+    return [
+        {
+            "document_id": document_id,
+            "knowledge_base_id": kb_id,
+            "content": f"Synthetic chunk {i} about transfer limits and account fees. " * 8,
+            "embedding": vectors[i],
+            "chunk_index": i,
+            "chunk_metadata": {"filename": "bench", "tokens": 120},
+        }
+        for i in range(n)
+    ]
+
+
+def bench_serialization(rows: list[dict]) -> None:
+    to_text = Vector(1024).bind_processor(None)
+    start = time.perf_counter()
+    for row in rows:
+        to_text(row["embedding"])
+    text_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    payload = encode_rows(rows)
+    binary_s = time.perf_counter() - start
+    print(f"vector text formatting   {text_s:7.2f}s")
+    print(f"binary COPY payload      {binary_s:7.2f}s  ({len(payload) / 2**20:.0f} MiB)")
+
+
+def bench_db(n: int) -> None:
+    from sqlmodel import Session, select
+
+    from app.database import engine
+    from app.models import Document, DocumentChunk, User
+    from app.services.chunk_writer import copy_chunks
+
+    with Session(engine) as session:
+        user = session.exec(select(User)).first()
+        doc = Document(title="bench", user_id=user.id)
+        session.add(doc)
+        session.flush()
+        rows = make_rows(n, doc.id, None)
+
+        start = time.perf_counter()
+        for row in rows:
+            session.add(DocumentChunk(**row))
+        session.flush()
+        orm_s = time.perf_counter() - start
+        session.expunge_all()
+
+        start = time.perf_counter()
+        copy_chunks(session, rows)
+        copy_s = time.perf_counter() - start
+        session.rollback()
+
+    print(f"ORM adds    {orm_s:7.2f}s  {n / orm_s:9.0f} rows/s")
+    print(f"binary COPY {copy_s:7.2f}s  {n / copy_s:9.0f} rows/s  (x{orm_s / copy_s:.1f})")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=100_000)
+    parser.add_argument("--db", action="store_true", help="insert into DATABASE_URL (rolled back)")
+    args = parser.parse_args()
+
+    if args.db:
+        bench_db(args.chunks)
+    else:
+        bench_serialization(make_rows(args.chunks, 1, 1))
+
+
+if __name__ == "__main__":
+    main()
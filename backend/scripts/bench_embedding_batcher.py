@@ -0,0 +1,67 @@
+"""
+Benchmark: per-chunk embedding calls vs. the batched embedding pipeline.
+
+Uses a local stand-in for the Voyage client that simulates network latency,
+so it runs offline and without spending API credits.
+
+Usage:
+    python scripts/bench_embedding_batcher.py --chunks 2000 --latency-ms 80
+"""
+
+import argparse
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+# Add the parent directory to sys.path
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from app.services.rag import EMBEDDING_DIM, embed_texts  # noqa: E402
+
+
+class StandInEmbedder:
+    """Mimics voyageai.Client.embed: fixed round-trip latency plus a small per-text cost."""
+
+    def __init__(self, latency_ms: float, per_text_ms: float):
+        self.latency = latency_ms / 1000
+        self.per_text = per_text_ms / 1000
+        self.calls = 0
+
+    def embed(self, texts, model=None, input_type=None):
+        self.calls += 1
+        time.sleep(self.latency + self.per_text * len(texts))
+        return SimpleNamespace(embeddings=[[0.0] * EMBEDDING_DIM for _ in texts])
+
+
+def run(chunks: int, latency_ms: float, per_text_ms: float):
+    texts = [f"Chunk {i}: transfer limits and fees for savings accounts. " * 8 for i in range(chunks)]
+
+    # Before: one request per chunk (previous upload_document_to_kb behaviour)
+    client = StandInEmbedder(latency_ms, per_text_ms)
+    start = time.perf_counter()
+    for text in texts:
+        client.embed([text], model="voyage-2", input_type="document")
+    before = time.perf_counter() - start
+    before_calls = client.calls
+
+    # After: batched + bounded concurrency
+    client = StandInEmbedder(latency_ms, per_text_ms)
+    start = time.perf_counter()
+    vectors = embed_texts(texts, client=client)
+    after = time.perf_counter() - start
+    assert len(vectors) == len(texts)
+
+    print(f"📊 {chunks} chunks, {latency_ms:.0f} ms simulated round trip")
+    print(f"   Sequential: {before:7.2f}s  {chunks / before:9.1f} chunks/s  ({before_calls} calls)")
+    print(f"   Batched:    {after:7.2f}s  {chunks / after:9.1f} chunks/s  ({client.calls} calls)")
+    print(f"   Speedup:    {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=1000)
+    parser.add_argument("--latency-ms", type=float, default=80.0)
+    parser.add_argument("--per-text-ms", type=float, default=0.2)
+    args = parser.parse_args()
+    run(args.chunks, args.latency_ms, args.per_text_ms)
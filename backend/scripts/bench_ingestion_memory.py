@@ -0,0 +1,162 @@
+"""
+Benchmark: peak Python memory of the old in-memory upload path vs. the
+streaming ingestion pipeline (app/services/ingestion.py) on a large
+synthetic PDF.
+
+Embeddings come from the local hashing embedder and rows are COPYed into a
+stand-in session that discards them, so this measures extraction/chunking/
+batching memory only and runs without a database or API key.
+
+Usage:
+    python scripts/bench_ingestion_memory.py --pages 2000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+# Add the parent directory to sys.path
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from app.services import ingestion  # noqa: E402
+from app.services.chunker import chunk_text  # noqa: E402
+from app.services.local_embedder import LocalEmbedder  # noqa: E402
+
+PARAGRAPH = (
+    "Transfers above the daily limit of {n} EUR require a second approval. "
+    "Customers can raise the limit in the mobile app under Settings, Limits. "
+    "International transfers settle within two business days."
+)
+
+
+def write_synthetic_pdf(path: str, pages: int, lines_per_page: int = 45) -> None:
+    """Minimal uncompressed PDF with one Helvetica text stream per page, written incrementally."""
+    offsets = []
+
+    with open(path, "wb") as f:
+
+        def obj(number: int, body: bytes) -> None:
+            offsets.append((number, f.tell()))
+            f.write(f"{number} 0 obj\n".encode() + body + b"\nendobj\n")
+
+        f.write(b"%PDF-1.4\n")
+        obj(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        kids = " ".join(f"{4 + 2 * i} 0 R" for i in range(pages))
+        obj(2, f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode())
+        obj(3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+        for i in range(pages):
+            lines = [PARAGRAPH.format(n=i * lines_per_page + j)[:95] for j in range(lines_per_page)]
+            text = " T* ".join(f"({line})'" for line in lines)
+            stream = f"BT /F1 9 Tf 11 TL 40 800 Td {text} ET".encode()
+            obj(
+                4 + 2 * i,
+                f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 3 0 R >> >> "
+                f"/Contents {5 + 2 * i} 0 R >>".encode(),
+            )
+            obj(5 + 2 * i, f"<< /Length {len(stream)} >>\nstream\n".encode() + stream + b"\nendstream")
+
+        xref = f.tell()
+        offsets.sort()
+        f.write(f"xref\n0 {len(offsets) + 1}\n0000000000 65535 f \n".encode())
+        for _, offset in offsets:
+            f.write(f"{offset:010d} 00000 n \n".encode())
+        f.write(f"trailer\n<< /Size {len(offsets) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+
+
+class DiscardCursor:
+    """psycopg2-style cursor whose COPY drains the payload and drops it."""
+
+    def __init__(self, session: "DiscardSession"):
+        self.session = session
+
+    def copy_expert(self, statement, stream, size=1 << 16):
+        while block := stream.read(size):
+            self.session.copied_bytes += len(block)
+        self.session.copies += 1
+
+    def close(self):
+        pass
+
+
+class DiscardSession:
+    """Stands in for the Session used by chunk_writer.copy_chunks; COPY payloads are counted and dropped."""
+
+    def __init__(self):
+        self.copies = 0
+        self.copied_bytes = 0
+
+    def flush(self):
+        pass
+
+    def execute(self, statement, params=None):
+        return SimpleNamespace(scalar=lambda: "jsonb")  # document_chunks.metadata type lookup
+
+    def connection(self):
+        cursor = DiscardCursor(self)
+        return SimpleNamespace(connection=SimpleNamespace(dbapi_connection=SimpleNamespace(cursor=lambda: cursor)))
+
+
+def fake_embed_chunks(session, texts):
+    return LocalEmbedder().encode(texts).tolist()
+
+
+def legacy_ingest(path: str) -> int:
+    """The previous upload path: whole file in memory, += per page, all chunks and vectors at once."""
+    import io
+
+    from PyPDF2 import PdfReader
+
+    with open(path, "rb") as f:
+        file_bytes = f.read()
+    content = ""
+    for page in PdfReader(io.BytesIO(file_bytes)).pages:
+        page_text = page.extract_text()
+        if page_text:
+            content += page_text + "\n"
+    chunks = chunk_text(content)
+    embeddings = fake_embed_chunks(None, [chunk.text for chunk in chunks])
+    rows = [
+        {"content": chunk.text, "embedding": embedding} for chunk, embedding in zip(chunks, embeddings, strict=True)
+    ]
+    return len(rows)
+
+
+def streaming_ingest(path: str) -> int:
+    doc = ingestion.Document(id=1, title="bench", knowledge_base_id=1)
+    session = DiscardSession()
+    chunks = ingestion.ingest_file(session, doc, path, is_pdf=True)
+    assert session.copies and session.copied_bytes
+    return chunks
+
+
+def measure(label: str, fn, path: str) -> None:
+    tracemalloc.start()
+    start = time.perf_counter()
+    chunks = fn(path)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<10} {chunks:>7} chunks  {elapsed:7.2f}s  peak {peak / 2**20:8.1f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, nargs="+", default=[200, 800])
+    args = parser.parse_args()
+
+    ingestion.embed_chunks = fake_embed_chunks
+    for pages in args.pages:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "synthetic.pdf")
+            write_synthetic_pdf(path, pages)
+            print(f"\n{pages} pages, {os.path.getsize(path) / 2**20:.1f} MiB PDF")
+            measure("legacy", legacy_ingest, path)
+            measure("streaming", streaming_ingest, path)
+
+
+if __name__ == "__main__":
+    main()
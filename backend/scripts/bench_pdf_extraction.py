@@ -0,0 +1,55 @@
+"""
+Benchmark: serial vs. process-pool PDF text extraction (app/services/pdf_extract.py)
+on a synthetic PDF. Checks that both return identical pages in the same order.
+
+Usage:
+    python scripts/bench_pdf_extraction.py --pages 800 --processes 1 2 4
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+# Add the parent directory to sys.path
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from bench_ingestion_memory import write_synthetic_pdf  # noqa: E402
+
+from app.services import pdf_extract  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=800)
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "synthetic.pdf")
+        write_synthetic_pdf(path, args.pages)
+        print(f"{args.pages} pages, {os.path.getsize(path) / 2**20:.1f} MiB PDF, {os.cpu_count()} CPU(s)")
+
+        pdf_extract.settings.PDF_PARALLEL_MIN_BYTES = 0
+        baseline, reference = None, None
+        for processes in args.processes:
+            pdf_extract.shutdown_pool()
+            pdf_extract.settings.PDF_EXTRACT_PROCESSES = processes
+            if processes > 1:
+                list(pdf_extract.iter_pages(path))  # warm up: spawn the workers outside the timing
+            start = time.perf_counter()
+            pages = list(pdf_extract.iter_pages(path))
+            elapsed = time.perf_counter() - start
+
+            if reference is None:
+                baseline, reference = elapsed, pages
+            print(
+                f"processes={processes:<3} {elapsed:7.2f}s  speedup x{baseline / elapsed:4.2f}  "
+                f"identical={pages == reference}"
+            )
+        pdf_extract.shutdown_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Export a Knowledge Base to a portable archive, or import one (no re-embedding).
+Same format and code path as GET /admin/knowledge_bases/{id}/export and
+POST /admin/knowledge_bases/import; see app/services/kb_archive.py.
+
+Usage:
+    python scripts/kb_archive.py export 3 kb-3.tar [--float32]
+    python scripts/kb_archive.py import kb-3.tar --user-id 1 [--name "Fees (restored)"] [--defer-global-index]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+# Add the parent directory to sys.path
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from sqlmodel import Session  # noqa: E402
+
+from app.database import engine  # noqa: E402
+from app.models import KnowledgeBase  # noqa: E402
+from app.services import kb_archive  # noqa: E402
+
+
+def export(kb_id: int, path: str, dtype: str) -> None:
+    start = time.perf_counter()
+    with open(path, "wb") as out:
+        for block in kb_archive.export_kb(kb_id, dtype):
+            out.write(block)
+    size = os.path.getsize(path) / 2**20
+    print(f"📦 KB {kb_id} -> {path} ({size:.1f} MiB, {time.perf_counter() - start:.1f}s)")
+
+
+def import_(path: str, user_id: int, name: str | None, defer_global_index: bool) -> None:
+    manifest = kb_archive.read_manifest(path)
+    with Session(engine) as session:
+        kb = KnowledgeBase(
+            name=name or manifest["knowledge_base"]["name"], description=manifest["knowledge_base"].get("description")
+        )
+        session.add(kb)
+        session.commit()
+        session.refresh(kb)
+        kb_id = kb.id
+
+    start = time.perf_counter()
+    chunks = kb_archive.import_kb(path, kb_id, user_id, defer_global_index)
+    print(
+        f"✅ {path} -> KB {kb_id}: {manifest['documents']} documents, {chunks} chunks ({time.perf_counter() - start:.1f}s)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Knowledge Base export/import")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export")
+    export_parser.add_argument("kb_id", type=int)
+    export_parser.add_argument("path")
+    export_parser.add_argument("--float32", action="store_true", help="full-precision vectors (2x larger)")
+    import_parser = commands.add_parser("import")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--user-id", type=int, required=True, help="owner of the imported documents")
+    import_parser.add_argument("--name", help="KB name (default: the exported KB's name)")
+    import_parser.add_argument(
+        "--defer-global-index", action="store_true", help="drop the global HNSW index during the load and rebuild it"
+    )
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export(args.kb_id, args.path, "float32" if args.float32 else "float16")
+    else:
+        import_(args.path, args.user_id, args.name, args.defer_global_index)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Migration: quantized embedding storage (EMBEDDING_QUANTIZATION).
+
+1. Adds document_chunks.embedding_half / embedding_bin and the trigger that keeps
+   them in sync with `embedding` (kb_indexes.QUANTIZE_TRIGGER_SQL; the API
+   drops the trigger again if it starts with EMBEDDING_QUANTIZATION=none).
+2. Backfills existing rows in id-range batches (one short transaction each).
+3. Builds the HNSW index for the chosen mode CONCURRENTLY, plus the per-KB
+   partial indexes of large KBs.
+4. Optionally drops the full-precision HNSW indexes once the new ones exist.
+5. Optionally measures top-5 recall of quantized search vs. exact search.
+
+Set EMBEDDING_QUANTIZATION=<mode> in the environment before (or right after)
+running it, so kb_indexes and the retrieval path use the same mode.
+
+Usage:
+    python scripts/migrate_quantized_embeddings.py --mode halfvec
+    python scripts/migrate_quantized_embeddings.py --mode binary --drop-full-index --check-recall 200
+"""
+
+import argparse
+import os
+import sys
+import time
+
+# Add the parent directory to sys.path
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from sqlalchemy import text  # noqa: E402
+from sqlmodel import Session, select  # noqa: E402
+
+from app.config import settings  # noqa: E402
+from app.database import engine  # noqa: E402
+from app.models import DocumentChunk, KnowledgeBase  # noqa: E402
+from app.services import kb_indexes, rag  # noqa: E402
+
+SCHEMA_SQL = """
+ALTER TABLE document_chunks ADD COLUMN IF NOT EXISTS embedding_half halfvec(1024);
+ALTER TABLE document_chunks ADD COLUMN IF NOT EXISTS embedding_bin bit(1024);
+"""
+
+BACKFILL_SQL = text(
+    """
+    UPDATE document_chunks
+    SET embedding_half = embedding::halfvec(1024),
+        embedding_bin = binary_quantize(embedding)::bit(1024)
+    WHERE id > :start AND id <= :end
+      AND embedding IS NOT NULL
+      AND (embedding_half IS NULL OR embedding_bin IS NULL)
+    """
+)
+
+
+def index_size(connection, name: str) -> str:
+    size = connection.execute(
+        text("SELECT pg_size_pretty(pg_relation_size(to_regclass(:name)))"), {"name": name}
+    ).scalar()
+    return size or "-"
+
+
+def ensure_schema() -> None:
+    with engine.begin() as connection:
+        version = connection.execute(text("SELECT extversion FROM pg_extension WHERE extname = 'vector'")).scalar()
+        if tuple(int(part) for part in (version or "0").split(".")) < (0, 7):
+            print(f"❌ pgvector {version} has no halfvec/binary_quantize (needs >= 0.7)")
+            sys.exit(1)
+        connection.execute(text(SCHEMA_SQL))
+        connection.execute(text(kb_indexes.QUANTIZE_TRIGGER_SQL))
+    print("✅ Columns and trigger in place")
+
+
+def backfill(batch_size: int) -> None:
+    with engine.connect() as connection:
+        max_id = connection.execute(text("SELECT coalesce(max(id), 0) FROM document_chunks")).scalar()
+
+    updated = 0
+    start = time.perf_counter()
+    for low in range(0, max_id, batch_size):
+        with engine.begin() as connection:
+            updated += connection.execute(BACKFILL_SQL, {"start": low, "end": low + batch_size}).rowcount
+        print(f"   ... up to id {min(low + batch_size, max_id)}/{max_id} ({updated} rows)", end="\r")
+    print(f"\n✅ Backfilled {updated} rows in {time.perf_counter() - start:.1f}s")
+
+
+def build_indexes(mode: str) -> None:
+    prefix, column, opclass = kb_indexes.QUANTIZED_INDEXES[mode]
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        start = time.perf_counter()
+        connection.execute(
+            text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {prefix} ON document_chunks USING hnsw ({column} {opclass})")
+        )
+        print(f"✅ {prefix} built in {time.perf_counter() - start:.1f}s ({index_size(connection, prefix)})")
+
+    # Partial per-KB indexes follow settings.EMBEDDING_QUANTIZATION
+    settings.EMBEDDING_QUANTIZATION = mode
+    with Session(engine) as session:
+        kb_ids = session.exec(select(KnowledgeBase.id)).all()
+    for kb_id in kb_ids:
+        kb_indexes.sync_kb_hnsw_index(kb_id)
+
+
+def drop_other_indexes(mode: str) -> None:
+    """Drop the global and per-KB HNSW indexes of every other mode (incl. full precision)."""
+    with Session(engine) as session:
+        kb_ids = session.exec(select(KnowledgeBase.id)).all()
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        for other, (prefix, _, _) in kb_indexes.QUANTIZED_INDEXES.items():
+            if other == mode:
+                continue
+            print(f"🗑️  Dropping {prefix} ({index_size(connection, prefix)})")
+            connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {prefix}"))
+            for kb_id in kb_ids:
+                connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {kb_indexes.kb_index_name(kb_id, other)}"))
+
+
+def check_recall(mode: str, samples: int, k: int = 5) -> None:
+    """Use random stored chunk embeddings as queries; compare quantized top-k with exact top-k in their KB."""
+    with Session(engine) as session:
+        queries = session.exec(
+            select(DocumentChunk.embedding, DocumentChunk.knowledge_base_id)
+            .where(DocumentChunk.embedding.is_not(None), DocumentChunk.knowledge_base_id.is_not(None))
+            .order_by(text("random()"))
+            .limit(samples)
+        ).all()
+
+        hits = 0
+        for embedding, kb_id in queries:
+            query = [float(x) for x in embedding]
+            settings.EMBEDDING_QUANTIZATION = "none"
+            exact = rag.nearest_chunks(query, [kb_id], k, exact=True)
+            expected = set(session.exec(select(exact.c.id)).all())
+
+            settings.EMBEDDING_QUANTIZATION = mode
+            rag.configure_hnsw_scan(session, k * settings.QUANTIZED_SEARCH_OVERSAMPLE)
+            approx = rag.nearest_chunks(query, [kb_id], k)
+            hits += len(expected & set(session.exec(select(approx.c.id)).all()))
+            session.rollback()  # reset the transaction-local HNSW settings
+
+    total = len(queries) * k
+    print(f"📊 top-{k} recall ({mode}, oversample {settings.QUANTIZED_SEARCH_OVERSAMPLE}): {hits / max(total, 1):.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantized embedding storage migration")
+    parser.add_argument("--mode", choices=["halfvec", "binary"], required=True)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--drop-full-index", action="store_true", help="drop HNSW indexes of the other modes")
+    parser.add_argument("--check-recall", type=int, default=0, metavar="N", help="sample N queries for recall@5")
+    args = parser.parse_args()
+
+    print(f"🔗 Migrating document_chunks to {args.mode} ANN search...")
+    ensure_schema()
+    backfill(args.batch_size)
+    build_indexes(args.mode)
+    if args.drop_full_index:
+        drop_other_indexes(args.mode)
+    if args.check_recall:
+        check_recall(args.mode, args.check_recall)
+    print(f"Done. Set EMBEDDING_QUANTIZATION={args.mode} for the API.")
+
+
+if __name__ == "__main__":
+    main()
@@ -175,19 +175,31 @@ export default function ChatPage() {
             let aiMsg = { id: typingId, text: '', sender: 'ai', timestamp: new Date(), status: 'Starting...', steps: [] };
             setMessages(prev => [...prev, aiMsg]);
 
+            let pending = '';  // an NDJSON line can arrive split across reads
+
             while (true) {
                 const { done, value } = await reader.read();
                 if (done) break;
 
-                const chunk = decoder.decode(value, { stream: true });
-                const lines = chunk.split('\n');
+                pending += decoder.decode(value, { stream: true });
+                const lines = pending.split('\n');
+                pending = lines.pop();
 
                 for (const line of lines) {
                     if (!line.trim()) continue;
                     try {
                         const data = JSON.parse(line);
 
-                        if (data.type === 'status') {
+                        if (data.type === 'delta') {
+                            // Final answer tokens as they are generated; replaced by the full answer at the end
+                            setMessages(prev => prev.map(msg =>
+                                msg.id === typingId ? { ...msg, text: msg.text + data.content, status: null } : msg
+                            ));
+                        } else if (data.type === 'delta_reset') {
+                            setMessages(prev => prev.map(msg =>
+                                msg.id === typingId ? { ...msg, text: '' } : msg
+                            ));
+                        } else if (data.type === 'status') {
                             setMessages(prev => prev.map(msg => {
                                 if (msg.id === typingId) {
                                     const newSteps = [...(msg.steps || []), data.content];